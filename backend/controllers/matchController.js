@@ -3,11 +3,11 @@ const Match = require('../models/Match');
 const Tournament = require('../models/Tournament');
 const Team = require('../models/Team');
 const DroneLog = require('../models/DroneLog');
-const axios = require('axios');
 const { updateStandings } = require('./leaderboardController');
 const DroneTelemetry = require('../models/DroneTelemetry');
 const DroneReport = require('../models/DroneReport');  // ✅ Individual reports
 const mqttService = require('../services/mqttService');  // ✅ MQTT for ESP32
+const mlService = require('../services/mlService');  // ✅ ML stability analysis (queued jobs)
 const { spawn } = require('child_process');  // ✅ For ESP simulator subprocess
 const path = require('path');
 const { generateSummary, generateRecommendations } = require('../utils/reportTemplates');  // ✅ Report templates
@@ -916,33 +916,20 @@ const endRound = async (req, res) => {
           };
         } else {
           try {
-            const mlResponse = await axios.post(
-              'http://localhost:5001/analyze-stability',
-              {
-                matchId: matchId,
-                roundNumber: roundNumber,
-                telemetry: allLogs
-              },
-              {
-                timeout: 10000,
-                headers: {
-                  'Content-Type': 'application/json'
-                }
-              }
-            );
+            const mlResult = await mlService.analyzeRound(matchId, roundNumber, allLogs);
             
             console.log('✅ ML Analysis received!');
-            console.log(`   - Stability Score: ${mlResponse.data.stabilityScore || 0}`);
-            console.log(`   - Bonus Points: ${mlResponse.data.bonusPoints || 0}`);
+            console.log(`   - Stability Score: ${mlResult.stabilityScore || 0}`);
+            console.log(`   - Bonus Points: ${mlResult.bonusPoints || 0}`);
             
             activeRound.mlAnalysis = {
-              stabilityScore: mlResponse.data.stabilityScore || 0,
-              bonusPoints: mlResponse.data.bonusPoints || 0,
-              flightQuality: mlResponse.data.flightQuality || 'good',
-              details: mlResponse.data.details || {}
+              stabilityScore: mlResult.stabilityScore || 0,
+              bonusPoints: mlResult.bonusPoints || 0,
+              flightQuality: mlResult.flightQuality || 'good',
+              details: mlResult.details || {}
             };
             
-            const bonusPoints = mlResponse.data.bonusPoints || 0;
+            const bonusPoints = mlResult.bonusPoints || 0;
             if (bonusPoints > 0) {
               if (activeRound.teamAScore > activeRound.teamBScore) {
                 activeRound.teamAScore += bonusPoints;
@@ -965,7 +952,7 @@ const endRound = async (req, res) => {
           } catch (mlError) {
             console.error('❌ ML Service Error:', mlError.message);
             if (mlError.code === 'ECONNREFUSED') {
-              console.log('⚠️  ML service not running on localhost:5001');
+              console.log('⚠️  ML service not running (ML_SERVICE_URL / ML_SERVICE_SOCKET)');
             }
             activeRound.mlAnalysis = {
               error: 'ML service unavailable',
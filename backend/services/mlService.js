@@ -2,13 +2,20 @@
 const axios = require('axios');
 
 const ML_SERVICE_URL = process.env.ML_SERVICE_URL || 'http://localhost:5001';
+// Unix domain socket of an ML service on the same machine (its ML_SERVICE_SOCKET);
+// when set, every request goes through it instead of ML_SERVICE_URL
+const ML_SERVICE_SOCKET = process.env.ML_SERVICE_SOCKET || '';
+
+const client = axios.create(ML_SERVICE_SOCKET
+  ? { socketPath: ML_SERVICE_SOCKET, baseURL: 'http://localhost' }
+  : { baseURL: ML_SERVICE_URL });
 
 class MLService {
   
   // Health check
   async healthCheck() {
     try {
-      const response = await axios.get(`${ML_SERVICE_URL}/health`);
+      const response = await client.get('/health');
       return response.data;
     } catch (error) {
       console.error('❌ ML Service health check failed:', error.message);
@@ -19,7 +26,7 @@ class MLService {
   // Analyze single team's drones
   async analyzeTeamStability(matchId, teamId, roundNo, drones) {
     try {
-      const response = await axios.post(`${ML_SERVICE_URL}/analyze`, {
+      const response = await client.post('/analyze', {
         match_id: matchId,
         team_id: teamId,
         round_no: roundNo,
@@ -39,7 +46,7 @@ class MLService {
   // Analyze both teams at once
   async analyzeBothTeams(matchId, teamAData, teamBData) {
     try {
-      const response = await axios.post(`${ML_SERVICE_URL}/batch-analyze`, {
+      const response = await client.post('/batch-analyze', {
         match_id: matchId,
         teams: [teamAData, teamBData]
       }, {
@@ -53,6 +60,65 @@ class MLService {
       throw new Error(`Batch ML Analysis failed: ${error.message}`);
     }
   }
+
+  // Analyze a finished round's telemetry through the job queue, so a burst of
+  // round ends waits in line instead of timing out
+  async analyzeRound(matchId, roundNumber, telemetry) {
+    return this.runJob('analyze-stability', {
+      matchId: matchId,
+      roundNumber: roundNumber,
+      telemetry: telemetry
+    }, { deadlineMs: 60 * 1000 });
+  }
+
+  // Queue an analysis as a background job ('analyze-stability', 'batch-analyze' or 'analyze')
+  // and long-poll until it finishes; a full queue is retried after the service's Retry-After
+  async runJob(kind, payload, { deadlineMs = 10 * 60 * 1000, waitSeconds = 25 } = {}) {
+    const deadline = Date.now() + deadlineMs;
+    let job;
+
+    while (!job) {
+      try {
+        const response = await client.post(`/jobs/${kind}`, payload, { timeout: 30000 });
+        job = response.data;
+      } catch (error) {
+        const retryAfter = error.response && error.response.status === 429
+          ? Number(error.response.headers['retry-after'] || 1)
+          : null;
+        if (retryAfter === null || Date.now() + retryAfter * 1000 > deadline) {
+          console.error(`❌ ML job submit failed (${kind}):`, error.message);
+          throw Object.assign(new Error(`ML job submit failed: ${error.message}`), { code: error.code });
+        }
+        console.log(`⏳ ML job queue full, retrying ${kind} in ${retryAfter}s`);
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+      }
+    }
+
+    try {
+      while (!['done', 'failed', 'cancelled'].includes(job.status)) {
+        if (Date.now() > deadline) {
+          await client.delete(`/jobs/${job.jobId}`).catch(() => {});
+          throw new Error(`job ${job.jobId} did not finish in time`);
+        }
+        const response = await client.get(`/jobs/${job.jobId}`, {
+          params: { wait: waitSeconds },
+          timeout: (waitSeconds + 10) * 1000
+        });
+        job = response.data;
+      }
+    } catch (error) {
+      console.error(`❌ ML job failed (${kind}):`, error.message);
+      throw Object.assign(new Error(`ML job failed: ${error.message}`), { code: error.code });
+    }
+
+    if (job.status !== 'done') {
+      throw new Error(`ML job ${job.status}: ${job.error || 'cancelled'}`);
+    }
+    if (job.resultStatus >= 400) {
+      throw new Error(`ML job rejected (${job.resultStatus}): ${(job.result && job.result.message) || 'analysis error'}`);
+    }
+    return job.result;
+  }
 }
 
 module.exports = new MLService();
\ No newline at end of file
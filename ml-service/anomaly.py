@@ -0,0 +1,318 @@
+# ml-service/anomaly.py
+"""
+Learned anomaly scorer (optional alternative to the penalty formula)
+A Gaussian model of the stability features of stored rounds: feature
+vectors are whitened with the training mean and covariance, and a round's
+squared Mahalanobis distance says how unusual it is. The distance is
+turned into a 0-100 score through calibration points taken from the
+training distances, lined up with the classification bands: a round as
+typical as the training median scores 90, the 90th percentile 70, the
+99th percentile 50, and the score reaches 0 at four times the 99th
+percentile distance. All drones of an analysis are scored with one
+matrix product
+
+Model file layout (all integers little-endian):
+    0   4 bytes  magic b'DRNM'
+    4   u8       version (1)
+    5   u8       reserved
+    6   u16      feature count K
+    8   u32      header length H
+    12  H bytes  UTF-8 JSON header: {"features": [...], "rounds": n,
+                 "oscillationMethod": ..., "created": ..., "source": ...}
+    then zero padding up to a multiple of 8 bytes and float64 arrays:
+    mean (K), whitening matrix (K x K), training distance quantiles (101),
+    calibration distances (5), calibration scores (5)
+
+CLI (from ml-service/):
+    python anomaly.py train exports/ --output models/anomaly.drnm
+    python anomaly.py show models/anomaly.drnm
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from scoring import OSCILLATION_METHOD, classify
+from telemetry import ATTITUDE_AXES, AXES, POSITION_AXES, AnalysisOptionError
+
+# Scorer of analyzed drones: the penalty formula, or the learned model read
+# from ML_ANOMALY_MODEL
+SCORERS = ('formula', 'model')
+SCORER = os.environ.get('ML_SCORER', 'formula')
+ANOMALY_MODEL = os.environ.get('ML_ANOMALY_MODEL', '')
+
+MAGIC = b'DRNM'
+VERSION = 1
+
+FEATURES = (tuple(f'log_{axis}_variance' for axis in AXES) +
+            tuple(f'{axis}_spike_rate' for axis in POSITION_AXES) +
+            ('oscillating_axes',) +
+            tuple(f'log_{axis}_jerk' for axis in POSITION_AXES))
+
+# Training distance percentiles and the scores they map to
+CALIBRATION_PERCENTILES = (0, 50, 90, 99)
+CALIBRATION_SCORES = (100.0, 90.0, 70.0, 50.0, 0.0)
+# The score reaches 0 at this multiple of the 99th percentile distance
+ZERO_SCORE_FACTOR = 4.0
+# Fewest rounds a model is trained from
+MIN_TRAINING_ROUNDS = 30
+# Features named in each result, largest contribution first
+TOP_FEATURES = 3
+
+_PREFIX = struct.Struct('<4sBBHI')
+
+
+class AnomalyModelError(ValueError):
+    """Raised when a model cannot be trained or its file cannot be read"""
+
+
+def _padded(length):
+    return (length + 7) & ~7
+
+
+def feature_vector(result):
+    """The model's feature vector of one scored drone result"""
+    variance = result['variance_data']
+    points = max(result['data_points'], 1)
+    oscillation = result['oscillation']
+    jerk = result['moments']['jerk']
+    return ([np.log1p(variance[f'{axis}_variance']) for axis in AXES] +
+            [result['spike_counts'][axis] / points for axis in POSITION_AXES] +
+            [sum(bool(oscillation[axis]['oscillating']) for axis in ATTITUDE_AXES)] +
+            [np.log1p(jerk[axis]) for axis in POSITION_AXES])
+
+
+def feature_matrix(results):
+    """(drones, features) matrix of scored drone results"""
+    return np.array([feature_vector(result) for result in results], dtype=np.float64).reshape(-1, len(FEATURES))
+
+
+class AnomalyModel:
+    """Mean, whitening matrix and calibration of a trained model; arrays may be views on a mapped file"""
+
+    def __init__(self, header, mean, whiten, quantiles, calibration_distance, calibration_score):
+        self.header = header
+        self.mean = mean
+        self.whiten = whiten
+        self.quantiles = quantiles
+        self.calibration_distance = calibration_distance
+        self.calibration_score = calibration_score
+
+    @classmethod
+    def fit(cls, matrix, **info):
+        """Train from a (rounds, features) matrix"""
+        rounds, count = matrix.shape
+        if rounds < MIN_TRAINING_ROUNDS:
+            raise AnomalyModelError(f'{rounds} rounds are too few to train from (at least {MIN_TRAINING_ROUNDS})')
+        mean = matrix.mean(axis=0)
+        covariance = np.cov(matrix, rowvar=False)
+        # A little ridge keeps constant or collinear features invertible
+        covariance += np.eye(count) * max(np.trace(covariance) / count, 1.0) * 1e-6
+        whiten = np.linalg.inv(np.linalg.cholesky(covariance)).T
+
+        model = cls({}, mean, whiten, np.zeros(101), np.zeros(5), np.array(CALIBRATION_SCORES))
+        distances = model.distances(matrix)
+        model.quantiles = np.percentile(distances, np.arange(101))
+        anchors = np.percentile(distances, CALIBRATION_PERCENTILES)
+        model.calibration_distance = np.append(anchors, anchors[-1] * ZERO_SCORE_FACTOR)
+        model.header = {
+            'features': list(FEATURES),
+            'rounds': rounds,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            **info
+        }
+        return model
+
+    def contributions(self, matrix):
+        """Per-feature squared whitened deviations (drones, features)"""
+        whitened = (matrix - self.mean) @ self.whiten
+        return whitened * whitened
+
+    def distances(self, matrix):
+        """Squared Mahalanobis distance of every row"""
+        return self.contributions(matrix).sum(axis=1)
+
+    def score(self, matrix):
+        """(scores 0-100, distances, training percentiles, contributions) of every row, in one pass"""
+        contributions = self.contributions(matrix)
+        distances = contributions.sum(axis=1)
+        scores = np.interp(distances, self.calibration_distance, self.calibration_score)
+        percentiles = np.interp(distances, self.quantiles, np.arange(101.0))
+        return scores, distances, percentiles, contributions
+
+    def to_bytes(self):
+        header = json.dumps(self.header).encode('utf-8')
+        prefix = _PREFIX.pack(MAGIC, VERSION, 0, len(FEATURES), len(header))
+        padding = b'\0' * (_padded(len(prefix) + len(header)) - len(prefix) - len(header))
+        arrays = [self.mean, self.whiten, self.quantiles, self.calibration_distance, self.calibration_score]
+        return prefix + header + padding + b''.join(np.asarray(a, dtype='<f8').tobytes() for a in arrays)
+
+    def save(self, path):
+        with open(path, 'wb') as out:
+            out.write(self.to_bytes())
+
+    @classmethod
+    def from_buffer(cls, body):
+        """Model over a buffer (bytes or np.memmap); the arrays are views, not copies"""
+        if len(body) < _PREFIX.size:
+            raise AnomalyModelError('model file shorter than header prefix')
+        magic, version, _, count, header_len = _PREFIX.unpack_from(body, 0)
+        if magic != MAGIC:
+            raise AnomalyModelError('bad magic')
+        if version != VERSION:
+            raise AnomalyModelError(f'unsupported version {version}')
+        try:
+            header = json.loads(bytes(body[_PREFIX.size:_PREFIX.size + header_len]).decode('utf-8'))
+        except ValueError as e:
+            raise AnomalyModelError(f'bad header: {e}')
+        if tuple(header.get('features', ())) != FEATURES or count != len(FEATURES):
+            raise AnomalyModelError('model was trained on different features')
+
+        sizes = (count, count * count, 101, 5, 5)
+        offset = _padded(_PREFIX.size + header_len)
+        if len(body) < offset + 8 * sum(sizes):
+            raise AnomalyModelError('truncated model file')
+        arrays = []
+        for size in sizes:
+            arrays.append(np.frombuffer(body, dtype='<f8', count=size, offset=offset))
+            offset += 8 * size
+        mean, whiten, quantiles, calibration_distance, calibration_score = arrays
+        return cls(header, mean, whiten.reshape(count, count), quantiles, calibration_distance, calibration_score)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a model file"""
+        try:
+            buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        except ValueError as e:
+            # An empty file cannot be mapped
+            raise AnomalyModelError(f'cannot map model file: {e}') from e
+        return cls.from_buffer(buffer)
+
+    def info(self):
+        return {key: self.header.get(key) for key in ('rounds', 'created', 'oscillationMethod', 'source')}
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def default_model():
+    """The ML_ANOMALY_MODEL model, mapped on first use (None when unset)"""
+    global _model
+    if _model is None and ANOMALY_MODEL:
+        with _model_lock:
+            if _model is None:
+                _model = AnomalyModel.load(ANOMALY_MODEL)
+    return _model
+
+
+def model_mtime():
+    """Modification time of the ML_ANOMALY_MODEL file (0 when unset or unreadable)"""
+    try:
+        return int(os.path.getmtime(ANOMALY_MODEL)) if ANOMALY_MODEL else 0
+    except OSError:
+        return 0
+
+
+def loaded_model_info():
+    """Header summary of the mapped model (None when none is loaded)"""
+    return _model.info() if _model is not None else None
+
+
+def validate_scorer(scorer=None, oscillation_method=None):
+    """The model to score with (None for the formula), defaulted; raises AnalysisOptionError
+
+    The model's oscillating-axes feature only means something under the
+    oscillation method it was trained with, so any other method is refused.
+    A model file that cannot be read is refused too
+    """
+    scorer = SCORER if scorer is None else scorer
+    if scorer not in SCORERS:
+        raise AnalysisOptionError(f'Unknown scorer: {scorer}')
+    if scorer == 'formula':
+        return None
+    try:
+        model = default_model()
+    except (OSError, AnomalyModelError) as e:
+        raise AnalysisOptionError(f'anomaly model unavailable: {e}') from e
+    if model is None:
+        raise AnalysisOptionError('scorer=model needs a trained model (ML_ANOMALY_MODEL)')
+    trained = model.header.get('oscillationMethod')
+    oscillation_method = oscillation_method or OSCILLATION_METHOD
+    if trained is not None and trained != oscillation_method:
+        raise AnalysisOptionError(f'the anomaly model was trained with oscillationMethod={trained}; '
+                                  f'scorer=model cannot score {oscillation_method} results')
+    return model
+
+
+def score_results(results, model):
+    """Rescore scored drone results with the model, all in one pass
+
+    Each result keeps the formula's score as formula_score and gets an
+    'anomaly' block; stability_score and classification come from the model
+    """
+    if not results:
+        return
+    scores, distances, percentiles, contributions = model.score(feature_matrix(results))
+    top = np.argsort(-contributions, axis=1)[:, :TOP_FEATURES]
+    for result, score, distance, percentile, share, order in zip(results, scores, distances, percentiles,
+                                                                 contributions, top):
+        result['formula_score'] = result['stability_score']
+        result['stability_score'] = round(float(score), 2)
+        result['classification'] = classify(result['stability_score'])
+        result['anomaly'] = {
+            'scorer': 'model',
+            'distance': round(float(distance), 4),
+            'training_percentile': round(float(percentile), 1),
+            'top_features': [{'feature': FEATURES[i], 'contribution': round(float(share[i]), 4)} for i in order]
+        }
+
+
+def train(path, match_id=None, round_number=None, drone_id=None, oscillation_method=None):
+    """Model trained on every analyzable drone round under path (ingest sources)"""
+    from ingest import analyze_path
+
+    results = [result for _, result in analyze_path(path, match_id, round_number, drone_id,
+                                                    oscillation_method=oscillation_method, scorer='formula')
+               if 'moments' in result]
+    return AnomalyModel.fit(feature_matrix(results), source=os.path.basename(os.path.normpath(path)),
+                            oscillationMethod=oscillation_method or OSCILLATION_METHOD)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train or inspect the learned anomaly scorer')
+    commands = parser.add_subparsers(dest='command', required=True)
+    fit = commands.add_parser('train', help='train from stored telemetry (NDJSON / columnar, see ingest.py)')
+    fit.add_argument('path', help='telemetry file or directory')
+    fit.add_argument('--output', required=True, help='model file to write')
+    fit.add_argument('--match', help='only this matchId')
+    fit.add_argument('--round', help='only this roundNumber')
+    fit.add_argument('--drone', help='only this droneId')
+    fit.add_argument('--oscillation-method', help='spectral or sign_change (as the service will use)')
+    show = commands.add_parser('show', help='print a model file header')
+    show.add_argument('model')
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        model = AnomalyModel.load(args.model)
+        print(json.dumps({**model.header, 'calibration': dict(zip(
+            [f'p{p}' for p in CALIBRATION_PERCENTILES] + ['zero'],
+            np.round(model.calibration_distance, 4).tolist()))}, indent=2))
+        return 0
+
+    model = train(args.path, args.match, args.round, args.drone, args.oscillation_method)
+    model.save(args.output)
+    print(f"Trained on {model.header['rounds']} drone rounds; wrote {args.output} "
+          f"({os.path.getsize(args.output)} bytes)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,248 +1,297 @@
 # ml-service/app.py
-from flask import Flask, request, jsonify
+import startup
+
+from flask import Flask, Response, g, has_request_context, request, jsonify
 from flask_cors import CORS
-import numpy as np
-from scipy import stats
-import json
+from functools import wraps
+from werkzeug.exceptions import HTTPException
+import logging
+import os
+import sqlite3
+import time
+
+import anomaly
+import columnar
+import ingest
+import jobs
+import metrics
+import profiling
+import proximity
+import responses
+import transport
+from anomaly import ANOMALY_MODEL, SCORER
+from responses import file_result, stability_response, summaries
+from result_cache import ResultCache
+from streaming import StreamRegistry
+from summary_store import FILTERS
+from stability import (OSCILLATION_METHOD, AnalysisOptionError, TelemetryFrame, analyze_drone, analyze_frames, calculate_bonus_points,
+                       clean_frame, drone_frame, scoring_fingerprint, team_summary)
+
+logging.basicConfig(
+    level=os.environ.get('ML_LOG_LEVEL', 'info').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger('ml-service')
 
 app = Flask(__name__)
 CORS(app)
+# gzip / deflate request bodies are decoded while Flask reads them
+app.wsgi_app = transport.DecodingMiddleware(app.wsgi_app)
 
-def calculate_variance(data):
-    """Calculate variance for each axis"""
-    if len(data) < 2:
-        return {
-            'x_variance': 0,
-            'y_variance': 0,
-            'z_variance': 0,
-            'pitch_variance': 0,
-            'roll_variance': 0,
-            'yaw_variance': 0
-        }
-    
-    x_values = [point['x'] for point in data]
-    y_values = [point['y'] for point in data]
-    z_values = [point['z'] for point in data]
-    pitch_values = [point['pitch'] for point in data]
-    roll_values = [point['roll'] for point in data]
-    yaw_values = [point['yaw'] for point in data]
-    
-    return {
-        'x_variance': float(np.var(x_values)),
-        'y_variance': float(np.var(y_values)),
-        'z_variance': float(np.var(z_values)),
-        'pitch_variance': float(np.var(pitch_values)),
-        'roll_variance': float(np.var(roll_values)),
-        'yaw_variance': float(np.var(yaw_values))
-    }
+streams = StreamRegistry()
+results_cache = ResultCache(
+    maxsize=int(os.environ.get('ML_CACHE_SIZE', 512)),
+    ttl=float(os.environ.get('ML_CACHE_TTL', 3600)),
+    fingerprint=scoring_fingerprint()
+)
 
+# Background analysis jobs; their worker threads start on first submit
+job_queue = jobs.JobQueue()
 
-def detect_spikes(data, axis, threshold=2.0):
-    """Detect sudden spikes in data using z-score"""
-    if len(data) < 3:
-        return []
-    
-    values = [point[axis] for point in data]
-    z_scores = np.abs(stats.zscore(values))
-    
-    spike_indices = np.where(z_scores > threshold)[0]
-    return spike_indices.tolist()
+# cProfile of chosen requests (X-Profile header or 1-in-N); off without ML_PROFILE_DIR
+profiler = profiling.Profiler()
 
+# Learned anomaly scorer (?scorer=model); mapped once here so preloaded workers share it
+if ANOMALY_MODEL:
+    try:
+        logger.info(f"✅ Anomaly model loaded from {ANOMALY_MODEL} "
+                    f"({anomaly.default_model().header['rounds']} training rounds)")
+        trained_method = anomaly.default_model().header.get('oscillationMethod')
+        if trained_method not in (None, OSCILLATION_METHOD):
+            logger.warning(f"⚠️  Anomaly model was trained with {trained_method} oscillation, the service "
+                           f"defaults to {OSCILLATION_METHOD}; scorer=model requests need "
+                           f"oscillationMethod={trained_method}")
+    except (OSError, anomaly.AnomalyModelError) as e:
+        logger.error(f"❌ Could not load anomaly model {ANOMALY_MODEL}: {e}")
 
-def detect_oscillations(data, axis):
-    """Detect oscillation patterns using frequency analysis"""
-    if len(data) < 10:
-        return False
-    
-    values = [point[axis] for point in data]
-    
-    # Calculate consecutive differences
-    diffs = np.diff(values)
-    
-    # Count sign changes (oscillation indicator)
-    sign_changes = np.sum(np.diff(np.sign(diffs)) != 0)
-    
-    # If more than 40% of points show sign changes, it's oscillating
-    oscillation_ratio = sign_changes / len(diffs)
-    
-    return oscillation_ratio > 0.4
+startup_clock = startup.StartupClock(
+    budget=float(os.environ['ML_STARTUP_BUDGET']) if os.environ.get('ML_STARTUP_BUDGET') else None
+)
+startup_clock.mark_imported()
 
-def calculate_smoothness(data, axis):
-    """Calculate trajectory smoothness (jerk - rate of change of acceleration)"""
-    if len(data) < 4:
-        return 100.0
-    
-    values = [point[axis] for point in data]
-    
-    # Calculate jerk (third derivative)
-    velocity = np.diff(values)
-    acceleration = np.diff(velocity)
-    jerk = np.diff(acceleration)
-    
-    # Lower jerk = smoother trajectory
-    avg_jerk = np.mean(np.abs(jerk))
-    
-    # Normalize to 0-100 scale (lower jerk = higher score)
-    smoothness_score = max(0, 100 - (avg_jerk * 10))
-    
-    return float(smoothness_score)
+ANALYSIS_ENDPOINTS = {'analyze_stability', 'batch_analyze', 'analyze_team'}
+# /jobs/<kind> -> the synchronous endpoint the job replays
+JOB_KINDS = {'analyze-stability': 'analyze_stability', 'batch-analyze': 'batch_analyze', 'analyze': 'analyze_team',
+             'analyze-file': 'analyze_file'}
 
-def analyze_drone(drone_data):
-    """Analyze single drone's stability"""
-    
-    logs = drone_data.get('logs', [])
-    drone_id = drone_data.get('drone_id', 'unknown')
-    
-    if len(logs) < 10:
-        return {
-            'drone_id': drone_id,
-            'stability_score': 0,
-            'classification': 'Insufficient Data',
-            'issues_detected': ['Not enough data points'],
-            'variance_data': {},
-            'data_points': len(logs)
-        }
-    
-    # Calculate variance
-    variance_data = calculate_variance(logs)
-    
-    # Detect issues
-    issues = []
-    
-    # Check for high variance
-    if variance_data['yaw_variance'] > 0.5:
-        issues.append('Yaw drift detected')
-    
-    if variance_data['z_variance'] > 1.0:
-        issues.append('Altitude instability')
-    
-    if variance_data['pitch_variance'] > 0.3:
-        issues.append('Pitch oscillation')
-    
-    if variance_data['roll_variance'] > 0.3:
-        issues.append('Roll oscillation')
-    
-    # Detect spikes 
-    x_spikes = detect_spikes(logs, 'x')
-    y_spikes = detect_spikes(logs, 'y')
-    z_spikes = detect_spikes(logs, 'z')
-    
-    if len(x_spikes) > 5:
-        issues.append('Horizontal position spikes (X-axis)')
-    if len(y_spikes) > 5:
-        issues.append('Horizontal position spikes (Y-axis)')
-    if len(z_spikes) > 5:
-        issues.append('Vertical position spikes')
-    
-    # Detect oscillations
-    if detect_oscillations(logs, 'pitch'):
-        issues.append('Pitch oscillation pattern detected')
-    if detect_oscillations(logs, 'roll'):
-        issues.append('Roll oscillation pattern detected')
-    if detect_oscillations(logs, 'yaw'):
-        issues.append('Yaw oscillation pattern detected')
-    
-    # Calculate smoothness
-    x_smoothness = calculate_smoothness(logs, 'x')
-    y_smoothness = calculate_smoothness(logs, 'y')
-    z_smoothness = calculate_smoothness(logs, 'z')
-    avg_smoothness = (x_smoothness + y_smoothness + z_smoothness) / 3
-    
-    # Calculate stability score (0-100)
-    base_score = 100
-    
-    # NEW (✅ More lenient):
-    variance_penalty = (
-        min(variance_data['x_variance'] * 0.5, 15) +      # Max 15 penalty
-        min(variance_data['y_variance'] * 0.5, 15) +      # Max 15 penalty
-        min(variance_data['z_variance'] * 3, 10) +        # Max 10 penalty
-        min(variance_data['pitch_variance'] * 10, 15) +   # Max 15 penalty
-        min(variance_data['roll_variance'] * 10, 15) +    # Max 15 penalty
-        min(variance_data['yaw_variance'] * 8, 12)        # Max 12 penalty
-    )
-# Max total penalty = 82 (instead of unlimited)
-    
-    # Spike penalties
-    spike_penalty = (len(x_spikes) + len(y_spikes) + len(z_spikes)) * 0.5
-    
-    # Oscillation penalty
-    oscillation_penalty = len([i for i in issues if 'oscillation' in i.lower()]) * 5
-    
-    # Calculate final score
-    stability_score = base_score - variance_penalty - spike_penalty - oscillation_penalty
-    
-    # Bonus for smoothness
-    stability_score += (avg_smoothness - 50) * 0.2
-    
-    # Clamp between 0-100
-    stability_score = max(0, min(100, stability_score))
-    
-    # Classification
-    if stability_score >= 90:
-        classification = 'Excellent'
-    elif stability_score >= 70:
-        classification = 'Good'
-    elif stability_score >= 50:
-        classification = 'Moderate'
-    else:
-        classification = 'Poor'
-    
-    if not issues:
-        issues.append('No major issues detected')
-    
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.IN_FLIGHT.inc()
+    if transport.WIRE_LENGTH in request.environ:
+        if request.environ[transport.WIRE_LENGTH]:
+            metrics.PAYLOAD_BYTES.observe(request.environ[transport.WIRE_LENGTH], endpoint=request.endpoint)
+        # Decode up front so a corrupt or oversized body is a 400 / 413, not a failure inside the view
+        try:
+            request.get_data()
+        except HTTPException as e:
+            logger.warning(f"⚠️  Rejected compressed request body: {e.description}")
+            return jsonify({
+                'success': False,
+                'error': e.description
+            }), e.code
+    elif request.content_length:
+        metrics.PAYLOAD_BYTES.observe(request.content_length, endpoint=request.endpoint)
+
+
+def observe_request(endpoint, status, elapsed):
+    """Latency and status counters of one request (or job run)"""
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    metrics.REQUESTS.inc(endpoint=endpoint, status=status)
+    if status >= 400:
+        metrics.ERRORS.inc(endpoint=endpoint, status=status)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Request latency / status counters and time-to-first-analysis"""
+    elapsed = time.perf_counter() - g.request_started
+    status = response.status_code
+    observe_request(request.endpoint, status, elapsed)
+
+    if startup_clock.first_analysis is None and request.endpoint in ANALYSIS_ENDPOINTS and status == 200:
+        startup_clock.mark_first_analysis(elapsed)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """gzip / deflate large responses; runs before record_request_metrics so latency includes it"""
+    return transport.compress_response(response, request.accept_encodings)
+
+
+@app.teardown_request
+def finish_request(exc):
+    metrics.IN_FLIGHT.dec()
+
+
+def read_json():
+    """Parse the JSON body (None when missing or invalid), timed as the parse stage"""
+    with metrics.stage('parse'):
+        return request.get_json(silent=True)
+
+
+def json_response(payload):
+    """jsonify timed as the serialization stage"""
+    with metrics.stage('serialization'):
+        return jsonify(payload)
+
+
+def cached_analysis(view):
+    """Serve repeat analyses of an identical request from results_cache
+
+    The view tags its result by setting g.cache_tags = (matchId, roundNumber,
+    droneId), or the set of droneIds of a multi-drone response; only
+    successful responses are stored. The round summaries the
+    view recorded are kept with the response and recorded again on a hit,
+    so a repeated request still replaces the stored rows
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = results_cache.digest(
+            request.path.encode('utf-8'),
+            (request.content_type or '').encode('utf-8'),
+            request.query_string,
+            request.get_data()
+        )
+        cached = results_cache.get(key)
+        if cached is not None:
+            body, records = cached
+            for record in records:
+                record_summaries(*record)
+            response = Response(body, mimetype='application/json')
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            results_cache.put(key, (response.get_data(), tuple(g.get('summary_records', ()))),
+                              g.get('cache_tags', ()))
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+def profiled(view):
+    """Run the view under profiler when the request is chosen for profiling
+
+    Sits inside cached_analysis, so cache hits are never profiled. The
+    profile is named after g.cache_tags (matchId, roundNumber) and its file
+    name returned in the X-Profile response header
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiler.wanted(request.headers):
+            return view(*args, **kwargs)
+
+        def names():
+            tags = tuple(g.get('cache_tags', ())) + (None, None)
+            return request.endpoint, tags[0], tags[1]
+
+        response, path = profiler.run(lambda: app.make_response(view(*args, **kwargs)), names)
+        if path:
+            response.headers[profiling.HEADER] = os.path.basename(path)
+            logger.info(f"🔬 Profiled {request.endpoint}: {path}")
+        return response
+
+    return wrapper
+
+
+def columnar_batch_request(body):
+    """Turn a columnar payload into the JSON /batch-analyze shape"""
+    header, frames = columnar.parse_columnar(body)
+
+    teams = {}
+    for drone, frame in zip(header.get('drones', []), frames):
+        team = teams.setdefault(drone.get('teamId'), {'team_id': drone.get('teamId'), 'drones': []})
+        team['drones'].append({'drone_id': frame.drone_id, 'frame': frame})
+
+    return {'match_id': header.get('matchId'), 'round_no': header.get('roundNumber'), 'teams': list(teams.values())}
+
+
+def record_summaries(results, match_id, round_number, team_id=None, tournament_id=None):
+    """responses.record_summaries, also kept in g.summary_records for cached_analysis to replay"""
+    if summaries is None:
+        return
+    if has_request_context():
+        g.setdefault('summary_records', []).append((results, match_id, round_number, team_id, tournament_id))
+    responses.record_summaries(results, match_id, round_number, team_id, tournament_id)
+
+
+def analysis_options():
+    """Per-request analysis options from the query string"""
     return {
-        'drone_id': drone_id,
-        'stability_score': round(stability_score, 2),
-        'classification': classification,
-        'issues_detected': issues,
-        'variance_data': variance_data,
-        'smoothness_scores': {
-            'x': round(x_smoothness, 2),
-            'y': round(y_smoothness, 2),
-            'z': round(z_smoothness, 2),
-            'average': round(avg_smoothness, 2)
-        },
-        'spike_counts': {
-            'x': len(x_spikes),
-            'y': len(y_spikes),
-            'z': len(z_spikes)
-        },
-        'data_points': len(logs)
+        'oscillation_method': request.args.get('oscillationMethod'),
+        'max_points': request.args.get('maxPoints', type=int),
+        'missing_policy': request.args.get('missing'),
+        'max_missing': request.args.get('maxMissing', type=float),
+        'timeline': request.args.get('timeline', '').lower() in ('1', 'true', 'yes'),
+        'timeline_window': request.args.get('timelineWindow', type=float),
+        'timeline_stride': request.args.get('timelineStride', type=float),
+        'resample_rate': request.args.get('resample', type=float),
+        'max_gap': request.args.get('maxGap', type=float),
+        'scorer': request.args.get('scorer')
     }
 
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'service': 'Drone Stability Analysis ML Service',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'scorer': {'default': SCORER, 'model': anomaly.loaded_model_info()},
+        'startup': startup_clock.report()
     })
 
 @app.route('/analyze-stability', methods=['POST'])
+@cached_analysis
+@profiled
 def analyze_stability():
     """Main endpoint to analyze drone stability"""
     try:
-        data = request.get_json()
-        
-        print("📨 Received analysis request")
-        print(f"📊 Data keys: {data.keys() if data else 'None'}")
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'message': 'No data provided'
-            }), 400
-        
-        match_id = data.get('matchId')
-        round_number = data.get('roundNumber')
-        telemetry = data.get('telemetry', [])
-        
-        print(f"📊 Match ID: {match_id}")
-        print(f"📊 Round: {round_number}")
-        print(f"📊 Telemetry points: {len(telemetry)}")
+        logger.debug("📨 Received analysis request")
+
+        if request.mimetype == columnar.CONTENT_TYPE:
+            header, frames = columnar.parse_columnar(request.get_data())
+            match_id = header.get('matchId')
+            round_number = header.get('roundNumber')
+            team_id = header.get('teamId')
+            tournament_id = header.get('tournamentId')
+            drone_id = frames[0].drone_id if frames else 'unknown'
+            frame = TelemetryFrame.concat(frames, drone_id) if frames else None
+        else:
+            data = read_json()
+
+            if not data:
+                return jsonify({
+                    'success': False,
+                    'message': 'No data provided'
+                }), 400
+            if not isinstance(data, dict):
+                raise AnalysisOptionError('Request body must be a JSON object')
+
+            logger.debug(f"📊 Data keys: {data.keys()}")
+
+            match_id = data.get('matchId')
+            round_number = data.get('roundNumber')
+            team_id = data.get('teamId')
+            tournament_id = data.get('tournamentId')
+            telemetry = data.get('telemetry', [])
+            if not isinstance(telemetry, list) or not all(isinstance(point, dict) for point in telemetry):
+                raise AnalysisOptionError('telemetry must be a list of objects')
+
+            # Prepare data for analysis (columnar conversion happens once here)
+            drone_id = telemetry[0].get('droneId', 'unknown') if telemetry else 'unknown'
+            frame = TelemetryFrame.from_logs(telemetry, drone_id) if telemetry else None
+
+        logger.debug(f"📊 Match ID: {match_id}, Round: {round_number}, "
+                     f"Telemetry points: {len(frame) if frame is not None else 0}")
         
-        if not telemetry:
+        if frame is None or len(frame) == 0:
             return jsonify({
                 'success': False,
                 'message': 'No telemetry data provided',
@@ -250,54 +299,40 @@ def analyze_stability():
                 'bonusPoints': 0
             }), 400
         
-        # Prepare data for analysis
         drone_data = {
-            'drone_id': telemetry[0].get('droneId', 'unknown') if telemetry else 'unknown',
-            'logs': telemetry
+            'drone_id': drone_id,
+            'frame': frame
         }
-        
-        print(f"🔍 Analyzing {len(telemetry)} data points...")
+        g.cache_tags = (match_id, round_number, drone_id)
         
         # Analyze drone
-        result = analyze_drone(drone_data)
+        result = analyze_drone(drone_data, **analysis_options())
+        record_summaries([result], match_id, round_number, team_id, tournament_id)
         
-        print(f"✅ Analysis complete!")
-        print(f"   - Stability Score: {result['stability_score']}")
+        response = stability_response(match_id, round_number, result)
         
-        # Calculate bonus points based on stability score
-        stability_score = result['stability_score']
+        logger.info(f"✅ Analyzed {len(frame)} points for match {match_id} round {round_number}: "
+                    f"score {result['stability_score']}, bonus {response['bonusPoints']}")
         
-        if stability_score >= 90:
-            bonus_points = 15
-        elif stability_score >= 80:
-            bonus_points = 10
-        elif stability_score >= 70:
-            bonus_points = 5
-        else:
-            bonus_points = 0
-        
-        print(f"   - Bonus Points: {bonus_points}")
-        
-        response = {
-            'success': True,
-            'matchId': match_id,
-            'roundNumber': round_number,
-            'stabilityScore': result['stability_score'],
-            'bonusPoints': bonus_points,
-            'flightQuality': result['classification'].lower(),
-            'details': {
-                'issues': result['issues_detected'],
-                'variance': result['variance_data'],
-                'smoothness': result['smoothness_scores'],
-                'spikes': result['spike_counts'],
-                'dataPoints': result['data_points']
-            }
-        }
-        return jsonify(response)
+        return json_response(response)
         
 
+    except columnar.ColumnarFormatError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid columnar payload: {str(e)}',
+            'stabilityScore': 0,
+            'bonusPoints': 0
+        }), 400
+    except AnalysisOptionError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'stabilityScore': 0,
+            'bonusPoints': 0
+        }), 400
     except Exception as e:
-        print(f"❌ Analysis error: {str(e)}")
+        logger.exception(f"❌ Analysis error: {str(e)}")
         return jsonify({
             'success': False,
             'message': f'Analysis failed: {str(e)}',
@@ -307,10 +342,15 @@ def analyze_stability():
     
     
 @app.route('/batch-analyze', methods=['POST'])
+@cached_analysis
+@profiled
 def batch_analyze():
     """Analyze multiple teams at once"""
     try:
-        data = request.get_json()
+        if request.mimetype == columnar.CONTENT_TYPE:
+            data = columnar_batch_request(request.get_data())
+        else:
+            data = read_json() or {}
         
         teams_data = data.get('teams', [])
         
@@ -320,17 +360,24 @@ def batch_analyze():
                 'message': 'No teams data provided'
             }), 400
         
+        # Every drone of every team is analyzed in one vectorized pass
+        all_drones = [drone for team_data in teams_data for drone in team_data.get('drones', [])]
+        g.cache_tags = (data.get('match_id'), data.get('round_no'),
+                        {drone.get('drone_id', 'unknown') for drone in all_drones})
+        all_results = iter(analyze_frames(
+            [drone_frame(drone) for drone in all_drones],
+            [drone.get('drone_id', 'unknown') for drone in all_drones],
+            **analysis_options()
+        ))
+        
         results = []
         
         for team_data in teams_data:
             drones = team_data.get('drones', [])
-            drone_results = []
-            total_stability = 0
-            
-            for drone in drones:
-                result = analyze_drone(drone)
-                drone_results.append(result)
-                total_stability += result['stability_score']
+            drone_results = [next(all_results) for _ in drones]
+            record_summaries(drone_results, data.get('match_id'), data.get('round_no'),
+                             team_data.get('team_id'), data.get('tournament_id'))
+            total_stability = sum(result['stability_score'] for result in drone_results)
             
             team_avg = total_stability / len(drones) if drones else 0
             
@@ -340,19 +387,529 @@ def batch_analyze():
                 'team_avg_stability': round(team_avg, 2)
             })
         
-        return jsonify({
+        return json_response({
             'success': True,
             'match_id': data.get('match_id'),
             'results': results
         })
         
+    except columnar.ColumnarFormatError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid columnar payload: {str(e)}'
+        }), 400
+    except AnalysisOptionError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
+        logger.exception(f"❌ Batch analysis error: {str(e)}")
         return jsonify({
             'success': False,
             'message': f'Batch analysis failed: {str(e)}'
         }), 500
         
+@app.route('/analyze', methods=['POST'])
+@cached_analysis
+@profiled
+def analyze_team():
+    """Analyze all of one team's drones in a single round trip"""
+    try:
+        if request.mimetype == columnar.CONTENT_TYPE:
+            header, frames = columnar.parse_columnar(request.get_data())
+            drones = [{'drone_id': frame.drone_id, 'frame': frame} for frame in frames]
+            team_drones = header.get('drones', [])
+            match_id = header.get('matchId')
+            round_no = header.get('roundNumber')
+            team_id = header.get('teamId', team_drones[0].get('teamId') if team_drones else None)
+            tournament_id = header.get('tournamentId')
+        else:
+            data = read_json() or {}
+            drones = data.get('drones', [])
+            match_id = data.get('match_id')
+            round_no = data.get('round_no')
+            team_id = data.get('team_id')
+            tournament_id = data.get('tournament_id')
+
+        if not drones:
+            return jsonify({
+                'success': False,
+                'message': 'No drones data provided'
+            }), 400
+
+        drone_ids = [drone.get('drone_id', drone.get('droneId', 'unknown')) for drone in drones]
+        g.cache_tags = (match_id, round_no, set(drone_ids))
+        frames = [drone_frame({'drone_id': drone_id, **drone}) for drone_id, drone in zip(drone_ids, drones)]
+        results = analyze_frames(frames, drone_ids, **analysis_options())
+        record_summaries(results, match_id, round_no, team_id, tournament_id)
+        for result in results:
+            result['bonus_points'] = calculate_bonus_points(result['stability_score'])
+
+        return json_response({
+            'success': True,
+            'match_id': match_id,
+            'team_id': team_id,
+            'round_no': round_no,
+            'drones': results,
+            'team': team_summary(results)
+        })
+
+    except columnar.ColumnarFormatError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid columnar payload: {str(e)}'
+        }), 400
+    except AnalysisOptionError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.exception(f"❌ Team analysis error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Team analysis failed: {str(e)}'
+        }), 500
+
+
+@app.route('/analyze-file', methods=['POST'])
+@profiled
+def analyze_file():
+    """Analyze stored telemetry from an NDJSON export or columnar file under ML_DATA_DIR"""
+    if not ingest.DATA_DIR:
+        return jsonify({
+            'success': False,
+            'message': 'File analysis is disabled (ML_DATA_DIR)'
+        }), 503
+
+    data = read_json() or {}
+    if not data.get('path'):
+        return jsonify({
+            'success': False,
+            'message': 'path is required'
+        }), 400
+
+    g.cache_tags = (data.get('matchId'), data.get('roundNumber'))
+    try:
+        path = ingest.data_path(data['path'])
+        results, rounds = [], set()
+        for meta, result in ingest.analyze_path(path, data.get('matchId'), data.get('roundNumber'),
+                                                data.get('droneId'), **analysis_options()):
+            record_summaries([result], meta['matchId'], meta['roundNumber'], meta['teamId'],
+                             data.get('tournamentId'))
+            results.append(file_result(meta, result))
+            rounds.add((meta['matchId'], meta['roundNumber']))
+
+        # Without a filter, name the profile after the round read when the file holds just one
+        if len(rounds) == 1:
+            g.cache_tags = rounds.pop()
+
+        logger.info(f"✅ Analyzed {len(results)} drone rounds from {data['path']}")
+        return json_response({
+            'success': True,
+            'path': data['path'],
+            'drones': len(results),
+            'results': results
+        })
+
+    except FileNotFoundError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 404
+    except (ingest.IngestError, columnar.ColumnarFormatError, AnalysisOptionError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Cannot analyze {data["path"]}: {str(e)}'
+        }), 400
+    except Exception as e:
+        logger.exception(f"❌ File analysis error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'File analysis failed: {str(e)}'
+        }), 500
+
+
+@app.route('/proximity', methods=['POST'])
+@cached_analysis
+@profiled
+def proximity_analysis():
+    """Pairwise distances, near misses and team spacing of a match round (same body as /batch-analyze)"""
+    try:
+        if request.mimetype == columnar.CONTENT_TYPE:
+            data = columnar_batch_request(request.get_data())
+        else:
+            data = read_json() or {}
+
+        frames, team_ids, excluded = [], [], []
+        for team_data in data.get('teams', []):
+            for drone in team_data.get('drones', []):
+                frame, quality = clean_frame(drone_frame(drone), request.args.get('missing'),
+                                             request.args.get('maxMissing', type=float))
+                if frame is None or len(frame) < 2:
+                    excluded.append({'drone_id': drone.get('drone_id', 'unknown'), 'quality': quality})
+                    continue
+                frames.append(frame)
+                team_ids.append(team_data.get('team_id'))
+
+        g.cache_tags = (data.get('match_id'), data.get('round_no'),
+                        {drone.get('drone_id', 'unknown') for team_data in data.get('teams', [])
+                         for drone in team_data.get('drones', [])})
+        with metrics.stage('proximity'):
+            report = proximity.proximity_report(frames, team_ids, request.args.get('threshold', type=float),
+                                                request.args.get('tickMs', type=float),
+                                                request.args.get('maxGap', type=float))
+
+        logger.info(f"✅ Proximity for match {data.get('match_id')}: {len(frames)} drones, "
+                    f"{report['ticks']} ticks, {report['event_count']} near misses")
+        return json_response({
+            'success': True,
+            'match_id': data.get('match_id'),
+            'round_no': data.get('round_no'),
+            **report,
+            'excluded': excluded
+        })
+
+    except columnar.ColumnarFormatError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid columnar payload: {str(e)}'
+        }), 400
+    except (proximity.ProximityError, AnalysisOptionError) as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.exception(f"❌ Proximity error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Proximity analysis failed: {str(e)}'
+        }), 500
+
+
+@app.route('/stream/open', methods=['POST'])
+def stream_open():
+    """Open a live analysis session for one drone's round"""
+    data = request.get_json(silent=True) or {}
+    match_id = data.get('matchId')
+    round_number = data.get('roundNumber')
+    drone_id = data.get('droneId')
+
+    if match_id is None or round_number is None or drone_id is None:
+        return jsonify({
+            'success': False,
+            'message': 'matchId, roundNumber and droneId are required'
+        }), 400
+
+    streams.open(match_id, round_number, drone_id)
+    return jsonify({
+        'success': True,
+        'matchId': match_id,
+        'roundNumber': round_number,
+        'droneId': drone_id,
+        'openSessions': len(streams)
+    })
+
+
+@app.route('/stream/push', methods=['POST'])
+def stream_push():
+    """Fold a telemetry chunk into open sessions and return the live score"""
+    try:
+        if request.mimetype == columnar.CONTENT_TYPE:
+            header, frames = columnar.parse_columnar(request.get_data())
+            match_id = header.get('matchId')
+            round_number = header.get('roundNumber')
+        else:
+            data = read_json() or {}
+            match_id = data.get('matchId')
+            round_number = data.get('roundNumber')
+            drone_id = data.get('droneId')
+            frames = [TelemetryFrame.from_logs(data.get('telemetry', []), drone_id)]
+
+        results = []
+        for frame in frames:
+            session = streams.get(match_id, round_number, frame.drone_id)
+            if session is None:
+                return jsonify({
+                    'success': False,
+                    'message': f'No open stream for drone {frame.drone_id}'
+                }), 404
+
+            # A NaN folded into the accumulators would poison the session for good
+            frame, quality = clean_frame(frame, request.args.get('missing'), request.args.get('maxMissing', type=float))
+            if frame is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Chunk rejected: too much missing or invalid telemetry',
+                    'quality': quality
+                }), 400
+
+            response = stability_response(match_id, round_number, session.push(frame.values))
+            response['live'] = True
+            response['chunks'] = session.chunks
+            results.append(response)
+
+        if len(results) == 1:
+            return jsonify(results[0])
+        return jsonify({'success': True, 'results': results})
+
+    except columnar.ColumnarFormatError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid columnar payload: {str(e)}'
+        }), 400
+    except AnalysisOptionError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.exception(f"❌ Stream update error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Stream update failed: {str(e)}'
+        }), 500
+
+
+@app.route('/stream/score', methods=['GET'])
+def stream_score():
+    """Read the live stability score of an open session"""
+    match_id = request.args.get('matchId')
+    round_number = request.args.get('roundNumber')
+    drone_id = request.args.get('droneId')
+
+    session = streams.get(match_id, round_number, drone_id)
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': f'No open stream for drone {drone_id}'
+        }), 404
+
+    response = stability_response(session.match_id, session.round_number, session.result())
+    response['live'] = True
+    response['chunks'] = session.chunks
+    return jsonify(response)
+
+
+@app.route('/stream/close', methods=['POST'])
+def stream_close():
+    """Close a session and return its end-of-round result"""
+    data = request.get_json(silent=True) or {}
+    session = streams.close(data.get('matchId'), data.get('roundNumber'), data.get('droneId'))
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': f"No open stream for drone {data.get('droneId')}"
+        }), 404
+
+    # Estimates are not recorded; summaries hold exact results only
+    result = session.result()
+    response = stability_response(session.match_id, session.round_number, result)
+    response['live'] = False
+    response['chunks'] = session.chunks
+    return jsonify(response)
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Result cache counters"""
+    return jsonify({'success': True, 'cache': results_cache.stats()})
+
+
+@app.route('/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    """Drop cached results for a match / round / drone (nothing given clears all)"""
+    data = request.get_json(silent=True) or {}
+    removed = results_cache.invalidate(data.get('matchId'), data.get('roundNumber'), data.get('droneId'))
+    return jsonify({'success': True, 'removed': removed, 'cache': results_cache.stats()})
+
+
+@app.route('/profile', methods=['GET'])
+def profile_stats():
+    """Profiling settings and counters"""
+    return jsonify({'success': True, 'profiling': profiler.stats()})
+
+
+@app.route('/profile', methods=['POST'])
+def profile_sampling():
+    """Set 1-in-N request sampling ({"every": N}, 0 = header only)"""
+    if not profiler.enabled:
+        return jsonify({
+            'success': False,
+            'message': 'Profiling is disabled (ML_PROFILE_DIR)'
+        }), 503
+    every = (request.get_json(silent=True) or {}).get('every')
+    if not isinstance(every, int) or isinstance(every, bool) or every < 0:
+        return jsonify({
+            'success': False,
+            'message': 'every must be a non-negative integer'
+        }), 400
+    profiler.every = every
+    logger.info(f"🔬 Profiling 1 in {every} analysis requests" if every else "🔬 Profiling only on request")
+    return jsonify({'success': True, 'profiling': profiler.stats()})
+
+
+def replay_request(kind):
+    """A job body that runs this request's payload through the synchronous endpoint"""
+    view = app.view_functions[JOB_KINDS[kind]]
+    body = request.get_data()
+    content_type = request.content_type
+    query_string = request.query_string.decode('latin-1')
+    # A queued request can still ask to be profiled
+    headers = {profiling.HEADER: request.headers[profiling.HEADER]} if profiling.HEADER in request.headers else {}
+
+    def run():
+        # The replay skips before_request but its context teardown still
+        # runs finish_request, so in-flight is raised here to match
+        started = time.perf_counter()
+        metrics.IN_FLIGHT.inc()
+        status = 500
+        try:
+            with app.test_request_context(f'/{kind}', method='POST', data=body, content_type=content_type,
+                                          query_string=query_string, headers=headers):
+                response = app.make_response(view())
+                status = response.status_code
+                return status, response.get_json(silent=True)
+        finally:
+            observe_request(f'job:{JOB_KINDS[kind]}', status, time.perf_counter() - started)
+
+    return run
+
+
+@app.route('/jobs', methods=['GET'])
+def job_stats():
+    """Job queue occupancy"""
+    return jsonify({'success': True, 'jobs': job_queue.stats()})
+
+
+@app.route('/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    """Queue an analysis (same body and query as /<kind>) and return its job id at once"""
+    if kind not in JOB_KINDS:
+        return jsonify({
+            'success': False,
+            'message': f"Job kind must be one of {', '.join(JOB_KINDS)}"
+        }), 404
+
+    try:
+        job = job_queue.submit(kind, replay_request(kind))
+    except jobs.QueueFull as e:
+        logger.warning(f"⚠️  Job queue full, {kind} rejected (retry in {e.retry_after}s)")
+        response = jsonify({
+            'success': False,
+            'message': str(e),
+            'retryAfter': e.retry_after
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    response = jsonify({'success': True, **job.to_dict()})
+    response.headers['Location'] = f'/jobs/{job.id}'
+    return response, 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """A job's state and timing, plus its result once done; ?wait=<seconds> long-polls"""
+    wait = request.args.get('wait', 0, type=float)
+    job = job_queue.wait(job_id, wait)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': f'No job {job_id}'
+        }), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a job: a queued one never runs, a running one's result is discarded"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': f'No job {job_id}'
+        }), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+
+def summary_report(scope, group_by):
+    """Aggregate, per-group breakdown and per-round trend of the stored summaries in scope"""
+    if summaries is None:
+        return jsonify({
+            'success': False,
+            'message': 'Summary store is disabled (ML_SUMMARY_DB)'
+        }), 503
+
+    group_by = request.args.get('groupBy', group_by)
+    if group_by not in FILTERS:
+        return jsonify({
+            'success': False,
+            'message': f"groupBy must be one of {', '.join(FILTERS)}"
+        }), 400
+
+    filters = {name: request.args.get(name) for name in FILTERS}
+    filters.update(scope)
+    try:
+        overall = summaries.aggregate(**filters)
+        return jsonify({
+            'success': True,
+            **scope,
+            'summary': overall[0] if overall else None,
+            'groupBy': group_by,
+            'groups': summaries.aggregate(group_by, **filters),
+            'trend': summaries.trend(**filters)
+        })
+    except sqlite3.Error as e:
+        logger.exception(f"❌ Summary query error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Summary query failed: {str(e)}'
+        }), 500
+
+
+@app.route('/summaries/team/<team_id>', methods=['GET'])
+def team_summaries(team_id):
+    """A team's stability over every stored round, per drone"""
+    return summary_report({'teamId': team_id}, 'droneId')
+
+
+@app.route('/summaries/match/<match_id>', methods=['GET'])
+def match_summaries(match_id):
+    """A match's stability, per team"""
+    return summary_report({'matchId': match_id}, 'teamId')
+
+
+@app.route('/summaries/tournament/<tournament_id>', methods=['GET'])
+def tournament_summaries(tournament_id):
+    """Tournament leaderboard: teams ranked by mean stability"""
+    return summary_report({'tournamentId': tournament_id}, 'teamId')
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics"""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+# Warm up at import so gunicorn's preloading master pays it once before fork
+if os.environ.get('ML_WARMUP', '1') == '1':
+    startup.warmup(startup_clock)
+startup_clock.mark_ready()
+logger.info(f"⏱️  Startup: {startup_clock.report()}")
+if startup_clock.over_budget():
+    logger.warning(f"⚠️  Startup took longer than the {startup_clock.budget}s budget")
+
+
 if __name__ == '__main__':
-    print("🤖 ML Stability Analysis Service Starting...")
-    print("📊 Ready to analyze drone telemetry!")
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    logger.info("🤖 ML Stability Analysis Service Starting...")
+    logger.info("📊 Ready to analyze drone telemetry!")
+    # Development server; use serve.py (gunicorn / waitress) in production.
+    # With ML_SERVICE_SOCKET it listens on that Unix socket instead of the port
+    socket_path = os.environ.get('ML_SERVICE_SOCKET')
+    app.run(
+        host=f'unix://{socket_path}' if socket_path else os.environ.get('ML_SERVICE_HOST', '0.0.0.0'),
+        port=int(os.environ.get('ML_SERVICE_PORT', 5001)),
+        debug=os.environ.get('ML_DEBUG', '1') == '1'
+    )
\ No newline at end of file
@@ -0,0 +1,765 @@
+# ml-service/benchmark.py
+"""
+Benchmark suite for the stability analysis
+Generates deterministic synthetic telemetry, times analyze_drone, the batch
+engine and the HTTP endpoints (through Flask's test client, no network),
+checks the engine against the reference implementation, the chunked,
+parallel, downsampled and streaming engines against the full-array one
+and peak memory against the limit, and compares runs
+against a stored baseline. --transport adds real round trips over TCP
+loopback and a Unix domain socket (ML_SERVICE_SOCKET)
+
+Usage (from ml-service/):
+    python benchmark.py                         # quick grid
+    python benchmark.py --full                  # 10 .. 1,000,000 samples, 1 .. 64 drones
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --compare benchmark_baseline.json --threshold 0.25
+    python benchmark.py --transport --samples 300 3000 12000 --drones 8
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import platform
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# Benchmarks must measure analysis, not cache hits, summary writes or boot warmup
+os.environ['ML_CACHE_SIZE'] = '0'
+os.environ['ML_SUMMARY_DB'] = ''
+os.environ.setdefault('ML_WARMUP', '0')
+os.environ.setdefault('ML_LOG_LEVEL', 'warning')
+
+import anomaly  # noqa: E402
+import columnar  # noqa: E402
+import parallel  # noqa: E402
+import result_cache  # noqa: E402
+import summary_store  # noqa: E402
+from stability import (ATTITUDE_AXES, AXES, POSITION_AXES, FrameBatch, TelemetryFrame, analyze_drone,  # noqa: E402
+                       analyze_frames, chunked_features, downsampled_features, extract_features, score_drone)
+from streaming import StreamingAnalyzer  # noqa: E402
+
+QUICK_SAMPLES = (10, 100, 1_000, 10_000, 100_000)
+FULL_SAMPLES = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+QUICK_DRONES = (1, 4, 16)
+FULL_DRONES = (1, 4, 16, 64)
+
+# JSON request bodies are built from Python dicts; keep those cases bounded
+MAX_HTTP_SAMPLES = 100_000
+# Upper bound on samples timed per case (repeats shrink as payloads grow)
+SAMPLE_BUDGET = 5_000_000
+# gzip request body, gzip response when it is large enough
+GZIP_HEADERS = {'Content-Encoding': 'gzip', 'Accept-Encoding': 'gzip'}
+# Largest batch (drones x samples) timed over real sockets with --transport
+MAX_TRANSPORT_SAMPLES = 200_000
+# (samples, ML_MEMORY_LIMIT_MB) whose traced peak must stay within the limit.
+# 32,769 samples just past a power of two is the full path's worst FFT
+# padding; 18 MiB / CHUNK_BYTES_PER_SAMPLE is a whole power of two, the
+# chunked path's tightest block
+QUICK_MEMORY_CASES = ((32_769, 13), (200_000, 4), (1_000_000, 16), (1_000_000, 18))
+FULL_MEMORY_CASES = QUICK_MEMORY_CASES + ((3_000_000, 40), (3_000_000, 100))
+# Engine checks: chunked blocks (what a 1 MiB limit gives), parallel workers,
+# samples per streamed chunk, and the rounds downsampled (to 1/8 of their samples)
+ENGINE_BLOCK_POINTS = 8192
+ENGINE_WORKERS = 2
+STREAM_CHUNK_POINTS = 1000
+MIN_ENGINE_SAMPLES = 1_000
+MIN_DOWNSAMPLE_CHECK = 100_000
+# White noise is also downsampled to this many points, the worst case for the stride estimate
+NOISE_DOWNSAMPLE_POINTS = 5_000
+# Largest difference from the full-array engine each engine may show (None =
+# reported, not checked). Variance and jerk are relative, mean in standard
+# deviations, spikes a share of the samples, 'oscillating' the number of
+# axes whose flag differs; the rest are absolute
+ENGINE_TOLERANCES = {
+    'parallel': {'variance': 1e-9, 'mean': 1e-9, 'jerk': 1e-9, 'spikes': 0, 'sign_change_ratio': 0,
+                 'dominant_frequency': 0, 'band_power': 0, 'oscillating': 0, 'score': 0},
+    # float32 blocks; the spectrum resolves 20 Hz / ENGINE_BLOCK_POINTS, two bins allowed
+    'chunked': {'variance': 1e-6, 'mean': 1e-6, 'jerk': 1e-6, 'spikes': 1e-4, 'sign_change_ratio': 1e-4,
+                'dominant_frequency': 2 * 20 / ENGINE_BLOCK_POINTS, 'band_power': 1e-3, 'oscillating': 0,
+                'score': 0.01},
+    # Stride and window estimates; short windows misjudge band power of drifting telemetry
+    'downsampled': {'variance': 0.02, 'mean': 0.01, 'jerk': 0.1, 'spikes': 0.002, 'sign_change_ratio': 0.01,
+                    'dominant_frequency': 0.05, 'band_power': None, 'oscillating': None, 'score': None},
+    # About 10,000 pooled stride samples: one axis's variance has a 1.4% standard error on white noise.
+    # White noise has no dominant frequency to agree on
+    'downsampled-noise': {'variance': 0.06, 'mean': 0.05, 'jerk': 0.06, 'spikes': 0.005, 'sign_change_ratio': 0.03,
+                          'dominant_frequency': None, 'band_power': 0.05, 'oscillating': 0, 'score': None},
+    # Online spike counts (see streaming.py); sign-change method only
+    'streaming': {'variance': 1e-9, 'mean': 1e-9, 'jerk': 1e-9, 'spikes': None, 'sign_change_ratio': 0,
+                  'oscillating': 0, 'score': None},
+}
+
+
+def synthetic_frame(samples, seed=0, drone_id='D0'):
+    """Deterministic hover-with-drift telemetry at 20 Hz"""
+    rng = np.random.default_rng(seed)
+    drift = rng.normal(0, 0.02, (len(AXES), samples)).cumsum(axis=1)
+    noise = rng.normal(0, 0.1, (len(AXES), samples))
+    # Occasional gusts so spike detection has work to do
+    gusts = (rng.random((len(AXES), samples)) < 0.01) * rng.normal(0, 2, (len(AXES), samples))
+    values = drift + noise + gusts
+    timestamps = 1_700_000_000_000 + np.arange(samples, dtype=np.float64) * 50
+    battery = np.linspace(100, 80, samples)
+    return TelemetryFrame(values, drone_id, timestamps, battery)
+
+
+def noise_frame(samples, seed=0, drone_id='N0'):
+    """Deterministic white-noise telemetry at 20 Hz: broadband, no drift"""
+    rng = np.random.default_rng(seed)
+    timestamps = 1_700_000_000_000 + np.arange(samples, dtype=np.float64) * 50
+    return TelemetryFrame(rng.normal(0, 1, (len(AXES), samples)), drone_id, timestamps, np.linspace(100, 80, samples))
+
+
+def frame_logs(frame):
+    """TelemetryFrame -> list of telemetry dicts as the backend sends them"""
+    logs = []
+    for column, timestamp, battery in zip(frame.values.T.tolist(), frame.timestamps.tolist(),
+                                          frame.battery.tolist()):
+        point = dict(zip(AXES, column))
+        point['timestamp'] = timestamp
+        point['battery'] = battery
+        point['droneId'] = frame.drone_id
+        logs.append(point)
+    return logs
+
+
+# Reference implementation: the original per-axis list-of-dicts analysis,
+# kept verbatim (with NumPy in place of scipy.stats.zscore) for score checks
+
+def _zscore(values):
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (values - values.mean()) / values.std()
+
+
+def reference_analyze_drone(drone_data):
+    """Original analyze_drone, one Python pass per axis and feature"""
+    logs = drone_data.get('logs', [])
+    drone_id = drone_data.get('drone_id', 'unknown')
+    if len(logs) < 10:
+        return {'drone_id': drone_id, 'stability_score': 0, 'classification': 'Insufficient Data',
+                'issues_detected': ['Not enough data points'], 'variance_data': {}, 'data_points': len(logs)}
+
+    variance_data = {f'{axis}_variance': float(np.var([p[axis] for p in logs])) for axis in AXES}
+
+    def spikes(axis):
+        z_scores = np.abs(_zscore([p[axis] for p in logs]))
+        return len(np.where(z_scores > 2.0)[0])
+
+    def oscillating(axis):
+        diffs = np.diff([p[axis] for p in logs])
+        return np.sum(np.diff(np.sign(diffs)) != 0) / len(diffs) > 0.4
+
+    def smoothness(axis):
+        jerk = np.diff(np.diff(np.diff([p[axis] for p in logs])))
+        return float(max(0, 100 - (np.mean(np.abs(jerk)) * 10)))
+
+    issues = []
+    if variance_data['yaw_variance'] > 0.5:
+        issues.append('Yaw drift detected')
+    if variance_data['z_variance'] > 1.0:
+        issues.append('Altitude instability')
+    if variance_data['pitch_variance'] > 0.3:
+        issues.append('Pitch oscillation')
+    if variance_data['roll_variance'] > 0.3:
+        issues.append('Roll oscillation')
+
+    spike_counts = {axis: spikes(axis) for axis in ('x', 'y', 'z')}
+    if spike_counts['x'] > 5:
+        issues.append('Horizontal position spikes (X-axis)')
+    if spike_counts['y'] > 5:
+        issues.append('Horizontal position spikes (Y-axis)')
+    if spike_counts['z'] > 5:
+        issues.append('Vertical position spikes')
+
+    for axis, name in (('pitch', 'Pitch'), ('roll', 'Roll'), ('yaw', 'Yaw')):
+        if oscillating(axis):
+            issues.append(f'{name} oscillation pattern detected')
+
+    smooth = {axis: smoothness(axis) for axis in ('x', 'y', 'z')}
+    avg_smoothness = (smooth['x'] + smooth['y'] + smooth['z']) / 3
+
+    variance_penalty = (
+        min(variance_data['x_variance'] * 0.5, 15) +
+        min(variance_data['y_variance'] * 0.5, 15) +
+        min(variance_data['z_variance'] * 3, 10) +
+        min(variance_data['pitch_variance'] * 10, 15) +
+        min(variance_data['roll_variance'] * 10, 15) +
+        min(variance_data['yaw_variance'] * 8, 12)
+    )
+    spike_penalty = sum(spike_counts.values()) * 0.5
+    oscillation_penalty = len([i for i in issues if 'oscillation' in i.lower()]) * 5
+    stability_score = 100 - variance_penalty - spike_penalty - oscillation_penalty
+    stability_score += (avg_smoothness - 50) * 0.2
+    stability_score = max(0, min(100, stability_score))
+
+    return {
+        'drone_id': drone_id,
+        'stability_score': round(stability_score, 2),
+        'issues_detected': issues or ['No major issues detected'],
+        'variance_data': variance_data,
+        'spike_counts': spike_counts,
+        'smoothness': smooth,
+        'data_points': len(logs)
+    }
+
+
+def check_equivalence(samples_grid, seeds=3, rel_tol=1e-9):
+    """Compare the batch engine against the reference implementation"""
+    mismatches = []
+    for samples in samples_grid:
+        if samples > MAX_HTTP_SAMPLES:
+            continue
+        for seed in range(seeds):
+            frame = synthetic_frame(samples, seed)
+            expected = reference_analyze_drone({'drone_id': 'D0', 'logs': frame_logs(frame)})
+            actual = analyze_frames([frame], oscillation_method='sign_change')[0]
+
+            problems = []
+            if expected['stability_score'] != actual['stability_score']:
+                problems.append(f"score {expected['stability_score']} != {actual['stability_score']}")
+            if expected['issues_detected'] != actual['issues_detected']:
+                problems.append('issues differ')
+            for key, value in expected['variance_data'].items():
+                if not math.isclose(value, actual['variance_data'][key], rel_tol=rel_tol, abs_tol=1e-12):
+                    problems.append(f'{key} {value} != {actual["variance_data"][key]}')
+            if expected.get('spike_counts', {}) != actual.get('spike_counts', {}):
+                problems.append('spike counts differ')
+            for axis, value in expected.get('smoothness', {}).items():
+                if not math.isclose(value, actual['smoothness_scores'][axis], abs_tol=0.005):
+                    problems.append(f'{axis} smoothness {value} != {actual["smoothness_scores"][axis]}')
+
+            if problems:
+                mismatches.append({'samples': samples, 'seed': seed, 'problems': problems})
+    return mismatches
+
+
+def engine_differences(features, expected):
+    """Largest difference per ENGINE_TOLERANCES key between two drones' features"""
+    def relative(value, reference):
+        return abs(value - reference) / reference if reference else abs(value)
+
+    variances = expected['variance_data']
+    differences = {
+        'variance': max(relative(features['variance_data'][key], value) for key, value in variances.items()),
+        'mean': max(abs(features['moments']['mean'][axis] - value) / math.sqrt(variances[f'{axis}_variance'] or 1)
+                    for axis, value in expected['moments']['mean'].items()),
+        'jerk': max(relative(features['moments']['jerk'][axis], value)
+                    for axis, value in expected['moments']['jerk'].items()),
+        'spikes': max(abs(features['spike_counts'][axis] - expected['spike_counts'][axis])
+                      for axis in POSITION_AXES) / expected['data_points'],
+        'oscillating': 0,
+        'score': abs(score_drone('D0', features)['stability_score'] -
+                     score_drone('D0', expected)['stability_score'])
+    }
+    for axis in ATTITUDE_AXES:
+        actual, reference = features['oscillation'][axis], expected['oscillation'][axis]
+        differences['oscillating'] += actual['oscillating'] != reference['oscillating']
+        for key in reference.keys() - {'oscillating'}:
+            differences[key] = max(differences.get(key, 0), abs(actual[key] - reference[key]))
+    return differences
+
+
+def streamed_features(frame):
+    """Features of a frame pushed through a stream session chunk by chunk"""
+    analyzer = StreamingAnalyzer(frame.drone_id)
+    for start in range(0, len(frame), STREAM_CHUNK_POINTS):
+        analyzer.update(frame.values[:, start:start + STREAM_CHUNK_POINTS])
+    return analyzer.features()
+
+
+def check_engines(samples_grid, seeds=2):
+    """Compare every engine against the full-array one, for both oscillation methods
+
+    Returns (mismatches beyond ENGINE_TOLERANCES, largest difference seen
+    per engine, method and feature)
+    """
+    mismatches = []
+    worst = {}
+    for samples in samples_grid:
+        if samples < MIN_ENGINE_SAMPLES:
+            continue
+        for seed in range(seeds):
+            frame = synthetic_frame(samples, seed)
+            noise = noise_frame(samples, seed) if samples >= MIN_DOWNSAMPLE_CHECK else None
+            for method in ('spectral', 'sign_change'):
+                # engine -> (telemetry, features of it)
+                engines = {
+                    'parallel': (frame, lambda f: parallel.parallel_features(f, method, workers=ENGINE_WORKERS)),
+                    'chunked': (frame, lambda f: chunked_features(f, ENGINE_BLOCK_POINTS, method))
+                }
+                if samples >= MIN_DOWNSAMPLE_CHECK:
+                    engines['downsampled'] = (frame, lambda f: downsampled_features(f, samples // 8, method))
+                    engines['downsampled-noise'] = (
+                        noise, lambda f: downsampled_features(f, NOISE_DOWNSAMPLE_POINTS, method))
+                if method == 'sign_change':
+                    engines['streaming'] = (frame, streamed_features)
+
+                expected = {}
+                for engine, (source, features) in engines.items():
+                    if source.drone_id not in expected:
+                        expected[source.drone_id] = extract_features(FrameBatch([source]), method)[0]
+                    differences = engine_differences(features(source), expected[source.drone_id])
+                    seen = worst.setdefault(f'{engine}/{method}', {})
+                    problems = []
+                    for key, difference in differences.items():
+                        seen[key] = max(seen.get(key, 0), difference)
+                        tolerance = ENGINE_TOLERANCES[engine].get(key)
+                        if tolerance is not None and difference > tolerance:
+                            problems.append(f'{key} off by {difference:.3g} (tolerance {tolerance:g})')
+                    if problems:
+                        mismatches.append({'engine': engine, 'method': method, 'samples': samples,
+                                           'seed': seed, 'problems': problems})
+    return mismatches, worst
+
+
+def check_memory(cases):
+    """Traced peak of analyze_frames against its memory limit, for both oscillation methods"""
+    overages = []
+    for samples, limit_mb in cases:
+        frame = synthetic_frame(samples)
+        for method in ('spectral', 'sign_change'):
+            tracemalloc.start()
+            analyze_frames([frame], oscillation_method=method, memory_limit_mb=limit_mb)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak_mb = peak / (1024 * 1024)
+            print(f"  {samples:>9,} samples {method:<11} limit {limit_mb:>4} MiB  peak {peak_mb:>7.2f} MiB")
+            if peak_mb > limit_mb:
+                overages.append({'samples': samples, 'method': method, 'limit_mb': limit_mb,
+                                 'peak_mb': round(peak_mb, 2)})
+    return overages
+
+
+def check_summary_trend():
+    """Re-recording an earlier round must not move it in the trend order"""
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = summary_store.SummaryStore(os.path.join(tmp, 'summaries.db'))
+        try:
+            for round_number in (1, 2, 3):
+                frame = synthetic_frame(200, seed=round_number)
+                store.record(analyze_frames([frame])[0], 'M1', round_number)
+            before = store.trend(matchId='M1')
+            store.record(analyze_frames([synthetic_frame(200, seed=1)])[0], 'M1', 1)
+            after = store.trend(matchId='M1')
+        finally:
+            store.close()
+    order = [row['round_number'] for row in after['rounds']]
+    if order != [1, 2, 3]:
+        problems.append(f'trend order {order} after re-recording round 1')
+    if after['slope_per_round'] != before['slope_per_round']:
+        problems.append(f"slope {before['slope_per_round']} -> {after['slope_per_round']}")
+    return problems
+
+
+def check_slow_timeline():
+    """A 1 Hz drone in a batch gets a widened timeline window instead of failing the batch"""
+    fast = synthetic_frame(400, seed=1, drone_id='FAST')
+    slow = synthetic_frame(60, seed=2, drone_id='SLOW')
+    slow = TelemetryFrame(slow.values, slow.drone_id, 1_700_000_000_000 + np.arange(60.0) * 1000, slow.battery)
+    try:
+        results = analyze_frames([fast, slow], timeline=True)
+    except Exception as e:
+        return [f'batch failed: {e}']
+    windows = [(result['timeline']['window_seconds'], result['timeline']['window_widened']) for result in results]
+    return [] if windows == [(5.0, False), (10.0, True)] else [f'windows {windows}']
+
+
+def check_unreadable_model():
+    """scorer=model with a missing, empty or corrupt model file is a 400, not a 500"""
+    from app import app
+
+    client = app.test_client()
+    body = {'matchId': 'M1', 'roundNumber': 1, 'telemetry': frame_logs(synthetic_frame(200))}
+    problems = []
+    saved = anomaly.ANOMALY_MODEL, anomaly._model
+    with tempfile.TemporaryDirectory() as tmp:
+        contents = {'missing': None, 'empty': b'', 'corrupt': anomaly.MAGIC + bytes(range(64))}
+        try:
+            for name, content in contents.items():
+                path = os.path.join(tmp, f'{name}.drnm')
+                if content is not None:
+                    with open(path, 'wb') as f:
+                        f.write(content)
+                anomaly.ANOMALY_MODEL, anomaly._model = path, None
+                response = client.post('/analyze-stability?scorer=model', json=body)
+                message = (response.get_json(silent=True) or {}).get('message', '')
+                if response.status_code != 400 or not message.startswith('anomaly model unavailable'):
+                    problems.append(f'{name} model file: {response.status_code} {message!r}')
+        finally:
+            anomaly.ANOMALY_MODEL, anomaly._model = saved
+    return problems
+
+
+def check_malformed_bodies():
+    """/analyze-stability answers malformed JSON bodies with a 400, not a 500"""
+    from app import app
+
+    client = app.test_client()
+    point = frame_logs(synthetic_frame(20))[0]
+    bodies = {
+        'list body': [point],
+        'string body': 'telemetry',
+        'telemetry object': {'matchId': 'M1', 'telemetry': point},
+        'telemetry string': {'matchId': 'M1', 'telemetry': 'x'},
+        'non-object point': {'matchId': 'M1', 'telemetry': [point, 5]}
+    }
+    problems = []
+    for name, body in bodies.items():
+        status = client.post('/analyze-stability', json=body).status_code
+        if status != 400:
+            problems.append(f'{name}: {status}')
+    return problems
+
+
+def check_drone_invalidation():
+    """Invalidating one drone drops the multi-drone responses that contain it"""
+    cache = result_cache.ResultCache(maxsize=8)
+    cache.put('batch', b'', ('M1', 1, {'D1', 'D2'}))
+    cache.put('single', b'', ('M1', 1, 'D3'))
+    removed = cache.invalidate('M1', 1, 'D2')
+    return [] if removed == 1 and cache.get('batch') is None and cache.get('single') is not None else \
+        [f'invalidating D2 removed {removed} entries']
+
+
+def check_service():
+    """Regression checks of service behavior that is not timed"""
+    return {'summary trend order': check_summary_trend(),
+            'slow drone timeline': check_slow_timeline(),
+            'unreadable anomaly model': check_unreadable_model(),
+            'drone cache invalidation': check_drone_invalidation(),
+            'malformed request bodies': check_malformed_bodies()}
+
+
+def measure(fn, total_samples, repeats=None):
+    """Latency percentiles, throughput and peak traced memory of fn()"""
+    if repeats is None:
+        repeats = max(3, min(50, SAMPLE_BUDGET // max(total_samples, 1)))
+
+    fn()  # warm caches / first-call costs
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = np.array(timings)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        'repeats': repeats,
+        'p50_ms': round(p50 * 1000, 4),
+        'p95_ms': round(p95 * 1000, 4),
+        'p99_ms': round(p99 * 1000, 4),
+        'samples_per_sec': round(total_samples / p50) if p50 > 0 else None,
+        'peak_mb': round(peak / 1e6, 3)
+    }
+
+
+def run(samples_grid, drones_grid, include_reference=True, transport=False):
+    """Time every case; returns {case_name: measurement}"""
+    from app import app
+
+    client = app.test_client()
+    results = {}
+
+    def record(name, fn, total_samples, **info):
+        result = measure(fn, total_samples)
+        result.update(info, total_samples=total_samples)
+        results[name] = result
+        print(f"{name:<48} p50 {result['p50_ms']:>10.3f} ms  p99 {result['p99_ms']:>10.3f} ms  "
+              f"{result['samples_per_sec'] or 0:>12,} samples/s  peak {result['peak_mb']:>9.3f} MB")
+
+    for samples in samples_grid:
+        frame = synthetic_frame(samples)
+        record(f'analyze_drone/frame/{samples}', lambda: analyze_drone({'frame': frame}), samples,
+               samples=samples, drones=1)
+
+        if samples > MAX_HTTP_SAMPLES:
+            continue
+        logs = frame_logs(frame)
+        record(f'analyze_drone/logs/{samples}', lambda: analyze_drone({'logs': logs}), samples,
+               samples=samples, drones=1)
+        if include_reference:
+            record(f'reference/logs/{samples}', lambda: reference_analyze_drone({'logs': logs}), samples,
+                   samples=samples, drones=1)
+
+        body = json.dumps({'matchId': 'bench', 'roundNumber': 1, 'telemetry': logs})
+        record(f'http/analyze-stability/json/{samples}',
+               lambda: client.post('/analyze-stability', data=body, content_type='application/json'),
+               samples, samples=samples, drones=1, bytes=len(body))
+
+        # Wire size vs. decode and encode cost; the test client has no network to save time on
+        zipped = gzip.compress(body.encode('utf-8'), 5)
+        record(f'http/analyze-stability/json-gzip/{samples}',
+               lambda: client.post('/analyze-stability', data=zipped, content_type='application/json',
+                                   headers=GZIP_HEADERS),
+               samples, samples=samples, drones=1, bytes=len(zipped))
+
+        packed = columnar.encode_columnar([frame], 'bench', 1)
+        record(f'http/analyze-stability/columnar/{samples}',
+               lambda: client.post('/analyze-stability', data=packed, content_type=columnar.CONTENT_TYPE),
+               samples, samples=samples, drones=1, bytes=len(packed))
+
+    for drones in drones_grid:
+        for samples in samples_grid:
+            total = drones * samples
+            if total > MAX_HTTP_SAMPLES * 10:
+                continue
+            frames = [synthetic_frame(samples, seed, f'D{seed}') for seed in range(drones)]
+            record(f'analyze_frames/{drones}x{samples}', lambda: analyze_frames(frames), total,
+                   samples=samples, drones=drones)
+
+            if total > MAX_HTTP_SAMPLES:
+                continue
+            teams = [
+                {'team_id': team, 'drones': [{'drone_id': f.drone_id, 'logs': frame_logs(f)}
+                                             for f in frames[half::2]]}
+                for team, half in (('A', 0), ('B', 1))
+            ]
+            body = json.dumps({'match_id': 'bench', 'teams': teams})
+            record(f'http/batch-analyze/json/{drones}x{samples}',
+                   lambda: client.post('/batch-analyze', data=body, content_type='application/json'),
+                   total, samples=samples, drones=drones, bytes=len(body))
+
+            zipped = gzip.compress(body.encode('utf-8'), 5)
+            record(f'http/batch-analyze/json-gzip/{drones}x{samples}',
+                   lambda: client.post('/batch-analyze', data=zipped, content_type='application/json',
+                                       headers=GZIP_HEADERS),
+                   total, samples=samples, drones=drones, bytes=len(zipped))
+
+            packed = columnar.encode_columnar(frames, 'bench', 1, team_ids=['AB'[i % 2] for i in range(drones)])
+            record(f'http/batch-analyze/columnar/{drones}x{samples}',
+                   lambda: client.post('/batch-analyze', data=packed, content_type=columnar.CONTENT_TYPE),
+                   total, samples=samples, drones=drones, bytes=len(packed))
+
+    if transport:
+        transport_cases(record, samples_grid, drones_grid)
+    return results
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix domain socket"""
+
+    def __init__(self, path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def serve_transports(socket_path, ports):
+    """Serve the app on TCP loopback and on socket_path (threaded werkzeug, HTTP/1.1 keep-alive)
+
+    Runs in a child process so the benchmark client does not share its
+    GIL; the TCP port is sent back through ports
+    """
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from app import app
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    tcp = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    unix = make_server(f'unix://{socket_path}', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    threading.Thread(target=unix.serve_forever, daemon=True).start()
+    ports.put(tcp.server_port)
+    tcp.serve_forever()
+
+
+def transport_cases(record, samples_grid, drones_grid):
+    """Round trips over TCP loopback and a Unix socket, on a new and on a reused connection
+
+    Both listeners serve the same app in one server process, so the
+    difference is the transport: connection setup, and moving the body
+    through the kernel
+    """
+    import multiprocessing
+
+    if not hasattr(socket, 'AF_UNIX'):
+        print('Skipping transport cases: no Unix domain sockets on this platform')
+        return
+
+    directory = tempfile.mkdtemp(prefix='ml-bench-')
+    socket_path = os.path.join(directory, 'ml.sock')
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_transports, args=(socket_path, ports), daemon=True)
+    server.start()
+    port = ports.get(timeout=60)
+    connectors = {
+        'tcp': lambda: http.client.HTTPConnection('127.0.0.1', port, timeout=60),
+        'unix': lambda: UnixHTTPConnection(socket_path)
+    }
+
+    def requester(connect, reuse, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        held = []
+
+        def call():
+            if not reuse or not held:
+                held[:] = [connect()]
+            connection = held[0]
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if not reuse:
+                connection.close()
+            if response.status != 200:
+                raise RuntimeError(f'{method} {path}: HTTP {response.status}')
+
+        return call
+
+    cases = [('health', 'GET', '/health', None, 0, 1)]
+    for samples in samples_grid:
+        if samples > MAX_HTTP_SAMPLES:
+            continue
+        logs = frame_logs(synthetic_frame(samples))
+        body = json.dumps({'matchId': 'bench', 'roundNumber': 1, 'telemetry': logs}).encode('utf-8')
+        cases.append((f'analyze-stability/{samples}', 'POST', '/analyze-stability', body, samples, 1))
+        for drones in drones_grid:
+            if drones < 2 or drones * samples > MAX_TRANSPORT_SAMPLES:
+                continue
+            frames = [synthetic_frame(samples, seed, f'D{seed}') for seed in range(drones)]
+            teams = [
+                {'team_id': team, 'drones': [{'drone_id': f.drone_id, 'logs': frame_logs(f)}
+                                             for f in frames[half::2]]}
+                for team, half in (('A', 0), ('B', 1))
+            ]
+            body = json.dumps({'match_id': 'bench', 'teams': teams}).encode('utf-8')
+            cases.append((f'batch-analyze/{drones}x{samples}', 'POST', '/batch-analyze', body,
+                          drones * samples, drones))
+
+    try:
+        for name, method, path, body, total, drones in cases:
+            for reuse in (False, True):
+                for transport, connect in connectors.items():
+                    record(f"transport/{transport}/{'keepalive' if reuse else 'connect'}/{name}",
+                           requester(connect, reuse, method, path, body), max(total, 1),
+                           samples=total // drones, drones=drones, bytes=len(body or b''))
+    finally:
+        server.terminate()
+        server.join()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        os.rmdir(directory)
+
+
+def compare(results, baseline, threshold):
+    """Cases whose p50 grew by more than threshold (fraction) over the baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before or not before.get('p50_ms'):
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1
+        if change > threshold:
+            regressions.append({'case': name, 'baseline_ms': before['p50_ms'],
+                                'current_ms': result['p50_ms'], 'change': round(change, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the ML stability service')
+    parser.add_argument('--full', action='store_true', help='10..1,000,000 samples and 1..64 drones')
+    parser.add_argument('--samples', type=int, nargs='*', help='override samples-per-drone grid')
+    parser.add_argument('--drones', type=int, nargs='*', help='override drones-per-batch grid')
+    parser.add_argument('--no-reference', action='store_true', help='skip timing the reference implementation')
+    parser.add_argument('--transport', action='store_true',
+                        help='also time round trips over TCP loopback and a Unix domain socket')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--save-baseline', metavar='PATH', help='store results as the new baseline')
+    parser.add_argument('--compare', metavar='PATH', help='baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed p50 slowdown as a fraction (default 0.25)')
+    args = parser.parse_args(argv)
+
+    samples_grid = args.samples or (FULL_SAMPLES if args.full else QUICK_SAMPLES)
+    drones_grid = args.drones or (FULL_DRONES if args.full else QUICK_DRONES)
+
+    print('Checking engine against the reference implementation...')
+    mismatches = check_equivalence(samples_grid)
+    for mismatch in mismatches:
+        print(f"  MISMATCH {mismatch['samples']} samples seed {mismatch['seed']}: {mismatch['problems']}")
+    print(f"  {'OK' if not mismatches else f'{len(mismatches)} mismatches'}")
+
+    print('Checking every engine against the full-array engine...')
+    engine_mismatches, engine_worst = check_engines(samples_grid)
+    for case, differences in engine_worst.items():
+        print(f"  {case:<23} " + '  '.join(f'{key} {value:.3g}' for key, value in sorted(differences.items())))
+    for mismatch in engine_mismatches:
+        print(f"  MISMATCH {mismatch['engine']} {mismatch['method']} {mismatch['samples']} samples "
+              f"seed {mismatch['seed']}: {mismatch['problems']}")
+    print(f"  {'OK' if not engine_mismatches else f'{len(engine_mismatches)} mismatches'}")
+
+    print('Checking peak memory against ML_MEMORY_LIMIT_MB...')
+    overages = check_memory(FULL_MEMORY_CASES if args.full else QUICK_MEMORY_CASES)
+    for overage in overages:
+        print(f"  OVER {overage['samples']} samples {overage['method']}: "
+              f"{overage['peak_mb']} MiB > {overage['limit_mb']} MiB")
+    print(f"  {'OK' if not overages else f'{len(overages)} over the limit'}")
+
+    print('Checking service regressions...')
+    service_failures = {name: problems for name, problems in check_service().items() if problems}
+    for name, problems in service_failures.items():
+        print(f"  FAILED {name}: {problems}")
+    print(f"  {'OK' if not service_failures else f'{len(service_failures)} failed'}")
+
+    results = run(samples_grid, drones_grid, include_reference=not args.no_reference, transport=args.transport)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'mismatches': mismatches,
+        'engine_mismatches': engine_mismatches,
+        'engine_differences': engine_worst,
+        'memory_overages': overages,
+        'service_failures': service_failures,
+        'results': results
+    }
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f'Wrote {path}')
+
+    failed = bool(mismatches or engine_mismatches or overages or service_failures)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"  SLOWER {regression['case']}: {regression['baseline_ms']} ms -> "
+                  f"{regression['current_ms']} ms (+{regression['change']:.0%})")
+        print(f'{len(regressions)} regressions beyond {args.threshold:.0%}')
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# ml-service/columnar.py
+"""
+Binary columnar telemetry format
+Lets clients post packed per-axis arrays instead of JSON arrays of objects
+
+Layout (all integers little-endian):
+    0   4 bytes  magic b'DRNA'
+    4   u8       version (1)
+    5   u8       itemsize of the float columns (4 = float32, 8 = float64)
+    6   u16      flags (bit 0: timestamp column, bit 1: battery column)
+    8   u32      header length H
+    12  H bytes  UTF-8 JSON header:
+                 {"matchId": ..., "roundNumber": ...,
+                  "drones": [{"droneId": "R1", "teamId": "...", "count": n}, ...]}
+                 a drone entry may also carry its own matchId / roundNumber
+    then zero padding up to a multiple of 8 bytes, then for every drone in
+    header order: x, y, z, pitch, roll, yaw[, timestamp][, battery] columns,
+    each `count` little-endian floats; the timestamp column is always float64
+    so epoch milliseconds survive float32 payloads
+"""
+
+import json
+import struct
+
+import numpy as np
+
+import metrics
+from stability import AXES, TelemetryFrame
+
+CONTENT_TYPE = 'application/x-drone-telemetry'
+
+MAGIC = b'DRNA'
+VERSION = 1
+FLAG_TIMESTAMP = 0x1
+FLAG_BATTERY = 0x2
+
+_PREFIX = struct.Struct('<4sBBHI')
+_DTYPES = {4: np.dtype('<f4'), 8: np.dtype('<f8')}
+
+
+class ColumnarFormatError(ValueError):
+    """Raised when a columnar payload cannot be parsed"""
+
+
+def _padded(length):
+    return (length + 7) & ~7
+
+
+def parse_columnar(body):
+    """Parse a columnar payload into (header, [TelemetryFrame, ...])"""
+    with metrics.stage('parse'):
+        return _parse_columnar(body)
+
+
+def _parse_columnar(body):
+    if len(body) < _PREFIX.size:
+        raise ColumnarFormatError('payload shorter than header prefix')
+
+    magic, version, itemsize, flags, header_len = _PREFIX.unpack_from(body, 0)
+    if magic != MAGIC:
+        raise ColumnarFormatError('bad magic')
+    if version != VERSION:
+        raise ColumnarFormatError(f'unsupported version {version}')
+    if itemsize not in _DTYPES:
+        raise ColumnarFormatError(f'unsupported float size {itemsize}')
+
+    header_end = _PREFIX.size + header_len
+    if len(body) < header_end:
+        raise ColumnarFormatError('truncated header')
+    try:
+        header = json.loads(bytes(body[_PREFIX.size:header_end]).decode('utf-8'))
+    except ValueError as e:
+        raise ColumnarFormatError(f'bad header: {e}')
+    if not isinstance(header, dict):
+        raise ColumnarFormatError('header must be a JSON object')
+    drones = header.get('drones', [])
+    if not isinstance(drones, list) or not all(isinstance(drone, dict) for drone in drones):
+        raise ColumnarFormatError('header drones must be a list of objects')
+
+    dtype = _DTYPES[itemsize]
+    has_timestamp = bool(flags & FLAG_TIMESTAMP)
+    has_battery = bool(flags & FLAG_BATTERY)
+
+    offset = _padded(header_end)
+    frames = []
+    for drone in drones:
+        count = drone.get('count', 0)
+        # bool is an int subclass, but never a sample count
+        if not isinstance(count, int) or isinstance(count, bool):
+            raise ColumnarFormatError(f"count of drone {drone.get('droneId')} must be an integer")
+        size = count * (len(AXES) * itemsize + 8 * has_timestamp + itemsize * has_battery)
+        if count < 0 or offset + size > len(body):
+            raise ColumnarFormatError(f"truncated columns for drone {drone.get('droneId')}")
+
+        # Zero-copy views over the request body (float64 axes are never copied)
+        values = np.frombuffer(body, dtype=dtype, count=len(AXES) * count, offset=offset)
+        offset += len(AXES) * count * itemsize
+
+        timestamps = None
+        battery = None
+        if has_timestamp:
+            timestamps = np.frombuffer(body, dtype=_DTYPES[8], count=count, offset=offset)
+            offset += count * 8
+        if has_battery:
+            battery = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+            battery = battery.astype(np.float64, copy=False)
+            offset += count * itemsize
+
+        frames.append(TelemetryFrame(values.reshape(len(AXES), count),
+                                     drone.get('droneId', 'unknown'), timestamps, battery))
+
+    return header, frames
+
+
+def encode_columnar(frames, match_id=None, round_number=None, team_ids=None, itemsize=8, drone_fields=None):
+    """Encode TelemetryFrames into a columnar payload
+
+    drone_fields optionally gives extra header keys per drone (e.g. its own
+    matchId / roundNumber)
+    """
+    dtype = _DTYPES[itemsize]
+    has_timestamp = bool(frames) and all(frame.timestamps is not None for frame in frames)
+    has_battery = bool(frames) and all(frame.battery is not None for frame in frames)
+    flags = (FLAG_TIMESTAMP if has_timestamp else 0) | (FLAG_BATTERY if has_battery else 0)
+
+    drones = []
+    for i, frame in enumerate(frames):
+        drone = {'droneId': frame.drone_id, 'count': len(frame)}
+        if team_ids is not None:
+            drone['teamId'] = team_ids[i]
+        if drone_fields is not None:
+            drone.update({key: value for key, value in drone_fields[i].items() if key not in drone})
+        drones.append(drone)
+
+    header = json.dumps({
+        'matchId': match_id,
+        'roundNumber': round_number,
+        'drones': drones
+    }).encode('utf-8')
+
+    head = _PREFIX.pack(MAGIC, VERSION, itemsize, flags, len(header)) + header
+    parts = [head, b'\0' * (_padded(len(head)) - len(head))]
+    for frame in frames:
+        parts.append(frame.values.astype(dtype, copy=False).tobytes())
+        if has_timestamp:
+            parts.append(frame.timestamps.astype(_DTYPES[8], copy=False).tobytes())
+        if has_battery:
+            parts.append(frame.battery.astype(dtype, copy=False).tobytes())
+    return b''.join(parts)
@@ -0,0 +1,38 @@
+# ml-service/gunicorn.conf.py
+"""
+Gunicorn settings for the production ML service
+Launch from ml-service/:  gunicorn -c gunicorn.conf.py wsgi:app
+Every setting can be overridden through the environment
+"""
+
+import multiprocessing
+import os
+
+bind = [f"{os.environ.get('ML_SERVICE_HOST', '0.0.0.0')}:{os.environ.get('ML_SERVICE_PORT', '5001')}"]
+# A backend on the same machine can skip TCP through a Unix domain socket
+if os.environ.get('ML_SERVICE_SOCKET'):
+    bind.append(f"unix:{os.environ['ML_SERVICE_SOCKET']}")
+# Only the service's user and group may connect to the socket
+umask = 0o007
+
+# One process per core; threads overlap request parsing and I/O inside a worker
+workers = int(os.environ.get('ML_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('ML_THREADS', 4))
+worker_class = 'gthread'
+
+# Import NumPy and the analysis modules once in the master, then fork
+preload_app = True
+
+# A hung analysis is killed after `timeout`; SIGTERM lets in-flight requests
+# finish for up to `graceful_timeout` seconds
+timeout = int(os.environ.get('ML_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('ML_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so memory from huge rounds is returned
+max_requests = int(os.environ.get('ML_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('ML_LOG_LEVEL', 'info').lower()
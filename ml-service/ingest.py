@@ -0,0 +1,245 @@
+# ml-service/ingest.py
+"""
+Analysis of stored telemetry read straight from local files
+Two sources are understood:
+  - NDJSON exports of the DroneTelemetry collection (mongoexport), one
+    {matchId, teamId, droneId, roundNumber, logs: [...]} document per line.
+    Lines that cannot pass the match / drone filters are skipped before
+    they are parsed
+  - columnar files (the columnar.py layout, extension .drna) opened with
+    np.memmap, so only the pages of the selected drones are ever read.
+    A drone entry may carry its own matchId / roundNumber, overriding the
+    file-level ones, so one file can hold a whole tournament
+A directory is read file by file in name order. Drones are analyzed in
+batches of about BATCH_SAMPLES samples, so memory stays bounded however
+large the export
+
+CLI (from ml-service/):
+    python ingest.py exports/telemetry.ndjson --match <matchId> --round 2
+    python ingest.py exports/ --drone R1 --output rescored.ndjson
+    python ingest.py exports/telemetry.ndjson --to-columnar columns/telemetry.drna
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+import columnar
+from stability import TelemetryFrame, analyze_frames
+
+# Root directory the /analyze-file endpoint may read from (unset = endpoint off)
+DATA_DIR = os.environ.get('ML_DATA_DIR', '')
+# Samples analyzed per analyze_frames call
+BATCH_SAMPLES = 1_000_000
+BATCH_DRONES = 64
+
+COLUMNAR_SUFFIXES = ('.drna',)
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl', '.json')
+
+# mongoexport wraps ids and (in canonical mode) numbers in one-key objects
+_EXTENDED_JSON = {
+    '$oid': str, '$numberInt': int, '$numberLong': int, '$numberDouble': float, '$numberDecimal': float
+}
+
+
+class IngestError(ValueError):
+    """Raised when a telemetry file cannot be located or read"""
+
+
+def data_path(path, root=None):
+    """Absolute path of a client-supplied path, which must stay inside root"""
+    root = os.path.realpath(root or DATA_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise IngestError(f'{path} is outside the data directory')
+    if not os.path.exists(resolved):
+        raise FileNotFoundError(f'{path} does not exist')
+    return resolved
+
+
+def _plain(value):
+    """Unwrap extended-JSON values ({'$oid': ...}, {'$numberDouble': ...}) recursively"""
+    if isinstance(value, dict):
+        if len(value) == 1:
+            key, inner = next(iter(value.items()))
+            if key in _EXTENDED_JSON:
+                return _EXTENDED_JSON[key](inner)
+        return {key: _plain(inner) for key, inner in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _matches(meta, match_id, round_number, drone_id):
+    return ((match_id is None or str(meta['matchId']) == str(match_id)) and
+            (round_number is None or str(meta['roundNumber']) == str(round_number)) and
+            (drone_id is None or str(meta['droneId']) == str(drone_id)))
+
+
+def read_ndjson(path, match_id=None, round_number=None, drone_id=None):
+    """(meta, TelemetryFrame) for each matching document of an NDJSON export"""
+    # A document can only match if the filter values appear in its line
+    needles = [str(value).encode('utf-8') for value in (match_id, drone_id) if value is not None]
+    with open(path, 'rb') as lines:
+        for number, line in enumerate(lines, 1):
+            if not line.strip() or not all(needle in line for needle in needles):
+                continue
+            try:
+                doc = json.loads(line)
+            except ValueError as e:
+                raise IngestError(f'{os.path.basename(path)} line {number}: {e}')
+            if b'"$' in line:
+                doc = _plain(doc)
+
+            meta = {
+                'matchId': doc.get('matchId'),
+                'roundNumber': doc.get('roundNumber'),
+                'teamId': doc.get('teamId'),
+                'droneId': doc.get('droneId', 'unknown')
+            }
+            if _matches(meta, match_id, round_number, drone_id):
+                yield meta, TelemetryFrame.from_logs(doc.get('logs') or [], meta['droneId'])
+
+
+def read_columnar(path, match_id=None, round_number=None, drone_id=None):
+    """(meta, TelemetryFrame) for each matching drone of a memory-mapped columnar file"""
+    body = np.memmap(path, dtype=np.uint8, mode='r')
+    # Frames are views into the mapping: nothing is read until a drone is analyzed
+    header, frames = columnar.parse_columnar(body)
+    for drone, frame in zip(header.get('drones', []), frames):
+        meta = {
+            'matchId': drone.get('matchId', header.get('matchId')),
+            'roundNumber': drone.get('roundNumber', header.get('roundNumber')),
+            'teamId': drone.get('teamId', header.get('teamId')),
+            'droneId': frame.drone_id
+        }
+        if _matches(meta, match_id, round_number, drone_id):
+            yield meta, frame
+
+
+def _is_columnar(path):
+    if path.lower().endswith(COLUMNAR_SUFFIXES):
+        return True
+    if path.lower().endswith(NDJSON_SUFFIXES):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(columnar.MAGIC)) == columnar.MAGIC
+
+
+def telemetry_files(path):
+    """The file itself, or a directory's telemetry files in name order"""
+    if not os.path.isdir(path):
+        return [path]
+    return [os.path.join(path, name) for name in sorted(os.listdir(path))
+            if name.lower().endswith(COLUMNAR_SUFFIXES + NDJSON_SUFFIXES)]
+
+
+def read_telemetry(path, match_id=None, round_number=None, drone_id=None):
+    """(meta, TelemetryFrame) for every matching drone round under path"""
+    for file_path in telemetry_files(path):
+        reader = read_columnar if _is_columnar(file_path) else read_ndjson
+        yield from reader(file_path, match_id, round_number, drone_id)
+
+
+def analyze_path(path, match_id=None, round_number=None, drone_id=None, **options):
+    """(meta, result) for every matching drone round under path, analyzed in batches
+
+    options are passed to analyze_frames
+    """
+    batch = []
+    samples = 0
+    for meta, frame in read_telemetry(path, match_id, round_number, drone_id):
+        batch.append((meta, frame))
+        samples += len(frame)
+        if samples >= BATCH_SAMPLES or len(batch) >= BATCH_DRONES:
+            yield from _analyze_batch(batch, options)
+            batch = []
+            samples = 0
+    if batch:
+        yield from _analyze_batch(batch, options)
+
+
+def _analyze_batch(batch, options):
+    metas = [meta for meta, _ in batch]
+    frames = [frame for _, frame in batch]
+    results = analyze_frames(frames, [meta['droneId'] for meta in metas], **options)
+    return zip(metas, results)
+
+
+def write_columnar(path, source, match_id=None, round_number=None, drone_id=None, itemsize=8):
+    """Convert telemetry under source into one columnar file; returns the drone count
+
+    Every drone entry carries its own matchId / roundNumber / teamId, so
+    the file can mix rounds. The converted telemetry is held in memory
+    until written
+    """
+    frames = []
+    drones = []
+    for meta, frame in read_telemetry(source, match_id, round_number, drone_id):
+        frames.append(frame)
+        drones.append(meta)
+
+    with open(path, 'wb') as out:
+        out.write(columnar.encode_columnar(frames, itemsize=itemsize, drone_fields=drones))
+    return len(frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze stored drone telemetry from NDJSON or columnar files')
+    parser.add_argument('path', help='telemetry file, or a directory of .ndjson / .jsonl / .drna files')
+    parser.add_argument('--match', help='only this matchId')
+    parser.add_argument('--round', help='only this roundNumber')
+    parser.add_argument('--drone', help='only this droneId')
+    parser.add_argument('--oscillation-method', help='spectral or sign_change')
+    parser.add_argument('--max-points', type=int, help='downsample drones with more samples than this')
+    parser.add_argument('--missing', help='missing-value policy: interpolate, drop or reject')
+    parser.add_argument('--timeline', action='store_true', help='add per-window stability curves')
+    parser.add_argument('--resample', type=float, help='resample every drone onto a shared grid of this many Hz')
+    parser.add_argument('--scorer', help='formula or model (the ML_ANOMALY_MODEL anomaly model)')
+    parser.add_argument('--output', help='write NDJSON results here instead of stdout')
+    parser.add_argument('--record', action='store_true', help='store round summaries in ML_SUMMARY_DB')
+    parser.add_argument('--to-columnar', metavar='FILE', help='convert to a columnar file instead of analyzing')
+    parser.add_argument('--itemsize', type=int, choices=(4, 8), default=8,
+                        help='float size of converted columns (4 = float32)')
+    args = parser.parse_args(argv)
+    if args.record and not os.environ.get('ML_SUMMARY_DB'):
+        parser.error('--record needs ML_SUMMARY_DB set to the SQLite file to store into')
+
+    if args.to_columnar:
+        count = write_columnar(args.to_columnar, args.path, args.match, args.round, args.drone, args.itemsize)
+        print(f'Wrote {count} drone rounds to {args.to_columnar}', file=sys.stderr)
+        return 0
+
+    # The response shape and summary store are the service's own; the store opens on import
+    if not args.record:
+        os.environ['ML_SUMMARY_DB'] = ''
+    from responses import file_result, record_summaries
+
+    options = {
+        'oscillation_method': args.oscillation_method,
+        'max_points': args.max_points,
+        'missing_policy': args.missing,
+        'timeline': args.timeline,
+        'resample_rate': args.resample,
+        'scorer': args.scorer
+    }
+    out = open(args.output, 'w') if args.output else sys.stdout
+    count = 0
+    try:
+        for meta, result in analyze_path(args.path, args.match, args.round, args.drone, **options):
+            if args.record:
+                record_summaries([result], meta['matchId'], meta['roundNumber'], meta['teamId'])
+            out.write(json.dumps(file_result(meta, result)) + '\n')
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f'Analyzed {count} drone rounds', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,341 @@
+# ml-service/jobs.py
+"""
+Asynchronous analysis jobs
+A submitted analysis becomes a Job on a bounded queue served by a fixed
+pool of worker threads, so a burst of end-of-match requests waits in line
+instead of tying up request threads until the client times out. Clients
+poll (or long-poll) the job for its result. A full queue is refused up
+front with an estimate of when to retry. A job runs in the worker process
+that accepted it, but its state and result are kept in a SQLite file every
+worker reads, so a poll or cancel may reach any worker
+"""
+
+import json
+import math
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+import metrics
+
+JOB_WORKERS = int(os.environ.get('ML_JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.environ.get('ML_JOB_QUEUE', '64'))
+# Finished jobs are kept this many seconds for clients to collect
+JOB_RETENTION = float(os.environ.get('ML_JOB_RETENTION', '600'))
+# Longest a single long-poll may block
+JOB_MAX_WAIT = float(os.environ.get('ML_JOB_MAX_WAIT', '30'))
+# SQLite file shared by the worker processes for job state and results
+JOB_DB = os.environ.get('ML_JOB_DB') or os.path.join(tempfile.gettempdir(), 'drone-arena-ml-jobs.db')
+# How often a long-poll for a job of another worker re-reads its state
+JOB_POLL_INTERVAL = 0.1
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pid INTEGER,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result_status INTEGER,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
+"""
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when no queue slot is free"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Job queue is full; retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class Job:
+    """One queued analysis; run() returns (http_status, json_payload)"""
+
+    def __init__(self, kind, run, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.run = run
+        self.status = 'queued'
+        self.pid = os.getpid()
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result_status = None
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.finished = threading.Event()
+
+    @classmethod
+    def from_row(cls, row):
+        """A job as stored, without its run function"""
+        job = cls(row['kind'], None, row['job_id'])
+        job.status = row['status']
+        job.pid = row['pid']
+        job.submitted_at = row['submitted_at']
+        job.started_at = row['started_at']
+        job.finished_at = row['finished_at']
+        job.cancel_requested = bool(row['cancel_requested'])
+        job.result_status = row['result_status']
+        job.result = json.loads(row['result']) if row['result'] is not None else None
+        job.error = row['error']
+        return job
+
+    def timing(self):
+        """Queue and run time in ms (so far, for unfinished jobs)"""
+        now = time.time()
+        started = self.started_at or (None if self.finished_at else now)
+        return {
+            'submittedAt': self.submitted_at,
+            'queuedMs': round(((started or self.finished_at) - self.submitted_at) * 1000, 2),
+            'runMs': round(((self.finished_at or now) - self.started_at) * 1000, 2) if self.started_at else None
+        }
+
+    def to_dict(self):
+        job = {'jobId': self.id, 'kind': self.kind, 'status': self.status, 'timing': self.timing()}
+        if self.status == 'running' and self.cancel_requested:
+            job['cancelRequested'] = True
+        if self.status == 'done':
+            job['resultStatus'] = self.result_status
+            job['result'] = self.result
+        elif self.status == 'failed':
+            job['error'] = self.error
+        return job
+
+
+def _alive(pid):
+    """Whether a process of this machine is still running (assumed so where that cannot be checked)"""
+    if os.name == 'nt' or pid is None:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class JobStore:
+    """Job state and results in SQLite, shared by every worker process"""
+
+    def __init__(self, path=JOB_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connection = None
+
+    def _db(self):
+        """This process's connection; a preloaded app must not share one across fork"""
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            with self.connection:
+                # WAL lets several worker processes read while one writes
+                self.connection.execute('PRAGMA journal_mode=WAL')
+                self.connection.executescript(_SCHEMA)
+            self.pid = os.getpid()
+        return self.connection
+
+    def _update(self, query, params):
+        with self.lock, self._db() as db:
+            return db.execute(query, params).rowcount
+
+    def add(self, job):
+        self._update('INSERT INTO jobs (job_id, kind, status, pid, submitted_at) VALUES (?, ?, ?, ?, ?)',
+                     (job.id, job.kind, job.status, job.pid, job.submitted_at))
+
+    def get(self, job_id):
+        with self.lock:
+            row = self._db().execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    def start(self, job):
+        """Mark a queued job running; False when it was cancelled meanwhile"""
+        return self._update("UPDATE jobs SET status = 'running', started_at = ? WHERE job_id = ? AND status = 'queued'",
+                            (job.started_at, job.id)) == 1
+
+    def finish(self, job):
+        result = json.dumps(job.result) if job.result is not None else None
+        self._update('UPDATE jobs SET status = ?, finished_at = ?, result_status = ?, result = ?, error = ? '
+                     'WHERE job_id = ?', (job.status, job.finished_at, job.result_status, result, job.error, job.id))
+
+    def cancel_queued(self, job_id, finished_at):
+        """Cancel a job that has not started; False when it already has"""
+        return self._update("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                            (finished_at, job_id)) == 1
+
+    def request_cancel(self, job_id):
+        self._update("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,))
+
+    def cancel_requested(self, job_id):
+        with self.lock:
+            row = self._db().execute('SELECT cancel_requested FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def expire(self, cutoff):
+        self._update('DELETE FROM jobs WHERE finished_at < ?', (cutoff,))
+
+    def counts(self):
+        with self.lock:
+            rows = self._db().execute('SELECT status, COUNT(*) AS jobs FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['jobs'] for row in rows}
+
+
+class JobQueue:
+    """Bounded FIFO of jobs run by a fixed pool of daemon threads in each worker process"""
+
+    def __init__(self, workers=JOB_WORKERS, capacity=JOB_QUEUE_SIZE, retention=JOB_RETENTION, store=None):
+        self.workers = max(1, workers)
+        self.capacity = capacity
+        self.retention = retention
+        self.store = store or JobStore()
+        self.queue = queue.Queue(capacity)
+        # Unfinished jobs of this process, for their run functions and finished events
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.pid = None
+        self.running = 0
+        # Moving average of run time, for Retry-After estimates
+        self.mean_run_seconds = 1.0
+
+    def _start(self):
+        """Start the worker threads in this process (threads do not survive a gunicorn fork)"""
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.queue = queue.Queue(self.capacity)
+            self.jobs = {}
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f'ml-job-{i}', daemon=True).start()
+
+    def submit(self, kind, run):
+        """Queue a job; raises QueueFull when every slot is taken"""
+        job = Job(kind, run)
+        with self.lock:
+            self._start()
+            self.store.expire(time.time() - self.retention)
+            if self.queue.full():
+                metrics.JOBS.inc(kind=kind, status='rejected')
+                raise QueueFull(self.retry_after())
+            self.store.add(job)
+            self.jobs[job.id] = job
+            self.queue.put_nowait(job)
+        metrics.JOB_QUEUE_DEPTH.set(self.queue.qsize())
+        return job
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up"""
+        return max(1, math.ceil(self.mean_run_seconds / self.workers))
+
+    def get(self, job_id):
+        """The job as stored; an unfinished job whose worker process is gone is marked failed"""
+        job = self.store.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES and not _alive(job.pid):
+            job.status = 'failed'
+            job.error = 'The worker process running this job exited'
+            job.finished_at = time.time()
+            self.store.finish(job)
+        return job
+
+    def wait(self, job_id, timeout):
+        """The job once finished or after timeout seconds, whichever comes first"""
+        deadline = time.monotonic() + min(timeout, JOB_MAX_WAIT)
+        with self.lock:
+            local = self.jobs.get(job_id) if self.pid == os.getpid() else None
+        # A job of this process wakes the wait when it finishes; one of
+        # another worker (or cancelled there) is seen on the next re-read
+        pause = local.finished.wait if local is not None else time.sleep
+        job = self.get(job_id)
+        while job is not None and job.status not in FINISHED_STATES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            pause(min(JOB_POLL_INTERVAL, remaining))
+            job = self.get(job_id)
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a queued job; a running one finishes but its result is discarded"""
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        if self.store.cancel_queued(job_id, time.time()):
+            metrics.JOBS.inc(kind=job.kind, status='cancelled')
+            with self.lock:
+                local = self.jobs.pop(job_id, None) if self.pid == os.getpid() else None
+            if local is not None:
+                local.run = None
+                local.finished.set()
+        else:
+            self.store.request_cancel(job_id)
+        return self.get(job_id)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        job.run = None
+        self.store.finish(job)
+        with self.lock:
+            self.jobs.pop(job.id, None)
+        job.finished.set()
+        metrics.JOBS.inc(kind=job.kind, status=status)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            metrics.JOB_QUEUE_DEPTH.set(self.queue.qsize())
+            job.started_at = time.time()
+            if not self.store.start(job):
+                # Cancelled while it waited
+                with self.lock:
+                    self.jobs.pop(job.id, None)
+                job.finished.set()
+                continue
+            job.status = 'running'
+            with self.lock:
+                self.running += 1
+            metrics.JOB_SECONDS.observe(job.started_at - job.submitted_at, phase='queue')
+
+            status = 'done'
+            try:
+                job.result_status, job.result = job.run()
+            except Exception as e:
+                job.error = str(e)
+                status = 'failed'
+
+            if self.store.cancel_requested(job.id):
+                job.result_status = job.result = None
+                status = 'cancelled'
+            with self.lock:
+                self.running -= 1
+            self._finish(job, status)
+            run_seconds = job.finished_at - job.started_at
+            with self.lock:
+                self.mean_run_seconds += 0.2 * (run_seconds - self.mean_run_seconds)
+            metrics.JOB_SECONDS.observe(run_seconds, phase='run')
+
+    def stats(self):
+        """This worker's queue and threads, and job counts across all workers"""
+        states = self.store.counts()
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'capacity': self.capacity,
+                'queued': self.queue.qsize(),
+                'running': self.running,
+                'jobs': states,
+                'meanRunMs': round(self.mean_run_seconds * 1000, 2)
+            }
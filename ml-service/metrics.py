@@ -0,0 +1,207 @@
+# ml-service/metrics.py
+"""
+In-process metrics rendered in the Prometheus text exposition format
+Counters, gauges and histograms are plain thread-safe objects; the
+registry renders them for the /metrics endpoint
+"""
+
+import bisect
+import threading
+import time
+
+# Seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bytes
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+# Uncompressed / compressed size
+RATIO_BUCKETS = (1.5, 2, 3, 5, 8, 12, 20, 50)
+# Telemetry samples
+COUNT_BUCKETS = (10, 100, 1e3, 1e4, 1e5, 1e6)
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+    def _samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f'{self.name}{_label_text(self.labelnames, key)} {_number(value)}' for key, value in items]
+
+
+class Gauge(Counter):
+    """Value that goes up and down"""
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+
+    def observe(self, value, **labels):
+        self._record(self._key(labels), value)
+
+    def _record(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Observe the duration of a with-block"""
+        return _Timer(self, self._key(labels))
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+
+    def _samples(self):
+        with self.lock:
+            items = sorted(
+                (key, (list(counts), total, count)) for key, (counts, total, count) in self.series.items()
+            )
+
+        lines = []
+        names = self.labelnames + ('le',)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_label_text(names, key + (_number(bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_label_text(self.labelnames, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_label_text(self.labelnames, key)} {count}')
+        return lines
+
+
+class _Timer:
+    """Context manager behind Histogram.time (cheaper per block than @contextmanager)"""
+    __slots__ = ('histogram', 'key', 'started')
+
+    def __init__(self, histogram, key):
+        self.histogram = histogram
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram._record(self.key, time.perf_counter() - self.started)
+        return False
+
+
+REGISTRY = []
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def reset():
+    """Forget every observation (used after the boot warmup)"""
+    for metric in REGISTRY:
+        metric.reset()
+
+
+def render():
+    """All registered metrics in Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Service metrics
+
+STAGE_SECONDS = Histogram(
+    'ml_stage_duration_seconds', 'Time spent in each analysis stage', ('stage',))
+REQUEST_SECONDS = Histogram(
+    'ml_request_duration_seconds', 'End-to-end request latency', ('endpoint',))
+PAYLOAD_BYTES = Histogram(
+    'ml_request_payload_bytes', 'Request body size', ('endpoint',), SIZE_BUCKETS)
+RESPONSE_BYTES = Histogram(
+    'ml_response_body_bytes', 'Response body size as sent', ('encoding',), SIZE_BUCKETS)
+COMPRESSION_RATIO = Histogram(
+    'ml_compression_ratio', 'Uncompressed / compressed body size', ('direction',), RATIO_BUCKETS)
+SAMPLES = Histogram(
+    'ml_analysis_samples', 'Telemetry samples per analyzed drone', buckets=COUNT_BUCKETS)
+DRONES = Counter(
+    'ml_analyzed_drones_total', 'Drones analyzed')
+REQUESTS = Counter(
+    'ml_requests_total', 'Requests handled', ('endpoint', 'status'))
+ERRORS = Counter(
+    'ml_request_errors_total', 'Requests answered with a 4xx/5xx status', ('endpoint', 'status'))
+IN_FLIGHT = Gauge(
+    'ml_requests_in_flight', 'Requests currently being handled')
+JOBS = Counter(
+    'ml_jobs_total', 'Analysis jobs by final status (rejected = queue full)', ('kind', 'status'))
+JOB_SECONDS = Histogram(
+    'ml_job_duration_seconds', 'Time analysis jobs spend queued and running', ('phase',))
+JOB_QUEUE_DEPTH = Gauge(
+    'ml_job_queue_depth', 'Analysis jobs waiting for a worker')
+
+
+def stage(name):
+    """Time an analysis stage: with metrics.stage('variance'): ..."""
+    return STAGE_SECONDS.time(stage=name)
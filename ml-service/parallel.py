@@ -0,0 +1,129 @@
+# ml-service/parallel.py
+"""
+Split-and-merge analysis of one very long drone log across a process pool
+The series is copied once into shared memory and cut into one segment per
+worker. Pass one returns a ChunkAccumulator per segment (moments, sign
+changes, jerk and the boundary samples), merged in order into the
+whole-series accumulator. Pass two counts spikes per segment against the
+merged moments while the parent runs the spectral transform. The result
+equals analyze_drone's up to float rounding, except that a spectral
+transform too large for the memory limit is summed over float32 blocks as
+in the chunked engine. The shared copy (48 bytes per sample) is not
+counted against the limit
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from stability import (AXES, AXIS_INDEX, FULL_BYTES_PER_SAMPLE, OSCILLATION_METHOD, POSITION_AXES, SPIKE_THRESHOLD,
+                       ChunkAccumulator, FrameBatch, block_pass, chunk_size, feature_dict, sign_change_oscillation,
+                       spectral_features, spectral_oscillation)
+
+# Worker processes (0 = never split) and the shortest series worth splitting
+PARALLEL_WORKERS = int(os.environ.get('ML_PARALLEL_WORKERS', '0'))
+PARALLEL_MIN_POINTS = int(os.environ.get('ML_PARALLEL_MIN_POINTS', '1000000'))
+# Samples a worker folds at a time, bounding its temporaries
+WORKER_BLOCK = 1 << 20
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def executor(workers=None):
+    """The pool of that many processes (default ML_PARALLEL_WORKERS), started on first use (after any gunicorn fork)"""
+    workers = workers or PARALLEL_WORKERS
+    with _executor_lock:
+        if workers not in _executors:
+            # spawn: forking a threaded server process is unsafe, and it is the only
+            # start method on Windows
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(pool.shutdown)
+            _executors[workers] = pool
+        return _executors[workers]
+
+
+def _attach(name, shape):
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+
+
+def segment_partial(name, shape, start, stop):
+    """Pass one: accumulator of values[:, start:stop]"""
+    memory, values = _attach(name, shape)
+    try:
+        accumulator = ChunkAccumulator()
+        for block_start in range(start, stop, WORKER_BLOCK):
+            accumulator.update(values[:, block_start:min(block_start + WORKER_BLOCK, stop)])
+        return accumulator
+    finally:
+        del values
+        memory.close()
+
+
+def segment_spikes(name, shape, start, stop, mean, std):
+    """Pass two: spike counts of values[:, start:stop] against the whole-series moments"""
+    memory, values = _attach(name, shape)
+    try:
+        spikes = np.zeros(len(POSITION_AXES), dtype=np.int64)
+        for i, axis in enumerate(POSITION_AXES):
+            row = AXIS_INDEX[axis]
+            if std[row] > 0:
+                z_scores = np.abs(values[row, start:stop] - mean[row]) / std[row]
+                spikes[i] = np.count_nonzero(z_scores > SPIKE_THRESHOLD)
+        return spikes
+    finally:
+        del values
+        memory.close()
+
+
+def parallel_features(frame, oscillation_method=None, workers=None, memory_limit=0):
+    """Features of one long frame computed across a pool of workers processes (default ML_PARALLEL_WORKERS)
+
+    With a memory_limit (bytes, 0 = unbounded) too small for a full-length
+    transform, the spectral method uses float32 blocks of chunk_size(memory_limit)
+    """
+    oscillation_method = oscillation_method or OSCILLATION_METHOD
+    workers = workers or PARALLEL_WORKERS
+    pool = executor(workers)
+    n = len(frame)
+    shape = (len(AXES), n)
+    bounds = np.linspace(0, n, workers + 1).astype(np.intp)
+    segments = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    memory = shared_memory.SharedMemory(create=True, size=8 * len(AXES) * n)
+    values = None
+    try:
+        values = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        values[:] = frame.values
+
+        partials = pool.map(segment_partial, *zip(*[(memory.name, shape, start, stop) for start, stop in segments]))
+        accumulator = ChunkAccumulator()
+        for partial in partials:
+            accumulator.merge(partial)
+        mean = accumulator.mean
+        variances = accumulator.variances()
+
+        pending = [pool.submit(segment_spikes, memory.name, shape, start, stop, mean, np.sqrt(variances))
+                   for start, stop in segments]
+        if oscillation_method == 'sign_change':
+            oscillation = sign_change_oscillation(accumulator.sign_change_ratios()[:, None], 0)
+        elif memory_limit and n > memory_limit // FULL_BYTES_PER_SAMPLE:
+            _, spectrum = block_pass(frame, chunk_size(memory_limit), mean, accumulator.m2, spikes=False)
+            oscillation = spectral_oscillation(*spectrum, 0)
+        else:
+            dominant, band_ratio = spectral_features(FrameBatch([frame]), mean[:, None], variances[:, None])
+            oscillation = spectral_oscillation(dominant, band_ratio, 0)
+        spikes = sum(future.result() for future in pending)
+    finally:
+        # The view must go before the segment can be closed
+        values = None
+        memory.close()
+        memory.unlink()
+
+    return feature_dict(mean, variances, spikes, oscillation, accumulator.jerk(), n)
@@ -0,0 +1,131 @@
+# ml-service/profiling.py
+"""
+On-demand profiling of analysis requests
+With ML_PROFILE_DIR set, a request is run under cProfile when it carries
+the X-Profile header or when 1-in-N sampling picks it (ML_PROFILE_EVERY,
+or POST /profile at run time). Each profile is written as a .prof file
+(snakeviz, pstats) plus a .txt summary of the top functions, named after
+the endpoint, match and round. Without ML_PROFILE_DIR no request is ever
+profiled and the check costs one attribute lookup
+"""
+
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+
+# Directory profiles are written to (unset = profiling off)
+PROFILE_DIR = os.environ.get('ML_PROFILE_DIR', '')
+# Profile one request in this many (0 = only requests with the header)
+PROFILE_EVERY = int(os.environ.get('ML_PROFILE_EVERY', '0'))
+# Profiles kept on disk; the oldest are removed
+PROFILE_KEEP = int(os.environ.get('ML_PROFILE_KEEP', '50'))
+# Functions listed in each summary
+SUMMARY_LINES = 30
+
+HEADER = 'X-Profile'
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def _part(value):
+    return _UNSAFE.sub('_', str(value))[:64] if value is not None else 'none'
+
+
+class Profiler:
+    """Decides which requests to profile and writes their profiles"""
+
+    def __init__(self, directory=PROFILE_DIR, every=PROFILE_EVERY, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        self.counter = itertools.count(1)
+        # One profile at a time: cProfile cannot nest, and concurrent
+        # requests would only blur each other's timings
+        self.lock = threading.Lock()
+        self.profiled = 0
+        self.skipped = 0
+        self.last = None
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def wanted(self, headers):
+        """Whether a request with these headers is profiled"""
+        if not self.directory:
+            return False
+        if headers.get(HEADER, '').lower() in ('1', 'true', 'yes'):
+            return True
+        return self.every > 0 and next(self.counter) % self.every == 0
+
+    def run(self, func, names):
+        """func() under the profiler; returns (its result, profile path or None)
+
+        names() gives the (endpoint, match, round) of the file name; it is
+        called after func, once the view has read its body. When another
+        profile is running, func runs unprofiled
+        """
+        if not self.lock.acquire(blocking=False):
+            self.skipped += 1
+            return func(), None
+        try:
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                result = func()
+            finally:
+                profile.disable()
+            path = self.write(profile, *names(), elapsed=time.perf_counter() - started)
+            self.profiled += 1
+            self.last = os.path.basename(path)
+            return result, path
+        finally:
+            self.lock.release()
+
+    def write(self, profile, endpoint, match_id, round_number, elapsed):
+        """Save <name>.prof and its top-function summary <name>.txt; returns the .prof path"""
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f'.{int(now * 1000) % 1000:03d}'
+        base = os.path.join(self.directory, f'{stamp}-{_part(endpoint)}-match-{_part(match_id)}-'
+                                            f'round-{_part(round_number)}-{os.getpid()}')
+        profile.dump_stats(base + '.prof')
+
+        summary = io.StringIO()
+        summary.write(f'{endpoint} match {match_id} round {round_number}: {elapsed * 1000:.1f} ms\n\n')
+        stats = pstats.Stats(profile, stream=summary)
+        stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        stats.sort_stats('tottime').print_stats(SUMMARY_LINES)
+        with open(base + '.txt', 'w') as out:
+            out.write(summary.getvalue())
+
+        self.prune()
+        return base + '.prof'
+
+    def prune(self):
+        """Remove the oldest profiles beyond keep"""
+        profiles = sorted(name for name in os.listdir(self.directory) if name.endswith('.prof'))
+        for name in profiles[:max(0, len(profiles) - self.keep)]:
+            for suffix in ('.prof', '.txt'):
+                try:
+                    os.remove(os.path.join(self.directory, name[:-len('.prof')] + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        """Settings and counters"""
+        return {
+            'enabled': self.enabled,
+            'directory': self.directory or None,
+            'every': self.every,
+            'keep': self.keep,
+            'profiled': self.profiled,
+            'skipped': self.skipped,
+            'last': self.last
+        }
@@ -0,0 +1,213 @@
+# ml-service/proximity.py
+"""
+Multi-drone proximity and collision-risk analytics
+Every drone's x / y / z is interpolated onto one tick grid from its
+timestamps (or its sample index at its sample rate when it has none) by
+resample.interpolate. Outside its own time span, and inside a gap in its
+telemetry, a drone has no position. The distances of all drone pairs at
+every tick come from one broadcast subtraction over the upper triangle of
+the pair matrix, done in tick blocks so working memory stays bounded. That
+single (ticks, pairs) array gives each pair's closest approach, its time
+under the threshold and its near-miss events, plus each team's spacing
+"""
+
+import os
+import warnings
+
+import numpy as np
+
+from resample import RESAMPLE_MAX_GAP, interpolate, ordered
+from stability import AXIS_INDEX, POSITION_AXES, sample_rate
+
+# Pairs closer than this many metres are a near miss
+PROXIMITY_THRESHOLD = float(os.environ.get('ML_PROXIMITY_THRESHOLD', '1.0'))
+# Near-miss events returned, closest first
+MAX_EVENTS = 500
+# Ticks whose pair differences are held at once
+TICK_BLOCK = 4096
+# Most ticks of one report; a default tick is widened to fit, a requested one refused
+MAX_TICKS = int(os.environ.get('ML_PROXIMITY_MAX_TICKS', '200000'))
+# Timestamps from here on (1973) are epoch ms; smaller ones count from the drone's start
+EPOCH_MS = 1e11
+
+_POSITION_ROWS = [AXIS_INDEX[axis] for axis in POSITION_AXES]
+
+
+class ProximityError(ValueError):
+    """Raised when a match's telemetry cannot be compared"""
+
+
+def _track(frame):
+    """A frame's sample times (ms, increasing) and (3, n) positions"""
+    frame, times = ordered(frame)
+    return times, frame.values[_POSITION_ROWS]
+
+
+def _epoch(frame):
+    """Whether the frame's sample times are epoch ms rather than relative or synthetic"""
+    times = frame.timestamps
+    if times is None:
+        return False
+    finite = times[np.isfinite(times)]
+    return len(finite) >= 2 and finite.min() >= EPOCH_MS
+
+
+def tick_grid(frames, tick_ms=None):
+    """Tick times (ms) spanning every frame and the tick length, tick_ms or the fastest drone's spacing
+
+    The default tick is widened so the grid has at most MAX_TICKS ticks; a
+    requested tick_ms that needs more is a ProximityError
+    """
+    if tick_ms is not None and not tick_ms > 0:
+        raise ProximityError('tickMs must be positive')
+    clocks = {_epoch(frame) for frame in frames}
+    if len(clocks) > 1:
+        raise ProximityError('drones mix epoch-ms timestamps with relative or missing ones; '
+                             'their times cannot be lined up')
+    spans = [_track(frame)[0] for frame in frames]
+    start = min(times[0] for times in spans)
+    end = max(times[-1] for times in spans)
+    if tick_ms is None:
+        tick_ms = max(1000.0 / max(sample_rate(frame) for frame in frames), (end - start) / (MAX_TICKS - 1))
+    elif (end - start) / tick_ms >= MAX_TICKS:
+        raise ProximityError(f'tickMs {tick_ms:g} gives more than {MAX_TICKS} ticks over '
+                             f'{(end - start) / 1000:g} s; use at least {(end - start) / (MAX_TICKS - 1):.3f}')
+    return start + np.arange(int((end - start) // tick_ms) + 1) * tick_ms, tick_ms
+
+
+def positions_on_grid(frames, grid, max_gap=None):
+    """(ticks, drones, 3) positions interpolated onto grid
+
+    NaN outside each drone's span and inside gaps of more than max_gap
+    seconds (default ML_RESAMPLE_MAX_GAP)
+    """
+    max_gap = RESAMPLE_MAX_GAP if max_gap is None else max_gap
+    tracks = [_track(frame) for frame in frames]
+    interpolated = interpolate(tracks, [grid] * len(frames), max_gap * 1000.0)
+    return np.stack(interpolated).transpose(2, 0, 1)
+
+
+def pair_distances(positions, first, second, block=TICK_BLOCK):
+    """Distances (ticks, pairs) between drones first[p] and second[p] at every tick"""
+    distances = np.empty((positions.shape[0], len(first)))
+    for start in range(0, positions.shape[0], block):
+        chunk = positions[start:start + block]
+        delta = chunk[:, first] - chunk[:, second]
+        distances[start:start + block] = np.sqrt((delta * delta).sum(axis=-1))
+    return distances
+
+
+def _events(close, distances, tick_ms, grid, pairs):
+    """Near-miss episodes (runs of ticks a pair spends under the threshold), closest first, and their count"""
+    ticks = close.shape[0]
+    # Run edges per pair, in (pair, tick) order so starts and ends line up
+    edges = np.diff(np.pad(close.T.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    pair_ids, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    if not len(starts):
+        return [], 0
+
+    # Minimum of each run from one reduceat over the pair-major distances
+    flat = np.append(np.where(np.isnan(distances), np.inf, distances).T.ravel(), np.inf)
+    bounds = np.empty(2 * len(starts), dtype=np.intp)
+    bounds[0::2] = pair_ids * ticks + starts
+    bounds[1::2] = pair_ids * ticks + ends
+    minima = np.minimum.reduceat(flat, bounds)[0::2]
+
+    events = []
+    for e in np.argsort(minima, kind='stable')[:MAX_EVENTS]:
+        run = flat[bounds[2 * e]:bounds[2 * e + 1]]
+        a, b = pairs[pair_ids[e]]
+        events.append({
+            'drones': [a, b],
+            'start': float(grid[starts[e]]),
+            'end': float(grid[ends[e] - 1]),
+            'duration_s': round(float(ends[e] - starts[e]) * tick_ms / 1000, 3),
+            'min_distance': round(float(minima[e]), 4),
+            'at': float(grid[starts[e] + int(run.argmin())])
+        })
+    return events, len(starts)
+
+
+def _team_spacing(positions, distances, teams, first, second, threshold, tick_ms):
+    """Per team: teammate distances, spread about the centroid and time teammates spent too close"""
+    spacing = {}
+    for team in sorted(set(teams), key=str):
+        members = np.array([i for i, t in enumerate(teams) if t == team])
+        inside = np.isin(first, members) & np.isin(second, members)
+        block = {'drones': len(members)}
+        if inside.any():
+            teammates = distances[:, inside]
+            # Ticks where no teammate pair is airborne are all-NaN
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                per_tick = np.nanmean(teammates, axis=1)
+                centroid = np.nanmean(positions[:, members], axis=1, keepdims=True)
+                spread = np.sqrt(np.nanmean(((positions[:, members] - centroid) ** 2).sum(axis=-1), axis=1))
+            block.update({
+                'mean_spacing': round(float(np.nanmean(per_tick)), 4),
+                'min_spacing': round(float(np.nanmin(teammates)), 4),
+                'mean_spread': round(float(np.nanmean(spread)), 4),
+                'time_under_threshold_s': round(float((teammates < threshold).sum()) * tick_ms / 1000, 3)
+            })
+        spacing[team] = block
+    return spacing
+
+
+def proximity_report(frames, team_ids=None, threshold=None, tick_ms=None, max_gap=None):
+    """Pairwise proximity analytics of one match round
+
+    frames are TelemetryFrames (at least two samples each); threshold is in
+    metres, tick_ms in ms; a drone has no position inside a gap of more
+    than max_gap seconds. Returns per-pair closest approach and time under
+    threshold, near-miss events and team spacing; times are on the
+    telemetry's own clock (epoch ms)
+    """
+    threshold = PROXIMITY_THRESHOLD if threshold is None else threshold
+    if not threshold > 0:
+        raise ProximityError('threshold must be positive')
+    if max_gap is not None and not max_gap > 0:
+        raise ProximityError('maxGap must be positive (seconds)')
+    if len(frames) < 2:
+        raise ProximityError('at least two drones with telemetry are needed')
+    team_ids = team_ids if team_ids is not None else [None] * len(frames)
+
+    grid, tick_ms = tick_grid(frames, tick_ms)
+    positions = positions_on_grid(frames, grid, max_gap)
+    first, second = np.triu_indices(len(frames), k=1)
+    distances = pair_distances(positions, first, second)
+
+    with np.errstate(invalid='ignore'):
+        close = distances < threshold
+    masked = np.where(np.isnan(distances), np.inf, distances)
+    closest_tick = masked.argmin(axis=0)
+    closest = masked[closest_tick, np.arange(len(first))]
+    overlap = (~np.isnan(distances)).sum(axis=0)
+
+    names = [frame.drone_id for frame in frames]
+    pairs = [(names[a], names[b]) for a, b in zip(first, second)]
+    pair_stats = []
+    for p in np.argsort(closest, kind='stable'):
+        a, b = first[p], second[p]
+        pair_stats.append({
+            'drones': list(pairs[p]),
+            'teams': [team_ids[a], team_ids[b]],
+            'same_team': team_ids[a] == team_ids[b],
+            'closest_distance': round(float(closest[p]), 4) if overlap[p] else None,
+            'closest_at': float(grid[closest_tick[p]]) if overlap[p] else None,
+            'time_under_threshold_s': round(float(close[:, p].sum()) * tick_ms / 1000, 3),
+            'overlap_s': round(float(overlap[p]) * tick_ms / 1000, 3)
+        })
+
+    events, event_count = _events(close, distances, tick_ms, grid, pairs)
+    return {
+        'threshold': threshold,
+        'tick_ms': round(tick_ms, 3),
+        'ticks': len(grid),
+        'start': float(grid[0]),
+        'end': float(grid[-1]),
+        'pairs': pair_stats,
+        'events': events,
+        'event_count': event_count,
+        'teams': _team_spacing(positions, distances, team_ids, first, second, threshold, tick_ms)
+    }
@@ -0,0 +1,165 @@
+# ml-service/resample.py
+"""
+Time alignment and resampling of drone telemetry
+Drones report at different rates (5 Hz virtual drones, 20 Hz simulators,
+jittery ESP32 timing), so index-based features like jerk and sign changes
+mean different things from drone to drone. Here every series is
+interpolated linearly onto a grid of one fixed rate whose ticks are shared
+by all drones. One np.interp per drone maps the grid to fractional
+sample numbers, and its axes and battery are then blended together from
+those. Where two consecutive samples lie further apart than the
+maximum gap, the grid points between them are left out instead of being
+bridged
+"""
+
+import os
+
+import numpy as np
+
+from telemetry import AXES, AnalysisOptionError, TelemetryFrame, sample_rate
+
+# Grid rate in Hz (0 = off), and the longest gap between samples (seconds)
+# that is interpolated across
+RESAMPLE_RATE = float(os.environ.get('ML_RESAMPLE_RATE', '0'))
+RESAMPLE_MAX_GAP = float(os.environ.get('ML_RESAMPLE_MAX_GAP', '1'))
+# Highest grid rate, and most grid points over all drones of one request
+MAX_RESAMPLE_RATE = 1000.0
+RESAMPLE_MAX_POINTS = int(os.environ.get('ML_RESAMPLE_MAX_POINTS', '2000000'))
+# Grid points blended per pass; keeps the gathered rows in cache
+LERP_BLOCK = 16384
+
+
+def validate_resample_options(rate=None, max_gap=None):
+    """Grid rate (Hz, 0 = off) and maximum gap (seconds), defaulted; raises AnalysisOptionError"""
+    rate = RESAMPLE_RATE if rate is None else rate
+    max_gap = RESAMPLE_MAX_GAP if max_gap is None else max_gap
+    if not 0 <= rate <= MAX_RESAMPLE_RATE:
+        raise AnalysisOptionError(f'resample must be 0 (off) or a rate in Hz up to {MAX_RESAMPLE_RATE:g}')
+    if not max_gap > 0:
+        raise AnalysisOptionError('maxGap must be positive (seconds)')
+    return rate, max_gap
+
+
+def ordered(frame):
+    """The frame with its samples in time order and sample times in ms
+
+    Samples without a finite timestamp are left out; a frame with fewer than
+    two timestamps is spaced at its sample rate from 0
+    """
+    times = frame.timestamps
+    if times is not None:
+        finite = np.isfinite(times)
+        if np.count_nonzero(finite) >= 2:
+            if not finite.all():
+                frame = frame.take(finite)
+                times = frame.timestamps
+            if (np.diff(times) < 0).any():
+                frame = frame.take(np.argsort(times, kind='stable'))
+                times = frame.timestamps
+            return frame, times
+    return frame, np.arange(len(frame)) * (1000.0 / sample_rate(frame))
+
+
+def _gap_mask(times, grid, max_gap_ms):
+    """Grid points strictly between two samples more than max_gap_ms apart (grid increasing)"""
+    gaps = np.flatnonzero(np.diff(times) > max_gap_ms)
+    edges = np.zeros(len(grid) + 1, dtype=np.int64)
+    np.add.at(edges, np.searchsorted(grid, times[gaps], side='right'), 1)
+    np.add.at(edges, np.searchsorted(grid, times[gaps + 1], side='left'), -1)
+    return np.cumsum(edges[:-1]) > 0
+
+
+def lerp(rows, position):
+    """rows (a (rows, n) array) at fractional sample numbers, NaN where position is NaN
+
+    Gathers and blends LERP_BLOCK grid points at a time. A position on a
+    sample takes that sample as is, as np.interp does, even next to a NaN
+    """
+    lower = np.minimum(np.fmax(position, 0).astype(np.int64), rows.shape[1] - 2)
+    weights = position - lower
+    values = np.empty((len(rows), len(position)))
+    for start in range(0, len(position), LERP_BLOCK):
+        segment = slice(start, start + LERP_BLOCK)
+        below = values[:, segment]
+        # lower is within bounds by construction; clip skips the checks
+        np.take(rows, lower[segment], axis=1, out=below, mode='clip')
+        step = rows.take(lower[segment] + 1, axis=1, mode='clip')
+        step -= below
+        step *= weights[segment]
+        below += step
+    if not np.isfinite(rows).all():
+        for hit, column in ((weights == 0, lower), (weights == 1, lower + 1)):
+            values[:, hit] = rows[:, column[hit]]
+    return values
+
+
+def interpolate(tracks, grids, max_gap_ms=None):
+    """Rows of every track at its grid times
+
+    tracks are (times, rows) pairs: increasing times (ms, at least two) and
+    a (rows, n) array or list of rows; grids are the matching increasing arrays of grid
+    times. Returns one (rows, len(grid)) array per track, NaN where the grid
+    time falls outside the track or between samples more than max_gap_ms
+    apart. One np.interp per track maps the grid to fractional sample
+    numbers, and all rows are then blended together from those
+    """
+    results = []
+    for (times, rows), grid in zip(tracks, grids):
+        position = np.interp(grid, times, np.arange(len(times), dtype=np.float64), left=np.nan, right=np.nan)
+        if max_gap_ms is not None and (np.diff(times) > max_gap_ms).any():
+            position[_gap_mask(times, grid, max_gap_ms)] = np.nan
+        results.append(lerp(np.asarray(rows, dtype=np.float64), position))
+    return results
+
+
+def resample_frames(frames, rate=None, max_gap=None):
+    """Frames on one shared grid of rate Hz, and a report per frame
+
+    Each frame covers the grid ticks within its own span; ticks inside a
+    gap longer than max_gap seconds are dropped. Frames with fewer than two
+    samples come back unchanged. Raises AnalysisOptionError when the grids
+    would hold more than RESAMPLE_MAX_POINTS ticks in all
+    """
+    rate, max_gap = validate_resample_options(rate, max_gap)
+    tick = 1000.0 / rate
+    prepared = [ordered(frame) if len(frame) >= 2 else (frame, None) for frame in frames]
+    usable = [i for i, (_, times) in enumerate(prepared) if times is not None]
+    if not usable:
+        return list(frames), [None] * len(frames)
+
+    # Ticks are whole multiples of the tick length from the earliest sample
+    origin = min(prepared[i][1][0] for i in usable)
+    bounds = [(np.ceil((times[0] - origin) / tick), np.floor((times[-1] - origin) / tick))
+              for times in (prepared[i][1] for i in usable)]
+    points = sum(last - first + 1 for first, last in bounds)
+    if points > RESAMPLE_MAX_POINTS:
+        raise AnalysisOptionError(f'resample {rate:g} Hz gives {points:.0f} grid points, more than '
+                                  f'{RESAMPLE_MAX_POINTS}; lower the rate (about {rate * RESAMPLE_MAX_POINTS / points:.3g} Hz fits)')
+
+    tracks, grids = [], []
+    for i, (first, last) in zip(usable, bounds):
+        frame, times = prepared[i]
+        tracks.append((times, list(frame.values) + ([frame.battery] if frame.battery is not None else [])))
+        grids.append(origin + np.arange(first, last + 1) * tick)
+
+    resampled = list(frames)
+    reports = [None] * len(frames)
+    for i, grid, values in zip(usable, grids, interpolate(tracks, grids, max_gap * 1000.0)):
+        frame, times = prepared[i]
+        span = float(times[-1] - times[0])
+        dropped = np.flatnonzero(np.isnan(values[0]))
+        if len(dropped):
+            keep = np.ones(len(grid), dtype=bool)
+            keep[dropped] = False
+            values, grid = values[:, keep], grid[keep]
+        battery = values[len(AXES)] if frame.battery is not None else None
+        resampled[i] = TelemetryFrame(values[:len(AXES)], frame.drone_id, grid, battery)
+        reports[i] = {
+            'rate_hz': rate,
+            'source_rate_hz': round((len(frame) - 1) * 1000 / span, 3) if span > 0 else None,
+            'source_points': len(frame),
+            'points': len(grid),
+            'gap_points': len(dropped),
+            'gap_seconds': round(len(dropped) * tick / 1000, 3)
+        }
+    return resampled, reports
@@ -0,0 +1,75 @@
+# ml-service/responses.py
+"""
+Response shapes and round-summary storage shared by the service and the
+ingest CLI
+Kept free of Flask so ingest.py can use them without importing the app
+"""
+
+import logging
+import os
+import sqlite3
+
+from stability import calculate_bonus_points
+from summary_store import SummaryStore
+
+logger = logging.getLogger('ml-service')
+
+# Per-round summaries for leaderboards, stored only when ML_SUMMARY_DB names a file
+SUMMARY_DB = os.environ.get('ML_SUMMARY_DB', '')
+summaries = SummaryStore(SUMMARY_DB) if SUMMARY_DB else None
+
+
+def record_summaries(results, match_id, round_number, team_id=None, tournament_id=None):
+    """Persist round summaries; a storage failure never fails the analysis"""
+    if summaries is None:
+        return
+    try:
+        for result in results:
+            summaries.record(result, match_id, round_number, team_id, tournament_id)
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️  Could not store round summaries: {str(e)}")
+
+
+def stability_response(match_id, round_number, result):
+    """Shape a drone result the way /analyze-stability returns it"""
+    response = {
+        'success': True,
+        'matchId': match_id,
+        'roundNumber': round_number,
+        'stabilityScore': result['stability_score'],
+        'bonusPoints': calculate_bonus_points(result['stability_score']),
+        'flightQuality': result['classification'].lower(),
+        'details': {
+            'issues': result['issues_detected'],
+            'variance': result['variance_data'],
+            'smoothness': result.get('smoothness_scores', {}),
+            'spikes': result.get('spike_counts', {}),
+            'oscillation': result.get('oscillation', {}),
+            'quality': result.get('quality', {}),
+            'dataPoints': result['data_points']
+        }
+    }
+    if 'engine' in result:
+        response['details']['engine'] = result['engine']
+    if 'chunking' in result:
+        response['details']['chunking'] = result['chunking']
+    if 'approximation' in result:
+        response['details']['approximation'] = result['approximation']
+    if 'downsampling' in result:
+        response['details']['downsampling'] = result['downsampling']
+    if 'timeline' in result:
+        response['details']['timeline'] = result['timeline']
+    if 'resampling' in result:
+        response['details']['resampling'] = result['resampling']
+    if 'anomaly' in result:
+        response['details']['formulaScore'] = result['formula_score']
+        response['details']['anomaly'] = result['anomaly']
+    return response
+
+
+def file_result(meta, result):
+    """A drone round read from a file, shaped like /analyze-stability plus its drone and team"""
+    response = stability_response(meta['matchId'], meta['roundNumber'], result)
+    response['droneId'] = meta['droneId']
+    response['teamId'] = meta['teamId']
+    return response
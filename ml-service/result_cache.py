@@ -0,0 +1,113 @@
+# ml-service/result_cache.py
+"""
+Content-addressed cache for analysis responses
+Entries are keyed by a hash of the raw request (body, content type, query
+string) plus the scoring parameters, bounded by size (LRU) and age (TTL)
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def _tag(tag):
+    """Stored form of a tag: None, a string, or a frozenset of strings"""
+    if tag is None:
+        return None
+    if isinstance(tag, (set, frozenset, list, tuple)):
+        return frozenset(str(item) for item in tag)
+    return str(tag)
+
+
+def _matches(tag, wanted):
+    return wanted in tag if isinstance(tag, frozenset) else tag == wanted
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache of serialized responses"""
+
+    def __init__(self, maxsize=512, ttl=3600, fingerprint=''):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.fingerprint = fingerprint.encode('utf-8')
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def digest(self, *parts):
+        """Content address of a request"""
+        h = hashlib.blake2b(self.fingerprint, digest_size=20)
+        for part in parts:
+            h.update(len(part).to_bytes(8, 'little'))
+            h.update(part)
+        return h.hexdigest()
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, tags, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, tags=()):
+        """Store value; tags (matchId, roundNumber, droneId) drive invalidation
+
+        The droneId tag may be a set of droneIds for a response covering
+        several drones; invalidating any one of them drops it
+        """
+        if self.maxsize <= 0:
+            return
+        tags = tuple(_tag(tag) for tag in tags)
+        with self.lock:
+            self.entries[key] = (time.monotonic(), tags, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, match_id=None, round_number=None, drone_id=None):
+        """Drop entries matching every given tag; no tags clears the cache"""
+        wanted = [None if tag is None else str(tag) for tag in (match_id, round_number, drone_id)]
+        with self.lock:
+            if all(tag is None for tag in wanted):
+                removed = len(self.entries)
+                self.entries.clear()
+                return removed
+
+            stale = [
+                key for key, (_, tags, _) in self.entries.items()
+                if all(want is None or (i < len(tags) and _matches(tags[i], want)) for i, want in enumerate(wanted))
+            ]
+            for key in stale:
+                del self.entries[key]
+            return len(stale)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
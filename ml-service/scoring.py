@@ -0,0 +1,90 @@
+# ml-service/scoring.py
+"""
+Stability score formula
+Detection thresholds shared by every analysis engine, the 0-100 penalty
+formula, its classification bands and the bonus points
+"""
+
+import os
+
+import numpy as np
+
+# Fewer points than this are reported as 'Insufficient Data'
+MIN_DATA_POINTS = 10
+SPIKE_THRESHOLD = 2.0
+OSCILLATION_RATIO = 0.4
+
+# Spectral oscillation detection: an axis oscillates when more than
+# SPECTRAL_POWER_RATIO of its variance sits at or above OSCILLATION_BAND_HZ
+OSCILLATION_METHODS = ('spectral', 'sign_change')
+OSCILLATION_METHOD = os.environ.get('ML_OSCILLATION_METHOD', 'spectral')
+OSCILLATION_BAND_HZ = 2.0
+SPECTRAL_POWER_RATIO = 0.5
+
+# Bump when the scoring formula changes so cached results are not reused
+SCORING_VERSION = 1
+
+
+def jerk_smoothness(avg_jerk):
+    """Lower jerk = smoother trajectory, normalized to a 0-100 scale"""
+    return np.maximum(0, 100 - (avg_jerk * 10))
+
+
+def stability_scores(variance_data, spike_counts, oscillation_issues, smoothness):
+    """The 0-100 stability score formula, elementwise over scalars or arrays
+
+    variance_data is keyed f'{axis}_variance', spike_counts and smoothness by
+    position axis; oscillation_issues counts the oscillation issues raised
+    """
+    avg_smoothness = (smoothness['x'] + smoothness['y'] + smoothness['z']) / 3
+
+    # Calculate stability score (0-100)
+    base_score = 100
+
+    # NEW (✅ More lenient):
+    variance_penalty = (
+        np.minimum(variance_data['x_variance'] * 0.5, 15) +      # Max 15 penalty
+        np.minimum(variance_data['y_variance'] * 0.5, 15) +      # Max 15 penalty
+        np.minimum(variance_data['z_variance'] * 3, 10) +        # Max 10 penalty
+        np.minimum(variance_data['pitch_variance'] * 10, 15) +   # Max 15 penalty
+        np.minimum(variance_data['roll_variance'] * 10, 15) +    # Max 15 penalty
+        np.minimum(variance_data['yaw_variance'] * 8, 12)        # Max 12 penalty
+    )
+# Max total penalty = 82 (instead of unlimited)
+
+    # Spike penalties
+    spike_penalty = (spike_counts['x'] + spike_counts['y'] + spike_counts['z']) * 0.5
+
+    # Oscillation penalty
+    oscillation_penalty = oscillation_issues * 5
+
+    # Calculate final score
+    stability_score = base_score - variance_penalty - spike_penalty - oscillation_penalty
+
+    # Bonus for smoothness
+    stability_score += (avg_smoothness - 50) * 0.2
+
+    # Clamp between 0-100
+    return np.clip(stability_score, 0, 100)
+
+
+def classify(stability_score):
+    """Classification band of a stability score"""
+    if stability_score >= 90:
+        return 'Excellent'
+    elif stability_score >= 70:
+        return 'Good'
+    elif stability_score >= 50:
+        return 'Moderate'
+    return 'Poor'
+
+
+def calculate_bonus_points(stability_score):
+    """Calculate bonus points based on stability score"""
+    if stability_score >= 90:
+        return 15
+    elif stability_score >= 80:
+        return 10
+    elif stability_score >= 70:
+        return 5
+    return 0
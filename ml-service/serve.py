@@ -0,0 +1,50 @@
+# ml-service/serve.py
+"""
+Production launcher for the ML service
+Runs gunicorn (gunicorn.conf.py) on Linux/macOS and waitress on Windows,
+where gunicorn is not available. Usage: python serve.py
+"""
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def serve_gunicorn():
+    """Multi-process gunicorn with the settings in gunicorn.conf.py"""
+    from gunicorn.app.wsgiapp import run
+
+    sys.argv = ['gunicorn', '-c', os.path.join(HERE, 'gunicorn.conf.py'), 'wsgi:app']
+    run()
+
+
+def serve_waitress():
+    """Multi-threaded waitress; NumPy releases the GIL for the heavy math"""
+    from waitress import serve
+
+    from wsgi import app
+
+    threads = int(os.environ.get('ML_THREADS', 4)) * int(os.environ.get('ML_WORKERS', os.cpu_count() or 1))
+    if os.environ.get('ML_SERVICE_SOCKET'):
+        print('ML_SERVICE_SOCKET is ignored: waitress has no Unix socket support on Windows', file=sys.stderr)
+    serve(
+        app,
+        host=os.environ.get('ML_SERVICE_HOST', '0.0.0.0'),
+        port=int(os.environ.get('ML_SERVICE_PORT', 5001)),
+        threads=threads,
+        channel_timeout=int(os.environ.get('ML_TIMEOUT', 120))
+    )
+
+
+def main():
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+    if os.name == 'nt':
+        serve_waitress()
+    else:
+        serve_gunicorn()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,810 @@
+# ml-service/stability.py
+"""
+Drone stability analysis
+Telemetry is converted once into a columnar TelemetryFrame; frames are
+stacked end to end into a FrameBatch and every feature is computed for all
+drones of a request in one NumPy pass (a single drone is a batch of one)
+"""
+
+import os
+
+import numpy as np
+
+import metrics
+from anomaly import ANOMALY_MODEL, SCORER, model_mtime, score_results, validate_scorer
+from resample import RESAMPLE_MAX_GAP, RESAMPLE_RATE, resample_frames, validate_resample_options
+from scoring import (MIN_DATA_POINTS, OSCILLATION_BAND_HZ, OSCILLATION_METHOD, OSCILLATION_METHODS,  # noqa: F401
+                     OSCILLATION_RATIO, SCORING_VERSION, SPECTRAL_POWER_RATIO, SPIKE_THRESHOLD,
+                     calculate_bonus_points, classify, jerk_smoothness, stability_scores)
+from telemetry import (ATTITUDE_AXES, AXES, AXIS_INDEX, DEFAULT_SAMPLE_RATE, POSITION_AXES,  # noqa: F401
+                       AnalysisOptionError, TelemetryFrame, sample_rate, timestamp_rate)
+from timeline import TIMELINE_STRIDE, TIMELINE_WINDOW, stability_timeline, validate_timeline_options
+
+# Samples with a missing (null / absent / NaN) or invalid (non-numeric /
+# infinite) axis value: 'interpolate' fills the gaps, 'drop' removes the
+# samples, 'reject' refuses the drone. Any policy refuses a drone with more
+# than MAX_MISSING_RATIO of its samples incomplete
+MISSING_POLICIES = ('interpolate', 'drop', 'reject')
+MISSING_POLICY = os.environ.get('ML_MISSING_POLICY', 'interpolate')
+MAX_MISSING_RATIO = float(os.environ.get('ML_MAX_MISSING_RATIO', '0.5'))
+# Samples checked for missing values at once
+CHECK_BLOCK = 16384
+
+# Downsampling of long rounds (off by default): frames longer than
+# ML_MAX_POINTS are analyzed from a stride decimation plus full-rate windows
+MAX_POINTS = int(os.environ.get('ML_MAX_POINTS', '0'))
+MIN_DOWNSAMPLE_POINTS = 1000
+DOWNSAMPLE_WINDOWS = 8
+
+# Frames whose full-array analysis would need more working memory than
+# ML_MEMORY_LIMIT_MB are analyzed in float32 blocks instead
+MEMORY_LIMIT_MB = float(os.environ.get('ML_MEMORY_LIMIT_MB', '256'))
+# Worst-case peak working memory per sample of each path (tracemalloc)
+FULL_BYTES_PER_SAMPLE = 400
+CHUNK_BYTES_PER_SAMPLE = 72
+
+
+_POSITION_ROWS = [AXIS_INDEX[axis] for axis in POSITION_AXES]
+_ATTITUDE_ROWS = [AXIS_INDEX[axis] for axis in ATTITUDE_AXES]
+
+
+def clean_frame(frame, policy=None, max_missing=None):
+    """Apply the missing-value policy -> (frame or None when rejected, quality counts)
+
+    Missing values are NaN and invalid ones infinite (see _column), so the
+    frame is checked with two vectorized passes per block of CHECK_BLOCK
+    samples; full-length masks are only built for a frame that needs repair
+    """
+    if policy is not None and policy not in MISSING_POLICIES:
+        raise AnalysisOptionError(f'Unknown missing-value policy: {policy}')
+    if max_missing is not None and not 0 <= max_missing <= 1:
+        raise AnalysisOptionError('maxMissing must be between 0 and 1')
+    policy = policy or MISSING_POLICY
+    max_missing = MAX_MISSING_RATIO if max_missing is None else max_missing
+    n = len(frame)
+    missing_counts = np.zeros(len(AXES), dtype=np.int64)
+    invalid_counts = np.zeros(len(AXES), dtype=np.int64)
+    incomplete_count = 0
+    for start in range(0, n, CHECK_BLOCK):
+        block = frame.values[:, start:start + CHECK_BLOCK]
+        missing = np.isnan(block)
+        invalid = np.isinf(block)
+        missing_counts += missing.sum(axis=1)
+        invalid_counts += invalid.sum(axis=1)
+        incomplete_count += int(np.count_nonzero((missing | invalid).any(axis=0)))
+
+    quality = {
+        'policy': policy,
+        'samples': n,
+        'incomplete_samples': incomplete_count,
+        'fields': {
+            axis: {'missing': int(missing_count), 'invalid': int(invalid_count)}
+            for axis, missing_count, invalid_count in zip(AXES, missing_counts, invalid_counts)
+        }
+    }
+    if not incomplete_count:
+        return frame, quality
+
+    # An axis with no usable value at all cannot be interpolated either
+    if policy == 'reject' or incomplete_count > max_missing * n or (missing_counts + invalid_counts == n).any():
+        quality['rejected'] = True
+        return None, quality
+
+    bad = ~np.isfinite(frame.values)
+    incomplete = bad.any(axis=0)
+
+    if policy == 'drop':
+        quality['dropped'] = incomplete_count
+        return frame.take(~incomplete), quality
+
+    values = np.array(frame.values, dtype=np.float64)
+    index = np.arange(n)
+    for row in np.flatnonzero(bad.any(axis=1)):
+        good = ~bad[row]
+        values[row, bad[row]] = np.interp(index[bad[row]], index[good], values[row, good])
+    quality['interpolated'] = int(np.count_nonzero(bad))
+    return TelemetryFrame(values, frame.drone_id, frame.timestamps, frame.battery), quality
+
+
+class FrameBatch:
+    """Ragged stack of frames: all drones end to end plus per-drone offsets"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.lengths = np.array([len(frame) for frame in frames], dtype=np.intp)
+        self.starts = np.zeros(len(frames), dtype=np.intp)
+        np.cumsum(self.lengths[:-1], out=self.starts[1:])
+
+        if len(frames) == 1:
+            self.values = frames[0].values.astype(np.float64, copy=False)
+        else:
+            self.values = np.concatenate([frame.values for frame in frames], axis=1, dtype=np.float64)
+
+        # Index of the owning drone for every sample
+        self.owner = np.repeat(np.arange(len(frames)), self.lengths)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def rows(self, axes):
+        """Values of several axes as a (len(axes), samples) array"""
+        return self.values[[AXIS_INDEX[axis] for axis in axes]]
+
+    def segment_sum(self, array, order=0):
+        """Per-drone sums along the last axis of an array produced by np.diff(n=order)
+
+        Entries of an order-k difference that straddle two drones are zeroed
+        so they never leak into a neighbour's statistics
+        """
+        if order:
+            array = np.where(self.owner[:-order] == self.owner[order:], array, 0)
+        return np.add.reduceat(array, self.starts, axis=-1)
+
+    def per_sample(self, per_drone):
+        """Broadcast per-drone values back onto every sample"""
+        return per_drone[..., self.owner]
+
+    def segment(self, d):
+        """(6, n) values of drone d"""
+        return self.values[:, self.starts[d]:self.starts[d] + self.lengths[d]]
+
+    def sample_rates(self):
+        """Per-drone sample rate in Hz"""
+        return np.array([sample_rate(frame) for frame in self.frames])
+
+
+class ChunkAccumulator:
+    """Running moments, attitude sign changes and position jerk
+
+    Blocks are folded in one at a time (Chan's parallel update for the
+    moments); the last three samples carry the differences across block
+    boundaries, so the totals match a pass over the whole series. The first
+    three samples are kept too, so accumulators of consecutive segments can
+    be merged
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = np.zeros(len(AXES))
+        self.m2 = np.zeros(len(AXES))
+        self.sign_changes = np.zeros(len(ATTITUDE_AXES), dtype=np.int64)
+        self.jerk_sum = np.zeros(len(POSITION_AXES))
+        self.head = np.empty((len(AXES), 0))
+        self.tail = np.empty((len(AXES), 0))
+
+    def _merge_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + np.square(delta) * (self.count * count / total)
+        self.count = total
+
+    def update(self, values, dtype=None):
+        """Fold a (6, m) block into the accumulators in O(m)
+
+        Work is done one axis at a time in dtype (default the block's own),
+        so the temporaries are a few rows long however many axes there are
+        """
+        m = values.shape[1]
+        if m == 0:
+            return
+        dtype = dtype or values.dtype
+
+        chunk_mean = np.empty(len(AXES))
+        chunk_m2 = np.empty(len(AXES))
+        carried = self.tail.shape[1]
+        tail = np.empty((len(AXES), min(3, carried + m)), dtype=dtype)
+        for row in range(len(AXES)):
+            x = np.asarray(values[row], dtype=dtype)
+            chunk_mean[row] = x.mean(dtype=np.float64)
+            deviations = x - x.dtype.type(chunk_mean[row])
+            chunk_m2[row] = np.square(deviations, out=deviations).sum(dtype=np.float64)
+            del deviations
+
+            # Differences over tail + block; only windows ending in the block are new
+            extended = np.concatenate((self.tail[row].astype(dtype, copy=False), x))
+            if row in _ATTITUDE_ROWS:
+                signs = np.sign(np.diff(extended))
+                self.sign_changes[_ATTITUDE_ROWS.index(row)] += np.count_nonzero(
+                    np.diff(signs)[max(0, carried - 2):])
+                del signs
+            if row in _POSITION_ROWS:
+                jerk = np.abs(np.diff(extended, n=3))
+                self.jerk_sum[_POSITION_ROWS.index(row)] += jerk[max(0, carried - 3):].sum(dtype=np.float64)
+                del jerk
+            tail[row] = extended[-tail.shape[1]:]
+
+        self._merge_moments(m, chunk_mean, chunk_m2)
+        if self.head.shape[1] < 3:
+            self.head = np.concatenate((self.head, np.asarray(values[:, :3 - self.head.shape[1]], dtype=dtype)),
+                                       axis=1)
+        self.tail = tail
+
+    def merge(self, other):
+        """Fold in the accumulator of the segment that directly follows this one"""
+        if other.count == 0:
+            return
+        # Windows that start in this tail and end in the other's head are the only new ones
+        carried = self.tail.shape[1]
+        extended = np.concatenate((self.tail, other.head), axis=1)
+
+        signs = np.sign(np.diff(extended[_ATTITUDE_ROWS], axis=1))
+        changes = np.diff(signs, axis=1) != 0
+        self.sign_changes += other.sign_changes + np.sum(changes[:, max(0, carried - 2):carried], axis=1)
+
+        jerk = np.abs(np.diff(extended[_POSITION_ROWS], n=3, axis=1))
+        self.jerk_sum += other.jerk_sum + np.sum(jerk[:, max(0, carried - 3):carried], axis=1)
+
+        self._merge_moments(other.count, other.mean, other.m2)
+        self.head = np.concatenate((self.head, other.head), axis=1)[:, :3]
+        self.tail = np.concatenate((self.tail, other.tail), axis=1)[:, -3:]
+
+    def variances(self):
+        return self.m2 / self.count
+
+    def sign_change_ratios(self):
+        return self.sign_changes / (self.count - 1)
+
+    def jerk(self):
+        return self.jerk_sum / (self.count - 3)
+
+
+def calculate_moments(batch):
+    """Mean and variance for each axis and drone -> two (6, drones) arrays"""
+    mean = batch.segment_sum(batch.values) / batch.lengths
+    deviations = batch.values - batch.per_sample(mean)
+    return mean, batch.segment_sum(deviations * deviations) / batch.lengths
+
+
+def count_spikes(batch, mean, variances, axes=POSITION_AXES, threshold=SPIKE_THRESHOLD):
+    """Count sudden spikes per axis and drone using z-scores -> (len(axes), drones)"""
+    rows = [AXIS_INDEX[axis] for axis in axes]
+    values = batch.rows(axes)
+    mean = mean[rows]
+    std = np.sqrt(variances[rows])
+
+    # A constant series has no spikes (scipy's zscore yields NaN there)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores = np.abs(values - batch.per_sample(mean)) / batch.per_sample(std)
+    spikes = (z_scores > threshold) & batch.per_sample(std > 0)
+
+    return batch.segment_sum(spikes.astype(np.intp))
+
+
+def oscillation_ratios(batch, axes=ATTITUDE_AXES):
+    """Share of sign changes in consecutive differences -> (len(axes), drones)"""
+    signs = np.sign(np.diff(batch.rows(axes), axis=1))
+    sign_changes = batch.segment_sum((np.diff(signs, axis=1) != 0).astype(np.intp), order=2)
+    return sign_changes / (batch.lengths - 1)
+
+
+def spectral_features(batch, mean, variances, band_hz=OSCILLATION_BAND_HZ):
+    """Dominant frequency and in-band power share for all six axes of every drone
+
+    Drones are zero-padded to the next power of two and transformed with one
+    batched rfft per padded length. The band share is normalised by the
+    variance already computed (Parseval), so no second pass is needed.
+    Returns (dominant_hz, band_ratio), each (6, drones)
+    """
+    rates = batch.sample_rates()
+    dominant = np.zeros((len(AXES), len(batch)))
+    band_ratio = np.zeros((len(AXES), len(batch)))
+
+    nffts = 1 << np.ceil(np.log2(batch.lengths)).astype(np.int64)
+    for nfft in np.unique(nffts):
+        group = np.flatnonzero(nffts == nfft)
+        block = np.zeros((len(group), len(AXES), nfft))
+        for j, d in enumerate(group):
+            block[j, :, :batch.lengths[d]] = batch.segment(d) - mean[:, d, None]
+
+        spectrum = np.fft.rfft(block, axis=-1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        # One-sided spectrum: every bin but DC (and Nyquist) stands for two
+        power[..., 1:(nfft + 1) // 2] *= 2
+        power[..., 0] = 0
+
+        freqs = np.fft.rfftfreq(nfft)[None, :] * rates[group, None]
+        in_band = (freqs >= band_hz)[:, None, :]
+        total = nfft * batch.lengths[group, None] * variances[:, group].T
+
+        dominant[:, group] = freqs[np.arange(len(group))[:, None], power.argmax(axis=-1)].T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(total > 0, (power * in_band).sum(axis=-1) / total, 0)
+        band_ratio[:, group] = ratio.T
+
+    return dominant, band_ratio
+
+
+def calculate_jerk(batch, axes=POSITION_AXES):
+    """Mean absolute jerk (rate of change of acceleration) -> (len(axes), drones)"""
+    # Jerk is the third difference of position
+    jerk = np.abs(np.diff(batch.rows(axes), n=3, axis=1))
+    return batch.segment_sum(jerk, order=3) / (batch.lengths - 3)
+
+
+def calculate_smoothness(batch, axes=POSITION_AXES):
+    """Calculate trajectory smoothness (jerk - rate of change of acceleration)"""
+    return jerk_smoothness(calculate_jerk(batch, axes))
+
+
+def sign_change_oscillation(ratios, d):
+    """Oscillation block of drone d from sign-change ratios (compatibility method)"""
+    block = {'method': 'sign_change'}
+    for i, axis in enumerate(ATTITUDE_AXES):
+        block[axis] = {
+            'sign_change_ratio': round(float(ratios[i, d]), 4),
+            'oscillating': bool(ratios[i, d] > OSCILLATION_RATIO)
+        }
+    return block
+
+
+def extract_features(batch, oscillation_method=None):
+    """Compute every stability feature for all drones of a batch in one pass"""
+    oscillation_method = oscillation_method or OSCILLATION_METHOD
+
+    with metrics.stage('variance'):
+        mean, variances = calculate_moments(batch)
+    with metrics.stage('spikes'):
+        spikes = count_spikes(batch, mean, variances)
+    with metrics.stage('oscillations'):
+        if oscillation_method == 'sign_change':
+            ratios = oscillation_ratios(batch)
+        else:
+            dominant, band_ratio = spectral_features(batch, mean, variances)
+    with metrics.stage('smoothness'):
+        jerk = calculate_jerk(batch)
+
+    features = []
+    for d in range(len(batch)):
+        if oscillation_method == 'sign_change':
+            oscillation = sign_change_oscillation(ratios, d)
+        else:
+            oscillation = spectral_oscillation(dominant, band_ratio, d)
+        features.append(feature_dict(mean[:, d], variances[:, d], spikes[:, d], oscillation, jerk[:, d],
+                                     batch.lengths[d]))
+    return features
+
+
+def spectral_oscillation(dominant, band_ratio, d):
+    """Oscillation block of drone d from spectral features"""
+    block = {'method': 'spectral', 'band_hz': OSCILLATION_BAND_HZ}
+    for i, axis in enumerate(AXES):
+        block[axis] = {
+            'dominant_frequency': round(float(dominant[i, d]), 3),
+            'band_power': round(float(band_ratio[i, d]), 4),
+            'oscillating': bool(band_ratio[i, d] > SPECTRAL_POWER_RATIO)
+        }
+    return block
+
+
+def feature_dict(mean, variances, spikes, oscillation, jerk, data_points):
+    """One drone's features in the shape score_drone expects"""
+    smoothness = jerk_smoothness(jerk)
+    return {
+        'variance_data': {f'{axis}_variance': float(variances[i]) for i, axis in enumerate(AXES)},
+        'spike_counts': {axis: int(spikes[i]) for i, axis in enumerate(POSITION_AXES)},
+        'oscillation': oscillation,
+        'smoothness': {axis: float(smoothness[i]) for i, axis in enumerate(POSITION_AXES)},
+        'moments': {
+            'mean': {axis: float(mean[i]) for i, axis in enumerate(AXES)},
+            'jerk': {axis: float(jerk[i]) for i, axis in enumerate(POSITION_AXES)}
+        },
+        'data_points': int(data_points)
+    }
+
+
+def _relative_error(error, reference):
+    """Largest error relative to its reference across axes (0 where the reference is 0)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = np.where(reference > 0, np.abs(error) / reference, 0)
+    return round(float(relative.max()), 4)
+
+
+def downsampled_features(frame, max_points, oscillation_method=None):
+    """Features of a frame longer than max_points from a bounded number of samples
+
+    Variance and spikes need the whole round's distribution, so they come
+    from two interleaved stride decimations (every k-th sample from
+    offsets 0 and k // 2), pooled, with spike counts scaled up to the round.
+    Jerk and oscillation are sample-to-sample properties, so they come from
+    DOWNSAMPLE_WINDOWS evenly spaced full-rate windows. About 3 * max_points
+    samples are touched whatever the round length.
+
+    The error estimate is half the relative disagreement of the variance
+    between the two stride phases and the standard error of the jerk across
+    windows
+    """
+    oscillation_method = oscillation_method or OSCILLATION_METHOD
+    n = len(frame)
+    factor = -(-n // max_points)
+    window = max_points // DOWNSAMPLE_WINDOWS
+
+    # Phases 0 and k // 2 are pooled; half their disagreement is the error of the pooled estimate
+    strided = FrameBatch([frame.take(slice(0, None, factor)), frame.take(slice(factor // 2, None, factor))])
+    phase_mean, phase_variances = calculate_moments(strided)
+    pooled = strided.lengths.sum()
+    mean = (phase_mean * strided.lengths).sum(axis=1) / pooled
+    variances = ((phase_variances + (phase_mean - mean[:, None]) ** 2) * strided.lengths).sum(axis=1) / pooled
+    spikes = np.rint(count_spikes(strided, np.repeat(mean[:, None], 2, axis=1),
+                                  np.repeat(variances[:, None], 2, axis=1)).sum(axis=1) * n / pooled)
+
+    starts = np.linspace(0, n - window, DOWNSAMPLE_WINDOWS).astype(np.intp)
+    windows = FrameBatch([frame.take(slice(start, start + window)) for start in starts])
+    jerk = windows.segment_sum(np.abs(np.diff(windows.values[_POSITION_ROWS], n=3, axis=1)), order=3) / (window - 3)
+    avg_jerk = jerk.mean(axis=1)
+    jerk_error = jerk.std(axis=1, ddof=1) / np.sqrt(DOWNSAMPLE_WINDOWS)
+
+    # Window results are pooled weighted by each window's share of the power
+    window_mean, window_var = calculate_moments(windows)
+    weights = window_var / np.maximum(window_var.sum(axis=1, keepdims=True), np.finfo(float).tiny)
+    if oscillation_method == 'sign_change':
+        ratios = oscillation_ratios(windows).mean(axis=1, keepdims=True)
+        oscillation = sign_change_oscillation(ratios, 0)
+    else:
+        dominant, band_ratio = spectral_features(windows, window_mean, window_var)
+        strongest = window_var.argmax(axis=1)
+        oscillation = spectral_oscillation(
+            dominant[np.arange(len(AXES)), strongest][:, None],
+            (band_ratio * weights).sum(axis=1, keepdims=True), 0)
+
+    features = feature_dict(mean, variances, spikes, oscillation, avg_jerk, n)
+    features['downsampling'] = {
+        'factor': int(factor),
+        'original_points': int(n),
+        'analyzed_points': int(pooled + window * DOWNSAMPLE_WINDOWS),
+        'windows': DOWNSAMPLE_WINDOWS,
+        'window_points': int(window),
+        'error': {
+            'variance': _relative_error((phase_variances[:, 1] - phase_variances[:, 0]) / 2, variances),
+            'jerk': _relative_error(jerk_error, avg_jerk)
+        }
+    }
+    return features
+
+
+def chunk_size(memory_limit):
+    """Samples per block (a power of two, the FFT length) fitting memory_limit bytes"""
+    samples = max(MIN_DATA_POINTS, int(memory_limit // CHUNK_BYTES_PER_SAMPLE))
+    return 1 << (samples.bit_length() - 1)
+
+
+def chunked_features(frame, block_size, oscillation_method=None):
+    """Features of a frame processed in float32 blocks of block_size samples
+
+    The first pass folds every block into a ChunkAccumulator. The second
+    counts spikes against the final moments and, for the spectral method,
+    sums the blocks' power spectra (Welch-style, one FFT length), so the
+    band share is the full-series one up to the block's frequency
+    resolution. Both passes convert one axis of one block at a time, so
+    working memory is bounded by the block, not the series
+    """
+    oscillation_method = oscillation_method or OSCILLATION_METHOD
+    n = len(frame)
+
+    accumulator = ChunkAccumulator()
+    for start in range(0, n, block_size):
+        accumulator.update(frame.values[:, start:start + block_size], np.float32)
+    variances = accumulator.variances()
+
+    spectral = oscillation_method != 'sign_change'
+    spikes, spectrum = block_pass(frame, block_size, accumulator.mean, accumulator.m2, spectral)
+    if spectral:
+        oscillation = spectral_oscillation(*spectrum, 0)
+    else:
+        oscillation = sign_change_oscillation(accumulator.sign_change_ratios()[:, None], 0)
+
+    return feature_dict(accumulator.mean, variances, spikes, oscillation, accumulator.jerk(), n)
+
+
+def block_pass(frame, block_size, mean, m2, spectral=True, spikes=True):
+    """Spike counts against the whole-series moments and summed block spectra, in float32 blocks
+
+    Returns (spikes or None, (dominant, band_ratio) as (6, 1) arrays or
+    None). One axis of one block is converted at a time
+    """
+    n = len(frame)
+    std = np.sqrt(m2 / n).astype(np.float32)
+    mean = mean.astype(np.float32)
+    nfft = 1 << int(np.ceil(np.log2(min(n, block_size))))
+    counts = np.zeros(len(POSITION_AXES), dtype=np.int64)
+    power = np.zeros((len(AXES), nfft // 2 + 1)) if spectral else None
+    for start in range(0, n, block_size):
+        block = frame.values[:, start:start + block_size]
+        for row in range(len(AXES)):
+            counted = spikes and row in _POSITION_ROWS and std[row] > 0
+            if not (counted or spectral):
+                continue
+            deviations = block[row].astype(np.float32)
+            deviations -= mean[row]
+            if counted:
+                scaled = np.abs(deviations)
+                scaled /= std[row]
+                counts[_POSITION_ROWS.index(row)] += np.count_nonzero(scaled > SPIKE_THRESHOLD)
+                del scaled
+            if spectral:
+                spectrum = np.fft.rfft(deviations, n=nfft)
+                del deviations
+                power[row] += np.square(spectrum.real)
+                power[row] += np.square(spectrum.imag)
+                del spectrum
+
+    if not spectral:
+        return (counts if spikes else None), None
+    # One-sided spectrum without DC, normalised like spectral_features
+    power[:, 1:(nfft + 1) // 2] *= 2
+    power[:, 0] = 0
+    rate = timestamp_rate(frame.timestamps[:block_size] if frame.timestamps is not None else None)
+    freqs = np.fft.rfftfreq(nfft) * rate
+    total = nfft * m2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        band_ratio = np.where(total > 0, power[:, freqs >= OSCILLATION_BAND_HZ].sum(axis=1) / total, 0)
+    dominant = freqs[power.argmax(axis=1)]
+    return (counts if spikes else None), (dominant[:, None], band_ratio[:, None])
+
+
+def insufficient_data_result(drone_id, data_points):
+    """Result for a drone with too few samples to analyze"""
+    return {
+        'drone_id': drone_id,
+        'stability_score': 0,
+        'classification': 'Insufficient Data',
+        'issues_detected': ['Not enough data points'],
+        'variance_data': {},
+        'data_points': data_points
+    }
+
+
+def rejected_result(drone_id, quality):
+    """Result for a drone refused by the missing-value policy"""
+    share = quality['incomplete_samples'] / quality['samples'] * 100
+    return {
+        'drone_id': drone_id,
+        'stability_score': 0,
+        'classification': 'Rejected',
+        'issues_detected': [f'Too much missing or invalid telemetry ({share:.1f}% of samples incomplete)'],
+        'variance_data': {},
+        'data_points': quality['samples']
+    }
+
+
+def score_drone(drone_id, features):
+    """Turn a drone's features into the stability score, issues and classification"""
+    variance_data = features['variance_data']
+    spike_counts = features['spike_counts']
+    oscillation = features['oscillation']
+    smoothness = features['smoothness']
+
+    # Detect issues
+    issues = []
+
+    # Check for high variance
+    if variance_data['yaw_variance'] > 0.5:
+        issues.append('Yaw drift detected')
+
+    if variance_data['z_variance'] > 1.0:
+        issues.append('Altitude instability')
+
+    if variance_data['pitch_variance'] > 0.3:
+        issues.append('Pitch oscillation')
+
+    if variance_data['roll_variance'] > 0.3:
+        issues.append('Roll oscillation')
+
+    # Check for spikes
+    if spike_counts['x'] > 5:
+        issues.append('Horizontal position spikes (X-axis)')
+    if spike_counts['y'] > 5:
+        issues.append('Horizontal position spikes (Y-axis)')
+    if spike_counts['z'] > 5:
+        issues.append('Vertical position spikes')
+
+    # Check for oscillations (spectral band power or sign-change ratio)
+    if oscillation['pitch']['oscillating']:
+        issues.append('Pitch oscillation pattern detected')
+    if oscillation['roll']['oscillating']:
+        issues.append('Roll oscillation pattern detected')
+    if oscillation['yaw']['oscillating']:
+        issues.append('Yaw oscillation pattern detected')
+
+    x_smoothness = smoothness['x']
+    y_smoothness = smoothness['y']
+    z_smoothness = smoothness['z']
+    avg_smoothness = (x_smoothness + y_smoothness + z_smoothness) / 3
+
+    oscillation_issues = len([i for i in issues if 'oscillation' in i.lower()])
+    stability_score = float(stability_scores(variance_data, spike_counts, oscillation_issues, smoothness))
+
+    if not issues:
+        issues.append('No major issues detected')
+
+    result = {
+        'drone_id': drone_id,
+        'stability_score': round(stability_score, 2),
+        'classification': classify(stability_score),
+        'issues_detected': issues,
+        'variance_data': variance_data,
+        'smoothness_scores': {
+            'x': round(x_smoothness, 2),
+            'y': round(y_smoothness, 2),
+            'z': round(z_smoothness, 2),
+            'average': round(avg_smoothness, 2)
+        },
+        'spike_counts': spike_counts,
+        'oscillation': oscillation,
+        'moments': features['moments'],
+        'data_points': features['data_points']
+    }
+    if 'downsampling' in features:
+        result['downsampling'] = features['downsampling']
+    return result
+
+
+def team_summary(results):
+    """Team aggregates over per-drone results"""
+    scores = np.array([result['stability_score'] for result in results], dtype=np.float64)
+    bonus = [calculate_bonus_points(result['stability_score']) for result in results]
+    if not results:
+        return {
+            'drone_count': 0,
+            'analyzed_drones': 0,
+            'mean_stability': 0,
+            'min_stability': 0,
+            'max_stability': 0,
+            'stability_spread': 0,
+            'stability_std': 0,
+            'bonus_points': 0
+        }
+
+    return {
+        'drone_count': len(results),
+        'analyzed_drones': sum(1 for result in results
+                               if result['classification'] not in ('Insufficient Data', 'Rejected')),
+        'mean_stability': round(float(scores.mean()), 2),
+        'min_stability': round(float(scores.min()), 2),
+        'max_stability': round(float(scores.max()), 2),
+        'stability_spread': round(float(scores.max() - scores.min()), 2),
+        'stability_std': round(float(scores.std()), 2),
+        'bonus_points': sum(bonus)
+    }
+
+
+def scoring_fingerprint():
+    """Identifies the scoring parameters a result was produced with"""
+    return (f'v{SCORING_VERSION}:{MIN_DATA_POINTS}:{SPIKE_THRESHOLD}:{OSCILLATION_RATIO}:'
+            f'{OSCILLATION_METHOD}:{OSCILLATION_BAND_HZ}:{SPECTRAL_POWER_RATIO}:{DEFAULT_SAMPLE_RATE}:'
+            f'{MAX_POINTS}:{DOWNSAMPLE_WINDOWS}:{MEMORY_LIMIT_MB}:{MISSING_POLICY}:{MAX_MISSING_RATIO}:'
+            f'{TIMELINE_WINDOW}:{TIMELINE_STRIDE}:{RESAMPLE_RATE}:{RESAMPLE_MAX_GAP}:{SCORER}:'
+            f'{ANOMALY_MODEL}:{model_mtime()}')
+
+
+def analyze_frames(frames, drone_ids=None, oscillation_method=None, max_points=None, memory_limit_mb=None,
+                   missing_policy=None, max_missing=None, timeline=False, timeline_window=None,
+                   timeline_stride=None, resample_rate=None, max_gap=None, scorer=None):
+    """Analyze many drones at once; cost grows with total samples, not drones
+
+    oscillation_method is 'spectral' (default, ML_OSCILLATION_METHOD) or
+    'sign_change' for the original 40% sign-change heuristic. Frames longer
+    than max_points (default ML_MAX_POINTS, 0 = never) are downsampled.
+    Frames of at least ML_PARALLEL_MIN_POINTS are split across
+    ML_PARALLEL_WORKERS processes when that is set, their spectral
+    transform kept to the memory limit. Otherwise working memory is kept
+    under memory_limit_mb (default ML_MEMORY_LIMIT_MB,
+    0 = unbounded): drones are batched to fit and a drone too large on its
+    own is analyzed in float32 blocks. Each analyzed result names its
+    engine: 'full', 'chunked', 'parallel' or 'downsampled'. Missing and invalid values are
+    handled first, by missing_policy / max_missing (ML_MISSING_POLICY /
+    ML_MAX_MISSING_RATIO); every result reports the quality counts. With
+    timeline set, each analyzed drone also gets a stability curve over
+    timeline_window-second windows every timeline_stride seconds. With a
+    resample_rate (default ML_RESAMPLE_RATE, 0 = off) every cleaned drone is
+    first put on a shared grid of that many Hz, not bridging gaps longer
+    than max_gap seconds (ML_RESAMPLE_MAX_GAP). scorer (default ML_SCORER)
+    'model' rescores every analyzed drone with the anomaly model in one
+    pass, keeping the formula's score as formula_score
+    """
+    import parallel  # imports this module
+
+    if oscillation_method is not None and oscillation_method not in OSCILLATION_METHODS:
+        raise AnalysisOptionError(f'Unknown oscillation method: {oscillation_method}')
+    max_points = MAX_POINTS if max_points is None else max_points
+    if max_points and max_points < MIN_DOWNSAMPLE_POINTS:
+        raise AnalysisOptionError(f'maxPoints must be 0 or at least {MIN_DOWNSAMPLE_POINTS}')
+    memory_limit = (MEMORY_LIMIT_MB if memory_limit_mb is None else memory_limit_mb) * 1024 * 1024
+    batch_samples = memory_limit // FULL_BYTES_PER_SAMPLE if memory_limit else float('inf')
+    if timeline:
+        timeline_window, timeline_stride = validate_timeline_options(timeline_window, timeline_stride)
+    resample_rate, max_gap = validate_resample_options(resample_rate, max_gap)
+    model = validate_scorer(scorer, oscillation_method)
+    if drone_ids is None:
+        drone_ids = [frame.drone_id for frame in frames]
+
+    with metrics.stage('validation'):
+        cleaned = [clean_frame(frame, missing_policy, max_missing) for frame in frames]
+    frames = [frame for frame, _ in cleaned]
+
+    resampling = [None] * len(frames)
+    if resample_rate:
+        with metrics.stage('resample'):
+            present = [i for i, frame in enumerate(frames) if frame is not None]
+            resampled, reports = resample_frames([frames[i] for i in present], resample_rate, max_gap)
+            for i, frame, report in zip(present, resampled, reports):
+                frames[i] = frame
+                resampling[i] = report
+
+    results = [None] * len(frames)
+    ready = []
+    for i, frame in enumerate(frames):
+        if frame is None:
+            results[i] = rejected_result(drone_ids[i], cleaned[i][1])
+        elif len(frame) < MIN_DATA_POINTS:
+            results[i] = insufficient_data_result(drone_ids[i], len(frame))
+        elif max_points and len(frame) > max_points:
+            with metrics.stage('downsample'):
+                features = downsampled_features(frame, max_points, oscillation_method)
+            results[i] = score_drone(drone_ids[i], features)
+            results[i]['engine'] = 'downsampled'
+        elif parallel.PARALLEL_WORKERS > 1 and len(frame) >= parallel.PARALLEL_MIN_POINTS:
+            with metrics.stage('parallel'):
+                features = parallel.parallel_features(frame, oscillation_method, memory_limit=memory_limit)
+            results[i] = score_drone(drone_ids[i], features)
+            results[i]['engine'] = 'parallel'
+        elif len(frame) > batch_samples:
+            with metrics.stage('chunked'):
+                block_size = chunk_size(memory_limit)
+                features = chunked_features(frame, block_size, oscillation_method)
+            results[i] = score_drone(drone_ids[i], features)
+            results[i]['engine'] = 'chunked'
+            results[i]['chunking'] = {'block_points': block_size, 'dtype': 'float32'}
+        else:
+            ready.append(i)
+
+    # Consecutive drones share a batch while their samples fit the limit
+    batches = []
+    samples = 0
+    for i in ready:
+        if not batches or samples + len(frames[i]) > batch_samples:
+            batches.append([])
+            samples = 0
+        batches[-1].append(i)
+        samples += len(frames[i])
+
+    for members in batches:
+        with metrics.stage('columns'):
+            batch = FrameBatch([frames[i] for i in members])
+        features = extract_features(batch, oscillation_method)
+        with metrics.stage('scoring'):
+            for i, drone_features in zip(members, features):
+                results[i] = score_drone(drone_ids[i], drone_features)
+                results[i]['engine'] = 'full'
+
+    if model is not None:
+        with metrics.stage('anomaly'):
+            score_results([result for result in results if 'moments' in result], model)
+
+    if timeline:
+        with metrics.stage('timeline'):
+            for i, frame in enumerate(frames):
+                if frame is not None and len(frame) >= MIN_DATA_POINTS:
+                    results[i]['timeline'] = stability_timeline(frame, timeline_window, timeline_stride)
+
+    for result, (_, quality), report in zip(results, cleaned, resampling):
+        result['quality'] = quality
+        if report is not None:
+            result['resampling'] = report
+        metrics.SAMPLES.observe(quality['samples'])
+    metrics.DRONES.inc(len(frames))
+
+    return results
+
+
+def drone_frame(drone_data):
+    """TelemetryFrame of a {'drone_id', 'logs' | 'frame'} dict"""
+    frame = drone_data.get('frame')
+    if frame is None:
+        frame = TelemetryFrame.from_logs(drone_data.get('logs', []), drone_data.get('drone_id', 'unknown'))
+    return frame
+
+
+def analyze_drone(drone_data, **options):
+    """Analyze single drone's stability (options as for analyze_frames)"""
+    return analyze_frames([drone_frame(drone_data)], [drone_data.get('drone_id', 'unknown')], **options)[0]
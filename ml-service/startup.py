@@ -0,0 +1,89 @@
+# ml-service/startup.py
+"""
+Cold-start bookkeeping for the ML service
+Measures import time, runs a synthetic warmup analysis at boot and records
+time-to-first-analysis so startup can be held to a budget
+"""
+
+import time
+
+# Set as early as possible; app.py imports this module before anything heavy
+BOOT_TIME = time.perf_counter()
+
+
+class StartupClock:
+    """Startup milestones, all in seconds since BOOT_TIME"""
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.imported = None
+        self.warmup_seconds = None
+        self.ready = None
+        self.first_analysis = None
+        self.first_analysis_latency = None
+
+    def mark_imported(self):
+        self.imported = time.perf_counter() - BOOT_TIME
+
+    def mark_ready(self):
+        self.ready = time.perf_counter() - BOOT_TIME
+
+    def mark_first_analysis(self, latency):
+        """Record the first real analysis; later calls are ignored"""
+        if self.first_analysis is None:
+            self.first_analysis = time.perf_counter() - BOOT_TIME
+            self.first_analysis_latency = latency
+
+    def over_budget(self):
+        return self.budget is not None and self.ready is not None and self.ready > self.budget
+
+    def report(self):
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 2)
+
+        return {
+            'importMs': ms(self.imported),
+            'warmupMs': ms(self.warmup_seconds),
+            'readyMs': ms(self.ready),
+            'budgetMs': ms(self.budget),
+            'overBudget': self.over_budget(),
+            'firstAnalysisMs': ms(self.first_analysis),
+            'firstAnalysisLatencyMs': ms(self.first_analysis_latency)
+        }
+
+
+def synthetic_frames(drones=2, samples=200, seed=0):
+    """Deterministic hover-like telemetry used to warm the analysis path"""
+    import numpy as np
+
+    from stability import AXES, TelemetryFrame
+
+    rng = np.random.default_rng(seed)
+    frames = []
+    for d in range(drones):
+        values = rng.normal(0, 0.1, (len(AXES), samples)).cumsum(axis=1)
+        timestamps = np.arange(samples, dtype=np.float64) * 50
+        frames.append(TelemetryFrame(values, f'W{d}', timestamps))
+    return frames
+
+
+def warmup(clock):
+    """Run one synthetic analysis so the first real request pays no first-call costs
+
+    Exercises the JSON-dict conversion, the columnar codec and the batch
+    engine, which between them touch every NumPy kernel the service uses
+    """
+    import columnar
+    import metrics
+    from stability import AXES, TelemetryFrame, analyze_frames
+
+    started = time.perf_counter()
+    frames = synthetic_frames()
+
+    logs = [dict(zip(AXES, map(float, sample))) for sample in frames[0].values.T]
+    frames[0] = TelemetryFrame.from_logs(logs, frames[0].drone_id)
+    _, frames = columnar.parse_columnar(columnar.encode_columnar(frames))
+    analyze_frames(frames)
+    metrics.reset()
+
+    clock.warmup_seconds = time.perf_counter() - started
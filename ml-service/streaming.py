@@ -0,0 +1,133 @@
+# ml-service/streaming.py
+"""
+Incremental stability analysis
+Telemetry chunks are folded into constant-size online accumulators per
+(matchId, roundNumber, droneId) session, so a live score can be read at any
+time and the end-of-round result needs no recompute
+
+Variance, sign-change ratios and jerk smoothness match the full analysis up
+to float rounding. Spike counts are an online estimate: each sample's
+z-score is taken against the moments of everything seen up to its chunk.
+Live sessions detect oscillation with the sign-change method, which unlike
+the spectral one can be updated incrementally. Sessions keep no samples,
+so the end-of-round result is the same estimate; results name what
+differs from /analyze-stability in 'approximation'
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from stability import (AXIS_INDEX, MIN_DATA_POINTS, OSCILLATION_METHOD, POSITION_AXES, SPIKE_THRESHOLD,
+                       ChunkAccumulator, feature_dict, insufficient_data_result, score_drone, sign_change_oscillation)
+
+# Sessions idle for longer than this are dropped
+SESSION_TTL = 30 * 60
+
+_POSITION_ROWS = [AXIS_INDEX[axis] for axis in POSITION_AXES]
+
+
+class StreamingAnalyzer(ChunkAccumulator):
+    """Online accumulators for one drone's stability features"""
+
+    def __init__(self, drone_id='unknown'):
+        super().__init__()
+        self.drone_id = drone_id
+        self.spikes = np.zeros(len(POSITION_AXES), dtype=np.int64)
+
+    def update(self, values):
+        """Fold a (6, m) chunk into the accumulators in O(m)"""
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape[1] == 0:
+            return
+        super().update(values)
+
+        # Spikes against the running moments
+        std = np.sqrt(self.m2[_POSITION_ROWS] / self.count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = np.abs(values[_POSITION_ROWS] - self.mean[_POSITION_ROWS, None]) / std[:, None]
+        self.spikes += np.sum((z_scores > SPIKE_THRESHOLD) & (std[:, None] > 0), axis=1)
+
+    def features(self):
+        """Current features in the shape produced by stability.extract_features"""
+        return feature_dict(self.mean, self.variances(), self.spikes,
+                            sign_change_oscillation(self.sign_change_ratios()[:, None], 0),
+                            self.jerk(), self.count)
+
+    def result(self):
+        """Live stability result, same shape as stability.analyze_drone"""
+        if self.count < MIN_DATA_POINTS:
+            return insufficient_data_result(self.drone_id, self.count)
+        result = score_drone(self.drone_id, self.features())
+        result['engine'] = 'streaming'
+        # Against /analyze-stability: online spike counts, and sign changes
+        # in place of the configured oscillation method
+        result['approximation'] = {
+            'spikes': 'online',
+            'oscillation_method': 'sign_change',
+            'batch_oscillation_method': OSCILLATION_METHOD
+        }
+        return result
+
+
+class StreamSession:
+    """A drone's analyzer plus bookkeeping for one round"""
+
+    def __init__(self, match_id, round_number, drone_id):
+        self.match_id = match_id
+        self.round_number = round_number
+        self.analyzer = StreamingAnalyzer(drone_id)
+        self.lock = threading.Lock()
+        self.opened_at = time.time()
+        self.touched_at = self.opened_at
+        self.chunks = 0
+
+    def push(self, values):
+        with self.lock:
+            self.analyzer.update(values)
+            self.chunks += 1
+            self.touched_at = time.time()
+            return self.analyzer.result()
+
+    def result(self):
+        with self.lock:
+            self.touched_at = time.time()
+            return self.analyzer.result()
+
+
+class StreamRegistry:
+    """Thread-safe map of (matchId, roundNumber, droneId) -> StreamSession"""
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(match_id, round_number, drone_id):
+        return (str(match_id), str(round_number), str(drone_id))
+
+    def open(self, match_id, round_number, drone_id):
+        """Open (or reset) a session"""
+        session = StreamSession(match_id, round_number, drone_id)
+        with self.lock:
+            self._expire()
+            self.sessions[self.key(match_id, round_number, drone_id)] = session
+        return session
+
+    def get(self, match_id, round_number, drone_id):
+        with self.lock:
+            return self.sessions.get(self.key(match_id, round_number, drone_id))
+
+    def close(self, match_id, round_number, drone_id):
+        with self.lock:
+            return self.sessions.pop(self.key(match_id, round_number, drone_id), None)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for key in [key for key, session in self.sessions.items() if session.touched_at < cutoff]:
+            del self.sessions[key]
+
+    def __len__(self):
+        return len(self.sessions)
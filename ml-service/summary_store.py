@@ -0,0 +1,191 @@
+# ml-service/summary_store.py
+"""
+Persistent per-round stability summaries
+Each analyzed drone round is stored once in SQLite as sufficient statistics
+(sample count, per-axis sums and sums of squares, spike counts, mean jerk)
+plus its score, so team, match and tournament aggregates and trends cost
+O(rounds) instead of re-sending raw telemetry
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from stability import AXES, POSITION_AXES, SCORING_VERSION, calculate_bonus_points
+
+_COLUMNS = (
+    ['tournament_id', 'match_id', 'round_number', 'team_id', 'drone_id', 'samples'] +
+    [f'sum_{axis}' for axis in AXES] +
+    [f'sumsq_{axis}' for axis in AXES] +
+    [f'spikes_{axis}' for axis in POSITION_AXES] +
+    [f'jerk_{axis}' for axis in POSITION_AXES] +
+    ['stability_score', 'classification', 'bonus_points', 'scoring_version', 'recorded_at']
+)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS round_summaries (
+    tournament_id TEXT,
+    match_id TEXT NOT NULL,
+    round_number INTEGER NOT NULL,
+    team_id TEXT,
+    drone_id TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    {', '.join(f'sum_{axis} REAL, sumsq_{axis} REAL' for axis in AXES)},
+    {', '.join(f'spikes_{axis} INTEGER, jerk_{axis} REAL' for axis in POSITION_AXES)},
+    stability_score REAL NOT NULL,
+    classification TEXT,
+    bonus_points INTEGER,
+    scoring_version INTEGER,
+    recorded_at REAL,
+    PRIMARY KEY (match_id, round_number, drone_id)
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_tournament ON round_summaries (tournament_id);
+CREATE INDEX IF NOT EXISTS idx_summaries_team ON round_summaries (team_id);
+CREATE INDEX IF NOT EXISTS idx_summaries_drone ON round_summaries (drone_id);
+"""
+
+# A re-analyzed round replaces its row but keeps the first recorded_at, so
+# analyzing an old round again does not move it to the end of trend()
+_KEY = ('match_id', 'round_number', 'drone_id')
+_UPSERT = (
+    f'INSERT INTO round_summaries ({", ".join(_COLUMNS)}) VALUES ({", ".join("?" for _ in _COLUMNS)}) '
+    f'ON CONFLICT ({", ".join(_KEY)}) DO UPDATE SET ' +
+    ', '.join(f'{column} = excluded.{column}' for column in _COLUMNS if column not in _KEY + ('recorded_at',))
+)
+
+# Aggregate columns shared by every summary query; pooled variance is
+# E[x^2] - E[x]^2 over all samples of the selected rounds
+_AGGREGATES = ', '.join(
+    ['COUNT(DISTINCT match_id || \':\' || round_number) AS rounds',
+     'COUNT(DISTINCT drone_id) AS drones',
+     'COUNT(*) AS drone_rounds',
+     'SUM(samples) AS samples',
+     'AVG(stability_score) AS mean_stability',
+     'MIN(stability_score) AS min_stability',
+     'MAX(stability_score) AS max_stability',
+     'SUM(bonus_points) AS bonus_points'] +
+    [f'SUM(sumsq_{axis}) / SUM(samples) - (SUM(sum_{axis}) / SUM(samples)) * (SUM(sum_{axis}) / SUM(samples)) '
+     f'AS variance_{axis}' for axis in AXES] +
+    [f'1000.0 * SUM(spikes_{axis}) / SUM(samples) AS spike_rate_{axis}' for axis in POSITION_AXES] +
+    [f'SUM(jerk_{axis} * (samples - 3)) / SUM(samples - 3) AS jerk_{axis}' for axis in POSITION_AXES]
+)
+
+# Filters accepted by aggregate() and trend(), mapped to their columns
+FILTERS = {'tournamentId': 'tournament_id', 'matchId': 'match_id', 'teamId': 'team_id', 'droneId': 'drone_id'}
+
+
+def round_summary(result):
+    """Sufficient statistics of one analyzed drone round (None without enough data)"""
+    moments = result.get('moments')
+    if moments is None:
+        return None
+
+    n = result['data_points']
+    summary = {'samples': n}
+    for axis in AXES:
+        mean = moments['mean'][axis]
+        variance = result['variance_data'][f'{axis}_variance']
+        summary[f'sum_{axis}'] = n * mean
+        summary[f'sumsq_{axis}'] = n * (variance + mean * mean)
+    for axis in POSITION_AXES:
+        summary[f'spikes_{axis}'] = result['spike_counts'][axis]
+        summary[f'jerk_{axis}'] = moments['jerk'][axis]
+    summary['stability_score'] = result['stability_score']
+    summary['classification'] = result['classification']
+    summary['bonus_points'] = calculate_bonus_points(result['stability_score'])
+    return summary
+
+
+def _rounded(row):
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in row.items()}
+
+
+class SummaryStore:
+    """Thread-safe SQLite store of round summaries"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connection = None
+        with self.lock:
+            self._db()
+
+    def _db(self):
+        """This process's connection; a preloaded app must not share one across fork"""
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            with self.connection:
+                # WAL lets several worker processes read while one writes
+                self.connection.execute('PRAGMA journal_mode=WAL')
+                self.connection.executescript(_SCHEMA)
+            self.pid = os.getpid()
+        return self.connection
+
+    def record(self, result, match_id, round_number, team_id=None, tournament_id=None):
+        """Store (or replace) a drone's round; returns False when there is nothing to store"""
+        summary = round_summary(result)
+        if summary is None or match_id is None or round_number is None:
+            return False
+
+        summary.update({
+            'tournament_id': None if tournament_id is None else str(tournament_id),
+            'match_id': str(match_id),
+            'round_number': round_number,
+            'team_id': None if team_id is None else str(team_id),
+            'drone_id': str(result['drone_id']),
+            'scoring_version': SCORING_VERSION,
+            'recorded_at': time.time()
+        })
+        with self.lock, self._db() as db:
+            db.execute(_UPSERT, [summary[column] for column in _COLUMNS])
+        return True
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for name, column in FILTERS.items():
+            if filters.get(name) is not None:
+                clauses.append(f'{column} = ?')
+                params.append(str(filters[name]))
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def aggregate(self, group_by=None, **filters):
+        """Aggregates over the matching rounds, optionally one row per group_by filter"""
+        where, params = self._where(filters)
+        if group_by is None:
+            query = f'SELECT {_AGGREGATES} FROM round_summaries{where}'
+        else:
+            column = FILTERS[group_by]
+            query = (f'SELECT {column} AS {group_by}, {_AGGREGATES} FROM round_summaries{where} '
+                     f'GROUP BY {column} ORDER BY mean_stability DESC')
+        with self.lock:
+            rows = self._db().execute(query, params).fetchall()
+        return [_rounded(dict(row)) for row in rows if row['drone_rounds']]
+
+    def trend(self, **filters):
+        """Per-round mean stability in order of first recording plus a least-squares slope per round"""
+        where, params = self._where(filters)
+        query = (f'SELECT match_id, round_number, COUNT(*) AS drones, AVG(stability_score) AS mean_stability, '
+                 f'SUM(bonus_points) AS bonus_points, MIN(recorded_at) AS recorded_at '
+                 f'FROM round_summaries{where} GROUP BY match_id, round_number '
+                 f'ORDER BY recorded_at, match_id, round_number')
+        with self.lock:
+            rounds = [_rounded(dict(row)) for row in self._db().execute(query, params)]
+
+        slope = 0.0
+        if len(rounds) > 1:
+            scores = [row['mean_stability'] for row in rounds]
+            mid = (len(scores) - 1) / 2
+            mean_score = sum(scores) / len(scores)
+            slope = (sum((i - mid) * (score - mean_score) for i, score in enumerate(scores)) /
+                     sum((i - mid) ** 2 for i in range(len(scores))))
+        return {'rounds': rounds, 'slope_per_round': round(slope, 4)}
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+                self.pid = None
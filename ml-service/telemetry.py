@@ -0,0 +1,139 @@
+# ml-service/telemetry.py
+"""
+Columnar telemetry of one drone
+The frame type every analysis module works on, the axis layout of its
+rows and its sample rate; nothing here depends on how a round is scored
+"""
+
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+import metrics
+
+# Axis order of TelemetryFrame.values rows
+AXES = ('x', 'y', 'z', 'pitch', 'roll', 'yaw')
+AXIS_INDEX = {axis: i for i, axis in enumerate(AXES)}
+
+POSITION_AXES = ('x', 'y', 'z')
+ATTITUDE_AXES = ('pitch', 'roll', 'yaw')
+
+# Used when a frame carries no usable timestamps (ESP32 telemetry rate)
+DEFAULT_SAMPLE_RATE = 20.0
+
+# Axes plus whichever of timestamp and battery the first point carries
+_record_getters = {extras: itemgetter(*AXES, *extras)
+                   for extras in ((), ('timestamp',), ('battery',), ('timestamp', 'battery'))}
+
+
+class AnalysisOptionError(ValueError):
+    """Raised for an unknown or out-of-range analysis option"""
+
+
+class TelemetryFrame:
+    """Columnar view of one drone's telemetry (one row per axis)
+
+    Values are float64, or float32 when given float32 (columnar payloads)
+    so they can stay a view on the request body
+    """
+
+    def __init__(self, values, drone_id='unknown', timestamps=None, battery=None):
+        values = np.asarray(values)
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(np.float64)
+        dtype = np.float32 if values.dtype == np.float32 else np.float64
+        self.values = np.ascontiguousarray(values, dtype=dtype).reshape(len(AXES), -1)
+        self.drone_id = drone_id
+        self.timestamps = timestamps
+        self.battery = battery
+
+    @classmethod
+    def from_logs(cls, logs, drone_id='unknown'):
+        """Convert a list of telemetry dicts in a single pass"""
+        if not logs:
+            return cls(np.empty((len(AXES), 0)), drone_id)
+
+        with metrics.stage('columns'):
+            first = logs[0] if isinstance(logs[0], dict) else {}
+            extras = [key for key in ('timestamp', 'battery') if key in first]
+            try:
+                # One flat pass over every field, reshaped to (n, 6 + extras) and transposed into per-field rows
+                fields = chain.from_iterable(map(_record_getters[tuple(extras)], logs))
+                width = len(AXES) + len(extras)
+                columns = np.fromiter(fields, dtype=np.float64, count=len(logs) * width).reshape(-1, width).T
+                values, columns = columns[:len(AXES)], dict(zip(extras, np.ascontiguousarray(columns[len(AXES):])))
+            except (KeyError, TypeError, ValueError):
+                # Absent keys or non-numeric values: coerce field by field (see _column)
+                values = np.array([_column(logs, axis) for axis in AXES])
+                columns = {key: _column(logs, key, invalid=np.nan) for key in extras}
+
+        return cls(values, drone_id, columns.get('timestamp'), columns.get('battery'))
+
+    @classmethod
+    def concat(cls, frames, drone_id='unknown'):
+        """Join several frames end to end into one series"""
+        if len(frames) == 1:
+            return frames[0]
+
+        def joined(name):
+            columns = [getattr(frame, name) for frame in frames]
+            if any(column is None for column in columns):
+                return None
+            return np.concatenate(columns)
+
+        values = np.concatenate([frame.values for frame in frames], axis=1)
+        return cls(values, drone_id, joined('timestamps'), joined('battery'))
+
+    def __len__(self):
+        return self.values.shape[1]
+
+    def axis(self, name):
+        """Contiguous values of a single axis"""
+        return self.values[AXIS_INDEX[name]]
+
+    def take(self, index):
+        """Frame of the samples selected by a slice or index array"""
+        def column(array):
+            return None if array is None else array[index]
+
+        return TelemetryFrame(self.values[:, index], self.drone_id,
+                              column(self.timestamps), column(self.battery))
+
+
+def _to_float(value, invalid):
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return invalid
+
+
+def _column(logs, key, invalid=np.inf):
+    """One field of every point as float64: NaN where missing, `invalid` where not a number
+
+    Clean columns convert in a single C-level call; only a column holding
+    non-numeric values falls back to per-value coercion
+    """
+    raw = [point.get(key) if isinstance(point, dict) else None for point in logs]
+    try:
+        return np.array(raw, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((_to_float(value, invalid) for value in raw), dtype=np.float64, count=len(raw))
+
+
+def sample_rate(frame):
+    """Sample rate in Hz from the median timestamp spacing (ms)"""
+    return timestamp_rate(frame.timestamps)
+
+
+def timestamp_rate(timestamps):
+    """Sample rate in Hz of a timestamp array (ms), DEFAULT_SAMPLE_RATE without one"""
+    if timestamps is not None and len(timestamps) > 1:
+        spacing = np.diff(timestamps)
+        # Evenly spaced timestamps (simulators) need no median
+        spacing = spacing[0] if (spacing == spacing[0]).all() else np.nanmedian(spacing)
+        if spacing > 0:
+            return 1000.0 / spacing
+    return DEFAULT_SAMPLE_RATE
@@ -0,0 +1,111 @@
+# ml-service/timeline.py
+"""
+Windowed stability timeline
+Rolling variance, spike counts, sign-change ratios and jerk of one drone's
+round over sliding windows. Each is a difference of prefix sums of a
+per-sample quantity, so the whole curve costs O(n) whatever the window
+length. Spikes are taken against the round's own moments, as in its
+spike_counts, so non-overlapping windows add up to the round totals.
+Oscillation uses the sign-change heuristic, since the spectral method has
+no prefix-sum form. Each window is scored with the round formula
+"""
+
+import math
+import os
+
+import numpy as np
+
+from scoring import MIN_DATA_POINTS, OSCILLATION_RATIO, SPIKE_THRESHOLD, jerk_smoothness, stability_scores
+from telemetry import ATTITUDE_AXES, AXES, AXIS_INDEX, POSITION_AXES, AnalysisOptionError, sample_rate
+
+# Window length and step in seconds (?timelineWindow= / ?timelineStride=)
+TIMELINE_WINDOW = float(os.environ.get('ML_TIMELINE_WINDOW', '5'))
+TIMELINE_STRIDE = float(os.environ.get('ML_TIMELINE_STRIDE', '1'))
+# Longest timeline returned; the stride is widened to fit
+MAX_TIMELINE_POINTS = 2000
+
+_POSITION_ROWS = [AXIS_INDEX[axis] for axis in POSITION_AXES]
+_ATTITUDE_ROWS = [AXIS_INDEX[axis] for axis in ATTITUDE_AXES]
+
+
+def validate_timeline_options(window=None, stride=None):
+    """Window and stride in seconds, defaulted; raises AnalysisOptionError"""
+    window = TIMELINE_WINDOW if window is None else window
+    stride = TIMELINE_STRIDE if stride is None else stride
+    if not window > 0 or not stride > 0:
+        raise AnalysisOptionError('timelineWindow and timelineStride must be positive (seconds)')
+    return window, stride
+
+
+def window_sums(per_sample, starts, width):
+    """Sum of per_sample[..., s:s + width] for every window start s, from one prefix sum"""
+    prefix = np.zeros(per_sample.shape[:-1] + (per_sample.shape[-1] + 1,))
+    np.cumsum(per_sample, axis=-1, out=prefix[..., 1:])
+    return prefix[..., starts + width] - prefix[..., starts]
+
+
+def _series(array, decimals=4):
+    return np.round(array, decimals).tolist()
+
+
+def stability_timeline(frame, window=None, stride=None):
+    """Per-window features and score of one frame (at least MIN_DATA_POINTS samples)
+
+    window and stride are in seconds (default ML_TIMELINE_WINDOW /
+    ML_TIMELINE_STRIDE), converted to samples at the frame's sample rate.
+    A window spanning fewer than MIN_DATA_POINTS samples at that rate is
+    widened to MIN_DATA_POINTS, so one slow drone does not fail a batch.
+    A round shorter than one window yields a single point
+    """
+    window, stride = validate_timeline_options(window, stride)
+    rate = sample_rate(frame)
+    n = len(frame)
+    requested = int(round(window * rate))
+    width = min(n, max(requested, MIN_DATA_POINTS))
+    step = max(1, int(round(stride * rate)))
+    if (n - width) // step + 1 > MAX_TIMELINE_POINTS:
+        step = math.ceil((n - width) / (MAX_TIMELINE_POINTS - 1))
+    starts = np.arange((n - width) // step + 1) * step
+
+    # Centring first keeps the sum-of-squares variance accurate
+    values = np.asarray(frame.values, dtype=np.float64)
+    centred = values - values.mean(axis=1, keepdims=True)
+    sums = window_sums(centred, starts, width)
+    variances = np.maximum(window_sums(centred * centred, starts, width) / width - (sums / width) ** 2, 0)
+
+    # Spikes: more than SPIKE_THRESHOLD round standard deviations from the round mean
+    position = centred[_POSITION_ROWS]
+    std = np.sqrt((position * position).mean(axis=1, keepdims=True))
+    spike = (np.abs(position) > SPIKE_THRESHOLD * std) & (std > 0)
+    spikes = np.rint(window_sums(spike.astype(np.float64), starts, width)).astype(np.int64)
+
+    # A window of width samples holds width - 2 sign changes of its differences
+    signs = np.sign(np.diff(values[_ATTITUDE_ROWS], axis=1))
+    changes = (np.diff(signs, axis=1) != 0).astype(np.float64)
+    ratios = window_sums(changes, starts, width - 2) / (width - 1)
+
+    jerk = window_sums(np.abs(np.diff(values[_POSITION_ROWS], n=3, axis=1)), starts, width - 3) / (width - 3)
+    smoothness = jerk_smoothness(jerk)
+
+    variance_data = {f'{axis}_variance': variances[i] for i, axis in enumerate(AXES)}
+    # The oscillation issues score_drone raises: attitude variance and oscillating axes
+    oscillation_issues = ((variance_data['pitch_variance'] > 0.3).astype(np.int64) +
+                          (variance_data['roll_variance'] > 0.3) +
+                          (ratios > OSCILLATION_RATIO).sum(axis=0))
+    scores = stability_scores(variance_data, dict(zip(POSITION_AXES, spikes)), oscillation_issues,
+                              dict(zip(POSITION_AXES, smoothness)))
+
+    return {
+        'window_seconds': round(width / rate, 3),
+        'window_widened': requested < MIN_DATA_POINTS,
+        'stride_seconds': round(step / rate, 3),
+        'sample_rate': round(rate, 3),
+        'oscillation_method': 'sign_change',
+        # Window centres, seconds from the first sample
+        't': _series((starts + width / 2) / rate, 3),
+        'score': _series(scores, 2),
+        'variance': {axis: _series(variances[i]) for i, axis in enumerate(AXES)},
+        'spikes': {axis: spikes[i].tolist() for i, axis in enumerate(POSITION_AXES)},
+        'sign_change_ratio': {axis: _series(ratios[i]) for i, axis in enumerate(ATTITUDE_AXES)},
+        'jerk': {axis: _series(jerk[i]) for i, axis in enumerate(POSITION_AXES)}
+    }
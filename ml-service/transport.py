@@ -0,0 +1,167 @@
+# ml-service/transport.py
+"""
+Compressed request and response bodies
+Requests sent with Content-Encoding gzip or deflate are decoded while the
+body is read: the compressed bytes are pulled from the socket in blocks
+and never held whole. JSON responses above a size threshold are
+compressed when the client's Accept-Encoding allows it
+"""
+
+import gzip
+import json
+import os
+import time
+import zlib
+
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+import metrics
+
+# Responses smaller than this are sent as is; 0 turns response compression off
+COMPRESS_MIN_BYTES = int(os.environ.get('ML_COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.environ.get('ML_COMPRESS_LEVEL', '5'))
+# Cap on a decoded request body, so a small compressed upload cannot expand without bound
+MAX_DECODED_MB = float(os.environ.get('ML_MAX_DECODED_MB', '512'))
+
+# zlib window bits: 16 + MAX_WBITS reads a gzip wrapper, MAX_WBITS a zlib (HTTP deflate) one
+REQUEST_ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'x-gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+RESPONSE_ENCODINGS = ('gzip', 'deflate')
+COMPRESSIBLE_TYPES = {'application/json', 'text/plain'}
+
+# Compressed size of a decoded request, kept in the WSGI environ
+WIRE_LENGTH = 'ml.wire_length'
+
+READ_BLOCK = 1 << 16
+
+
+class DecodingStream:
+    """File-like view of a compressed WSGI input that yields the decoded body"""
+
+    def __init__(self, raw, encoding, wire_length=None, max_bytes=None):
+        self.raw = raw
+        self.encoding = encoding
+        # Never read past the declared length: the server may keep the socket open
+        self.remaining = wire_length
+        self.max_bytes = max_bytes
+        self.decoder = zlib.decompressobj(REQUEST_ENCODINGS[encoding])
+        self.pending = b''
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.seconds = 0.0
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def _next_block(self):
+        """Decode the next block of input; b'' once the body is exhausted"""
+        while not self.finished:
+            size = READ_BLOCK if self.remaining is None else min(READ_BLOCK, self.remaining)
+            raw = self.raw.read(size) if size else b''
+            self.wire_bytes += len(raw)
+            if self.remaining is not None:
+                self.remaining -= len(raw)
+
+            started = time.perf_counter()
+            try:
+                block = self.decoder.decompress(raw) if raw else self.decoder.flush()
+            except zlib.error as exc:
+                raise BadRequest(f'Invalid {self.encoding} request body: {exc}')
+            self.seconds += time.perf_counter() - started
+
+            if not raw or self.decoder.eof:
+                self.finished = True
+                if not self.decoder.eof:
+                    raise BadRequest(f'Truncated {self.encoding} request body')
+                self._observe()
+
+            if block:
+                self.decoded_bytes += len(block)
+                if self.max_bytes is not None and self.decoded_bytes > self.max_bytes:
+                    raise RequestEntityTooLarge(f'Decoded request body exceeds {MAX_DECODED_MB:g} MB')
+                return block
+        return b''
+
+    def _observe(self):
+        metrics.STAGE_SECONDS.observe(self.seconds, stage='decompression')
+        if self.wire_bytes:
+            metrics.COMPRESSION_RATIO.observe(self.decoded_bytes / self.wire_bytes, direction='request')
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            blocks = [self.pending]
+            self.pending = b''
+            while True:
+                block = self._next_block()
+                if not block:
+                    return b''.join(blocks)
+                blocks.append(block)
+
+        while len(self.pending) < size:
+            block = self._next_block()
+            if not block:
+                break
+            self.pending += block
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+class DecodingMiddleware:
+    """WSGI middleware that swaps a compressed request body for a DecodingStream"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding and encoding != 'identity':
+            if encoding not in REQUEST_ENCODINGS:
+                body = json.dumps({
+                    'success': False,
+                    'error': f'Unsupported Content-Encoding: {encoding}'
+                }).encode('utf-8')
+                start_response('415 Unsupported Media Type', [
+                    ('Content-Type', 'application/json'),
+                    ('Content-Length', str(len(body))),
+                    ('Accept-Encoding', ', '.join(REQUEST_ENCODINGS))
+                ])
+                return [body]
+
+            content_length = environ.get('CONTENT_LENGTH')
+            wire_length = int(content_length) if content_length and content_length.isdigit() else None
+            max_bytes = int(MAX_DECODED_MB * 1024 * 1024) if MAX_DECODED_MB > 0 else None
+            environ['wsgi.input'] = DecodingStream(environ['wsgi.input'], encoding, wire_length, max_bytes)
+            environ[WIRE_LENGTH] = wire_length
+            # The decoded length is unknown until the stream ends; the stream terminates itself
+            environ.pop('CONTENT_LENGTH', None)
+            environ.pop('HTTP_CONTENT_ENCODING', None)
+            environ['wsgi.input_terminated'] = True
+        return self.wsgi_app(environ, start_response)
+
+
+def compress_response(response, accept_encodings):
+    """Compress a buffered response in place when it is large enough and the client accepts it"""
+    if (not COMPRESS_MIN_BYTES or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(RESPONSE_ENCODINGS)
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        metrics.RESPONSE_BYTES.observe(len(body), encoding='identity')
+        return response
+
+    with metrics.stage('compression'):
+        if encoding == 'gzip':
+            compressed = gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+        else:
+            compressed = zlib.compress(body, COMPRESS_LEVEL)
+    metrics.COMPRESSION_RATIO.observe(len(body) / len(compressed), direction='response')
+    metrics.RESPONSE_BYTES.observe(len(compressed), encoding=encoding)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,4 @@
+# ml-service/wsgi.py
+"""WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:app"""
+
+from app import app